@@ -41,11 +41,11 @@ def main():
             user_id_cookie = cookies.get('user_id')
             if user_id_cookie:
                 db_manager = DatabaseManager()
-                conn = db_manager.get_connection()
-                cursor = conn.cursor()
-                cursor.execute('SELECT id, username, role, full_name, class_name FROM users WHERE id = ?', (user_id_cookie,))
-                user = cursor.fetchone()
-                conn.close()
+                with db_manager.connection() as conn:
+                    user = conn.execute(
+                        'SELECT id, username, role, full_name, class_name FROM users WHERE id = ?',
+                        (user_id_cookie,)
+                    ).fetchone()
                 
                 if user:
                     st.session_state.logged_in = True
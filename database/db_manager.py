@@ -1,75 +1,261 @@
+import os
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
 from datetime import datetime
-import bcrypt
 
-from database.exame_system import ExamSystemDB
+from database.exame_system import SCHEMA_VERSION, ExamSystemDB
+
+
+DEFAULT_POOL_SIZE = int(os.environ.get("HOLLAND_DB_POOL_SIZE", "8"))
+# Batas tunggu koneksi bila semua `size` koneksi sedang dipakai
+POOL_TIMEOUT_SECONDS = float(os.environ.get("HOLLAND_DB_POOL_TIMEOUT", "30"))
+BUSY_TIMEOUT_SECONDS = 10
+
+# PRAGMA per koneksi: WAL agar pembaca tidak memblokir penulis,
+# synchronous=NORMAL (aman dengan WAL), cache 16 MB, mmap 128 MB.
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 134217728",
+    "PRAGMA temp_store = MEMORY",
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_SECONDS * 1000}",
+    "PRAGMA foreign_keys = ON",
+)
+
+
+class PooledConnection(sqlite3.Connection):
+    """Koneksi SQLite yang dikembalikan ke pool saat close() dipanggil"""
+
+    def close(self):
+        pool = getattr(self, "_pool", None)
+        if pool is None:
+            super().close()
+        else:
+            pool.release(self)
+
+    def close_physical(self):
+        super().close()
+
+
+class _PoolSlot:
+    """
+    Satu koneksi yang sedang dipinjam sebuah thread. Dikembalikan tepat sekali:
+    lewat release() atau, bila koneksi dibuang tanpa close(), saat objeknya di-GC.
+    """
+
+    def __init__(self, pool, owner):
+        self._pool = pool
+        self._owner = owner
+        self._held = True
+
+    def release(self):
+        if self._held:
+            self._held = False
+            self._pool._drop_hold(self._owner)
+
+    __del__ = release
+
+
+class ConnectionPool:
+    """
+    Pool koneksi thread-safe untuk satu file database.
+
+    Paling banyak `size` thread meminjam koneksi sekaligus; thread berikutnya
+    menunggu sampai ada yang selesai (maksimal `timeout` detik, lalu
+    OperationalError). Thread yang sudah memegang koneksi (mis. halaman yang
+    memanggil service) langsung mendapat koneksi tambahan tanpa menunggu slot,
+    sehingga tidak bisa menunggu dirinya sendiri. Koneksi idle disimpan
+    maksimal `size`; transaksi yang belum di-commit di-rollback sebelum
+    koneksi dipakai ulang.
+    """
+
+    def __init__(self, db_path, size=DEFAULT_POOL_SIZE, timeout=POOL_TIMEOUT_SECONDS):
+        self.db_path = db_path
+        self.size = max(1, int(size))
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.size)
+        # thread ident -> jumlah koneksi yang sedang dipinjam thread itu
+        self._holders = {}
+
+    def acquire(self):
+        owner = threading.get_ident()
+        with self._lock:
+            nested = self._holders.get(owner, 0) > 0
+            if nested:
+                self._holders[owner] += 1
+        if not nested:
+            if not self._slots.acquire(timeout=self.timeout):
+                raise sqlite3.OperationalError(
+                    f"Semua {self.size} slot koneksi database sedang dipakai "
+                    f"(menunggu {self.timeout:g} detik)"
+                )
+            with self._lock:
+                self._holders[owner] = self._holders.get(owner, 0) + 1
+        slot = _PoolSlot(self, owner)
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+        except BaseException:
+            slot.release()
+            raise
+        conn._checked_out = True
+        conn._slot = slot
+        return conn
+
+    def _drop_hold(self, owner):
+        # Slot thread dilepas saat koneksi terakhir yang dipinjamnya dikembalikan
+        with self._lock:
+            remaining = self._holders.get(owner, 0) - 1
+            if remaining > 0:
+                self._holders[owner] = remaining
+                return
+            self._holders.pop(owner, None)
+        self._slots.release()
+
+    def release(self, conn):
+        with self._lock:
+            if not getattr(conn, "_checked_out", False):
+                return
+            conn._checked_out = False
+            slot, conn._slot = conn._slot, None
+        # Slot dikembalikan setelah koneksi kembali ke antrian idle (atau ditutup)
+        try:
+            self._return(conn)
+        finally:
+            slot.release()
+
+    def _return(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = None
+        except sqlite3.Error:
+            conn.close_physical()
+            return
+
+        with self._lock:
+            if self._idle.qsize() < self.size:
+                self._idle.put(conn)
+                return
+        conn.close_physical()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close_physical()
+            except queue.Empty:
+                break
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=BUSY_TIMEOUT_SECONDS,
+            check_same_thread=False,
+            factory=PooledConnection,
+        )
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        conn._pool = self
+        return conn
 
 
 class DatabaseManager:
-    _schema_initialized = False
-    _defaults_seeded = False
+    _schema_checked = set()
+    _schema_lock = threading.Lock()
+    _pools = {}
+    _pools_lock = threading.Lock()
 
-    def __init__(self, db_path="exam_system.db"):
+    def __init__(self, db_path="exam_system.db", pool_size=None, pool_name="default"):
+        """
+        pool_name: pool terpisah dengan slot sendiri (mis. worker latar belakang)
+        agar tidak berebut slot dengan request halaman
+        """
         self.db_path = db_path
-        print("dbManager:", db_path)
+        self.pool_size = pool_size or DEFAULT_POOL_SIZE
+        self.pool_name = pool_name
         self._ensure_schema()
-        self._ensure_default_records()
+
+    def _get_pool(self):
+        # Pool per proses: koneksi SQLite tidak boleh dibagi lewat fork
+        key = (os.path.abspath(self.db_path), os.getpid(), self.pool_name)
+        with DatabaseManager._pools_lock:
+            pool = DatabaseManager._pools.get(key)
+            if pool is None:
+                pool = ConnectionPool(self.db_path, self.pool_size)
+                DatabaseManager._pools[key] = pool
+            return pool
 
     def get_connection(self):
-        conn = sqlite3.connect(self.db_path, timeout=10, check_same_thread=False)
-        conn.execute("PRAGMA foreign_keys = ON")
-        return conn
+        """Ambil koneksi dari pool; conn.close() mengembalikannya ke pool"""
+        return self._get_pool().acquire()
+
+    @contextmanager
+    def connection(self):
+        """
+        Context manager koneksi dari pool: commit bila sukses,
+        rollback bila terjadi error, lalu kembalikan ke pool.
+        """
+        conn = self.get_connection()
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except Exception:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def get_revision(self, table_name, conn=None):
+        """Revisi data tabel (dinaikkan trigger setiap perubahan); 0 bila belum tercatat"""
+        if conn is None:
+            with self.connection() as conn:
+                return self.get_revision(table_name, conn)
+        row = conn.execute(
+            "SELECT revision FROM data_revisions WHERE table_name = ?", (table_name,)
+        ).fetchone()
+        return row[0] if row else 0
 
     # ==============================
     #  INISIALISASI DATABASE
     # ==============================
     def init_database(self):
         self._ensure_schema()
-        self._ensure_default_records()
-    
-
-    # ==============================
-    #  INSERT DEFAULT ADMIN & STUDENT
-    # ==============================
-    def insert_default_data(self, cursor):
-        # ---------- ADMIN ----------
-        cursor.execute("SELECT COUNT(*) FROM users WHERE role = 'admin'")
-        admin_count = cursor.fetchone()[0]
-
-        if admin_count == 0:
-            admin_password = bcrypt.hashpw("admin123".encode('utf-8'), bcrypt.gensalt()).decode()
-
-            cursor.execute('''
-                INSERT OR IGNORE INTO users (username, password, role, full_name)
-                VALUES (?, ?, ?, ?)
-            ''', ("admin", admin_password, "admin", "Administrator"))
-
 
     # ==============================
     #  SCHEMA MANAGEMENT
     # ==============================
     def _ensure_schema(self):
-        if DatabaseManager._schema_initialized:
+        """
+        Pastikan skema database terbaru, sekali per file per proses.
+        Bila skema sudah terbaru biayanya satu pembacaan PRAGMA user_version dan
+        satu cek admin; migrasi yang tertunda dijalankan transaksional oleh
+        ExamSystemDB.migrate().
+        """
+        path = os.path.abspath(self.db_path)
+        if path in DatabaseManager._schema_checked:
             return
 
-        conn = self.get_connection()
-        exam_db = ExamSystemDB(conn)
-        exam_db.connect()
-        try:
-            exam_db.migrate()
-        finally:
-            exam_db.close()
-
-        DatabaseManager._schema_initialized = True
-
-    def _ensure_default_records(self):
-        if DatabaseManager._defaults_seeded:
-            return
-
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        self.insert_default_data(cursor)
-        conn.commit()
-        conn.close()
-
-        DatabaseManager._defaults_seeded = True
+        with DatabaseManager._schema_lock:
+            if path in DatabaseManager._schema_checked:
+                return
+            conn = self.get_connection()
+            try:
+                exam_db = ExamSystemDB(conn)
+                exam_db.connect()
+                if exam_db.schema_version() < SCHEMA_VERSION:
+                    exam_db.migrate()
+                # Di luar migrasi berversi: admin bawaan dibuat ulang bila semua admin terhapus
+                if exam_db.ensure_default_admin():
+                    conn.commit()
+            finally:
+                conn.close()
+            DatabaseManager._schema_checked.add(path)
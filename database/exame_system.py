@@ -7,6 +7,94 @@ import sys
 import bcrypt
 
 
+RIASEC_TYPES = ('Realistic', 'Investigative', 'Artistic', 'Social', 'Enterprising', 'Conventional')
+
+
+def _riasec_delta_sql(terms):
+    """
+    Klausa SET untuk student_riasec_totals.
+    terms: daftar (ekspresi tipe holland, ekspresi nilai jawaban, '+' atau '-')
+    """
+    assignments = []
+    for holland_type in RIASEC_TYPES:
+        col = holland_type.lower()
+        sum_expr = f"{col}_sum"
+        count_expr = f"{col}_count"
+        for type_expr, answer_expr, sign in terms:
+            sum_expr += f" {sign} (CASE WHEN {type_expr} = '{holland_type}' THEN {answer_expr} ELSE 0 END)"
+            count_expr += f" {sign} (CASE WHEN {type_expr} = '{holland_type}' THEN 1 ELSE 0 END)"
+        assignments.append(f"{col}_sum = {sum_expr}")
+        assignments.append(f"{col}_count = {count_expr}")
+    return ",\n                        ".join(assignments)
+
+
+# Kolom hasil ter-normalisasi di test_results
+RESULT_SCORE_COLUMNS = tuple(f"{t.lower()}_score" for t in RIASEC_TYPES)
+RESULT_TOP_TYPE_COLUMNS = ('top_type_1', 'top_type_2', 'top_type_3')
+
+
+def upgrade_legacy_results(cursor):
+    """
+    Isi kolom skor dan result_rankings untuk baris test_results lama yang
+    hanya menyimpan JSON (holland_scores, top_3_types, anp_results).
+    Mendukung format anp_results bertingkat ({'anp_results': {...}}) maupun datar.
+
+    Returns:
+        Jumlah baris yang di-upgrade
+    """
+    cursor.execute("SELECT COUNT(*) FROM test_results WHERE realistic_score IS NULL")
+    pending = cursor.fetchone()[0]
+    if not pending:
+        return 0
+
+    anp_json = "CASE WHEN json_valid(tr.anp_results) THEN tr.anp_results ELSE '{}' END"
+    cursor.execute("""
+        DELETE FROM result_rankings
+        WHERE student_id IN (SELECT student_id FROM test_results WHERE realistic_score IS NULL)
+    """)
+    cursor.execute(f"""
+        INSERT INTO result_rankings (student_id, rank, major_id, major_name, anp_score)
+        SELECT tr.student_id, CAST(r.key AS INTEGER) + 1, m.id,
+               json_extract(r.value, '$[0]'),
+               COALESCE(json_extract(r.value, '$[1].anp_score'), 0)
+        FROM test_results tr
+        JOIN json_each(
+            {anp_json},
+            CASE WHEN json_type({anp_json}, '$.anp_results') = 'object'
+                 THEN '$.anp_results.ranked_majors' ELSE '$.ranked_majors' END
+        ) r
+        LEFT JOIN majors m ON m.Major = json_extract(r.value, '$[0]')
+        WHERE tr.realistic_score IS NULL
+          AND json_type(r.value) = 'array'
+    """)
+
+    scores_json = "CASE WHEN json_valid(holland_scores) THEN holland_scores ELSE '{}' END"
+    types_json = "CASE WHEN json_valid(top_3_types) THEN top_3_types ELSE '[]' END"
+    score_sets = ",\n            ".join(
+        f"{col} = COALESCE(json_extract({scores_json}, '$.{t}'), 0)"
+        for t, col in zip(RIASEC_TYPES, RESULT_SCORE_COLUMNS)
+    )
+    type_sets = ",\n            ".join(
+        f"{col} = json_extract({types_json}, '$[{i}]')"
+        for i, col in enumerate(RESULT_TOP_TYPE_COLUMNS)
+    )
+    letters = " || ".join(
+        f"COALESCE(substr(json_extract({types_json}, '$[{i}]'), 1, 1), '')"
+        for i in range(len(RESULT_TOP_TYPE_COLUMNS))
+    )
+    cursor.execute(f"""
+        UPDATE test_results SET
+            {score_sets},
+            {type_sets},
+            holland_code = COALESCE(
+                CASE WHEN json_valid(anp_results) THEN json_extract(anp_results, '$.holland_code') END,
+                {letters}
+            )
+        WHERE realistic_score IS NULL
+    """)
+    return pending
+
+
 # --- Konstanta Data Seed ---
 holland_questions = [
     ("Saya suka bekerja dengan alat dan mesin", "Realistic"),
@@ -50,26 +138,75 @@ class ExamSystemDB:
         if self.conn:
             self.conn.close()
 
-    def migrate(self):
-        """Create all database tables"""
-        print("Running migrations...")
-        # Users + legacy-compatible tables
-        
-        # Disable foreign keys temporarily to avoid constraint issues
-        self.conn.execute("PRAGMA foreign_keys = OFF")
-
-        self.cursor.execute("DROP TABLE IF EXISTS exams")
-        self.cursor.execute("DROP TABLE IF EXISTS exam_questions")
-        self.cursor.execute("DROP TABLE IF EXISTS exam_attempts")
-        self.cursor.execute("DROP TABLE IF EXISTS exam_answer_choices")
-        self.cursor.execute("DROP TABLE IF EXISTS exam_student_answers")
-        self.cursor.execute("DROP TABLE IF EXISTS student_profiles")
-       
-    
-        # Re-enable foreign keys
-        self.conn.execute("PRAGMA foreign_keys = ON")
+    # Migrasi berversi: (versi, deskripsi, method). Versi yang sudah dirilis tidak
+    # boleh diubah lagi; perubahan skema berikutnya ditambahkan sebagai versi baru.
+    # Setiap langkah idempotent sehingga database lama (user_version 0) dengan
+    # skema sebagian tetap dapat dimigrasikan dari awal.
+    MIGRATIONS = (
+        (1, "Tabel inti: users, questions, majors, student_answers, test_results, test_sessions",
+         '_migration_core_tables'),
+        (2, "Kolom hasil ter-normalisasi, result_rankings dan model_versions", '_ensure_result_tables'),
+        (3, "Revisi data per tabel dan antrian job laporan", '_migration_revisions_and_jobs'),
+        (4, "Agregat RIASEC per siswa (student_riasec_totals)", '_ensure_riasec_totals'),
+        (5, "Cache baris laporan admin (export_row_cache)", '_ensure_export_row_cache'),
+        (6, "Ringkasan kelas, jurusan per kelas dan harian", '_ensure_result_summaries'),
+        (7, "Indeks untuk query aplikasi", '_migration_indexes'),
+        (8, "Akun admin bawaan", '_migration_default_admin'),
+        (9, "Pemilik (host, pid) dan heartbeat job laporan", '_migration_report_job_owner'),
+        (10, "Buang cache baris laporan saat hasil tes di-update", '_migration_export_cache_result_update'),
+        (11, "Normalisasi hasil lama yang ditulis setelah migrasi 2", '_migration_upgrade_legacy_results'),
+    )
 
+    def schema_version(self) -> int:
+        """Versi skema database (PRAGMA user_version)"""
+        return self.conn.execute("PRAGMA user_version").fetchone()[0]
 
+    def migrate(self) -> List[int]:
+        """
+        Terapkan migrasi yang belum tercatat, dalam satu transaksi.
+
+        BEGIN IMMEDIATE mengambil kunci tulis sebelum versi dibaca ulang, sehingga
+        bila beberapa proses start bersamaan hanya satu yang menjalankan migrasi;
+        proses lain menunggu lalu mendapati skema sudah terbaru. Bila satu langkah
+        gagal seluruh migrasi di-rollback dan user_version tidak berubah.
+
+        Returns:
+            Daftar versi yang diterapkan (kosong bila skema sudah terbaru)
+        """
+        isolation_level = self.conn.isolation_level
+        self.conn.isolation_level = None  # transaksi dikendalikan manual
+        applied = []
+        try:
+            self.cursor.execute("BEGIN IMMEDIATE")
+            try:
+                current = self.schema_version()
+                if current < SCHEMA_VERSION:
+                    self.cursor.execute("""
+                        CREATE TABLE IF NOT EXISTS schema_version (
+                            version INTEGER PRIMARY KEY,
+                            description TEXT NOT NULL,
+                            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                        )
+                    """)
+                    for version, description, step in self.MIGRATIONS:
+                        if version <= current:
+                            continue
+                        getattr(self, step)()
+                        self.cursor.execute(
+                            "INSERT OR REPLACE INTO schema_version (version, description) VALUES (?, ?)",
+                            (version, description)
+                        )
+                        applied.append(version)
+                    self.cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                self.cursor.execute("COMMIT")
+            except Exception:
+                self.cursor.execute("ROLLBACK")
+                raise
+        finally:
+            self.conn.isolation_level = isolation_level
+        return applied
+
+    def _migration_core_tables(self):
         self.cursor.execute("""
             CREATE TABLE IF NOT EXISTS users (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -83,8 +220,6 @@ class ExamSystemDB:
             )
         """)
 
-
-
         self.cursor.execute("""
             CREATE TABLE IF NOT EXISTS questions (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -141,15 +276,115 @@ class ExamSystemDB:
         """)
         self._ensure_column('test_results', 'total_items', 'INTEGER')
 
-        # Indexes
+        # Sesi tes yang sedang berjalan (urutan soal, kursor, waktu mulai)
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS test_sessions (
+                student_id INTEGER PRIMARY KEY,
+                question_order TEXT NOT NULL,
+                current_index INTEGER NOT NULL DEFAULT 0,
+                started_at REAL NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (student_id) REFERENCES users(id) ON DELETE CASCADE
+            )
+        """)
+
+    def _migration_revisions_and_jobs(self):
+        # Revisi data per tabel (dinaikkan oleh trigger) untuk invalidasi cache
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS data_revisions (
+                table_name TEXT PRIMARY KEY,
+                revision INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._ensure_revision_triggers('questions')
+        # Laporan admin di-cache per revisi data yang dimuatnya
+        for table_name in ('test_results', 'student_answers', 'users', 'majors'):
+            self._ensure_revision_triggers(table_name)
+
+        # Antrian job laporan latar belakang (status bertahan lintas restart)
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS report_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                cache_key TEXT NOT NULL,
+                sheets TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued'
+                    CHECK(status IN ('queued', 'running', 'done', 'failed', 'expired')),
+                file_path TEXT,
+                error TEXT,
+                requested_by INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                started_at TIMESTAMP,
+                finished_at TIMESTAMP,
+                FOREIGN KEY (requested_by) REFERENCES users(id) ON DELETE SET NULL
+            )
+        """)
+        self.cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_report_jobs_key ON report_jobs(cache_key, status)"
+        )
+
+    def _migration_indexes(self):
         self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_username ON users(username)")
-        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_role ON users(role)")
+        # (role, created_at) menggantikan idx_users_role: daftar siswa terbaru tanpa sort
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_role_created ON users(role, created_at)")
+        self.cursor.execute("DROP INDEX IF EXISTS idx_users_role")
 
         self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_questions_type ON questions(holland_type)")
         self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_student_answers_student ON student_answers(student_id)")
+        # Hapus/ubah soal (cascade & trigger agregat) mencari jawaban per soal
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_student_answers_question ON student_answers(question_id, student_id)")
+        # Antrian laporan per status & cascade SET NULL saat admin dihapus
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_report_jobs_status ON report_jobs(status)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_report_jobs_requested_by ON report_jobs(requested_by)")
 
-        self.conn.commit()
-        print("[OK] Migrations completed successfully!")
+        # Filter & urutan halaman monitoring hasil tes
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_class ON users(class_name)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_test_results_completed ON test_results(completed_at)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_test_results_major ON test_results(recommended_major, completed_at)")
+        self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_test_results_top_type ON test_results(top_type_1)")
+
+    def _migration_default_admin(self):
+        self.ensure_default_admin()
+
+    def ensure_default_admin(self) -> bool:
+        """
+        Buat akun admin bawaan bila belum ada admin sama sekali. Dipanggil juga
+        setiap start (di luar migrasi berversi) agar database yang kehilangan
+        semua admin tetap bisa dipakai login. Tidak melakukan commit.
+
+        Returns:
+            True bila akun admin dibuat
+        """
+        self.cursor.execute("SELECT COUNT(*) FROM users WHERE role = 'admin'")
+        if self.cursor.fetchone()[0] == 0:
+            admin_password = bcrypt.hashpw("admin123".encode('utf-8'), bcrypt.gensalt()).decode()
+            self.cursor.execute(
+                "INSERT OR IGNORE INTO users (username, password, role, full_name) VALUES (?, ?, ?, ?)",
+                ("admin", admin_password, "admin", "Administrator")
+            )
+            return self.cursor.rowcount > 0
+        return False
+
+    def _migration_report_job_owner(self):
+        """Proses pemilik job laporan yang berjalan, agar hanya job yatim yang diantrikan ulang"""
+        self._ensure_column('report_jobs', 'owner_host', 'TEXT')
+        self._ensure_column('report_jobs', 'owner_pid', 'INTEGER')
+        self._ensure_column('report_jobs', 'heartbeat_at', 'TIMESTAMP')
+
+    def _migration_export_cache_result_update(self):
+        # Upsert hasil (hitung ulang) meng-update baris di tempat; completed_at
+        # beresolusi detik tidak cukup untuk mendeteksi perubahan di detik yang sama
+        self.cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_export_cache_result_update
+            AFTER UPDATE ON test_results
+            BEGIN
+                DELETE FROM export_row_cache WHERE student_id IN (OLD.student_id, NEW.student_id);
+            END
+        """)
+
+    def _migration_upgrade_legacy_results(self):
+        # Baris lama yang masuk setelah migrasi 2 (mis. salinan database lama);
+        # semua penulis kini mengisi kolom ter-normalisasi langsung
+        upgrade_legacy_results(self.cursor)
 
     def seed_data(self):
         """Seed database with sample data"""
@@ -284,6 +519,8 @@ class ExamSystemDB:
                 )
             )
 
+        # Baris contoh hanya berisi kolom JSON; isi kolom skor & peringkatnya
+        upgrade_legacy_results(self.cursor)
         self.conn.commit()
         print("[OK] Data seeded successfully!")
 
@@ -320,17 +557,503 @@ class ExamSystemDB:
         except sqlite3.Error as exc:
             raise RuntimeError(f"Failed ensuring column {table_name}.{column_name}: {exc}")
 
+    def _ensure_result_tables(self):
+        """
+        Penyimpanan hasil ter-normalisasi: kolom skor/tipe di test_results dan
+        peringkat jurusan per siswa di result_rankings (bisa di-query tanpa JSON).
+        """
+        for col in RESULT_SCORE_COLUMNS:
+            self._ensure_column('test_results', col, 'REAL')
+        for col in RESULT_TOP_TYPE_COLUMNS:
+            self._ensure_column('test_results', col, 'TEXT')
+        self._ensure_column('test_results', 'holland_code', 'TEXT')
+
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS result_rankings (
+                student_id INTEGER NOT NULL,
+                rank INTEGER NOT NULL,
+                major_id INTEGER,
+                major_name TEXT NOT NULL,
+                anp_score REAL NOT NULL,
+                PRIMARY KEY (student_id, rank),
+                FOREIGN KEY (student_id) REFERENCES users(id) ON DELETE CASCADE,
+                FOREIGN KEY (major_id) REFERENCES majors(id) ON DELETE SET NULL
+            ) WITHOUT ROWID
+        """)
+        self.cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_result_rankings_major ON result_rankings(major_id, rank)"
+        )
+        self.cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_result_rankings_rank ON result_rankings(rank, major_id)"
+        )
+        # Baris lama (hanya JSON) dikenali dari kolom skor yang masih NULL
+        self.cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_test_results_legacy ON test_results(student_id) "
+            "WHERE realistic_score IS NULL"
+        )
+        self.cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS trg_test_results_delete_rankings
+            AFTER DELETE ON test_results
+            BEGIN
+                DELETE FROM result_rankings WHERE student_id = OLD.student_id;
+            END
+        """)
+
+        # Snapshot data jurusan + matriks inner dependency yang dirujuk payload hasil ringkas
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS model_versions (
+                fingerprint TEXT PRIMARY KEY,
+                majors TEXT NOT NULL,
+                inner_dependency_matrix TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        upgrade_legacy_results(self.cursor)
+
+    def _ensure_riasec_totals(self):
+        """
+        Tabel agregat per siswa (jumlah & banyak jawaban per tipe RIASEC),
+        dijaga tetap sinkron oleh trigger pada student_answers dan questions.
+        """
+        self.cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'student_riasec_totals'"
+        )
+        created = self.cursor.fetchone() is None
+
+        columns = ",\n".join(
+            f"                {t.lower()}_sum INTEGER NOT NULL DEFAULT 0,\n"
+            f"                {t.lower()}_count INTEGER NOT NULL DEFAULT 0"
+            for t in RIASEC_TYPES
+        )
+        self.cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS student_riasec_totals (
+                student_id INTEGER PRIMARY KEY,
+{columns},
+                FOREIGN KEY (student_id) REFERENCES users(id) ON DELETE CASCADE
+            )
+        """)
+
+        new_type = "(SELECT holland_type FROM questions WHERE id = NEW.question_id)"
+        old_type = "(SELECT holland_type FROM questions WHERE id = OLD.question_id)"
+        question_answer = (
+            "(SELECT answer FROM student_answers sa "
+            "WHERE sa.student_id = student_riasec_totals.student_id AND sa.question_id = {ref}.id)"
+        )
+        # Bukan INSERT OR IGNORE: conflict clause statement luar (mis. upsert) menimpa klausa di trigger
+        ensure_row = (
+            "INSERT INTO student_riasec_totals (student_id) SELECT NEW.student_id "
+            "WHERE NOT EXISTS (SELECT 1 FROM student_riasec_totals WHERE student_id = NEW.student_id);"
+        )
+        triggers = {
+            'trg_riasec_answer_insert': f"""
+                AFTER INSERT ON student_answers
+                BEGIN
+                    {ensure_row}
+                    UPDATE student_riasec_totals SET
+                        {_riasec_delta_sql([(new_type, 'NEW.answer', '+')])}
+                    WHERE student_id = NEW.student_id;
+                END
+            """,
+            'trg_riasec_answer_delete': f"""
+                AFTER DELETE ON student_answers
+                BEGIN
+                    UPDATE student_riasec_totals SET
+                        {_riasec_delta_sql([(old_type, 'OLD.answer', '-')])}
+                    WHERE student_id = OLD.student_id;
+                END
+            """,
+            'trg_riasec_answer_update': f"""
+                AFTER UPDATE OF student_id, question_id, answer ON student_answers
+                BEGIN
+                    {ensure_row}
+                    UPDATE student_riasec_totals SET
+                        {_riasec_delta_sql([(old_type, 'OLD.answer', '-')])}
+                    WHERE student_id = OLD.student_id;
+                    UPDATE student_riasec_totals SET
+                        {_riasec_delta_sql([(new_type, 'NEW.answer', '+')])}
+                    WHERE student_id = NEW.student_id;
+                END
+            """,
+            'trg_riasec_question_type': f"""
+                AFTER UPDATE OF holland_type ON questions
+                WHEN OLD.holland_type IS NOT NEW.holland_type
+                BEGIN
+                    UPDATE student_riasec_totals SET
+                        {_riasec_delta_sql([
+                            ('OLD.holland_type', question_answer.format(ref='NEW'), '-'),
+                            ('NEW.holland_type', question_answer.format(ref='NEW'), '+'),
+                        ])}
+                    WHERE student_id IN (SELECT student_id FROM student_answers WHERE question_id = NEW.id);
+                END
+            """,
+            # BEFORE: saat cascade menghapus jawaban, soalnya sudah tidak ada lagi
+            'trg_riasec_question_delete': f"""
+                BEFORE DELETE ON questions
+                BEGIN
+                    UPDATE student_riasec_totals SET
+                        {_riasec_delta_sql([('OLD.holland_type', question_answer.format(ref='OLD'), '-')])}
+                    WHERE student_id IN (SELECT student_id FROM student_answers WHERE question_id = OLD.id);
+                END
+            """,
+        }
+        for name, body in triggers.items():
+            self.cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+
+        if created:
+            self.rebuild_riasec_totals()
+
+    def _ensure_export_row_cache(self):
+        """
+        Baris laporan admin yang sudah dihitung per siswa (dipakai ulang oleh
+        ExportManager). Baris dibuang oleh trigger saat jawaban, identitas siswa
+        atau hasil tesnya berubah; perubahan jurusan/soal dideteksi lewat context_key.
+        """
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS export_row_cache (
+                student_id INTEGER PRIMARY KEY,
+                completed_at TIMESTAMP,
+                context_key TEXT NOT NULL,
+                holland_row TEXT NOT NULL,
+                answer_row TEXT NOT NULL,
+                ranking_rows TEXT NOT NULL,
+                FOREIGN KEY (student_id) REFERENCES users(id) ON DELETE CASCADE
+            )
+        """)
+        drop_row = "DELETE FROM export_row_cache WHERE student_id = {ref}.student_id;"
+        triggers = {
+            'trg_export_cache_answer_insert': f"AFTER INSERT ON student_answers BEGIN {drop_row.format(ref='NEW')} END",
+            'trg_export_cache_answer_delete': f"AFTER DELETE ON student_answers BEGIN {drop_row.format(ref='OLD')} END",
+            'trg_export_cache_answer_update': f"""
+                AFTER UPDATE OF student_id, question_id, answer ON student_answers
+                BEGIN {drop_row.format(ref='OLD')} {drop_row.format(ref='NEW')} END
+            """,
+            'trg_export_cache_result_delete': f"AFTER DELETE ON test_results BEGIN {drop_row.format(ref='OLD')} END",
+            'trg_export_cache_user_update': """
+                AFTER UPDATE OF full_name, class_name ON users
+                BEGIN DELETE FROM export_row_cache WHERE student_id = NEW.id; END
+            """,
+        }
+        for name, body in triggers.items():
+            self.cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+
+    def _ensure_result_summaries(self):
+        """
+        Agregat hasil tes per kelas, per (kelas, jurusan rekomendasi) dan per hari,
+        dijaga tetap sinkron oleh trigger pada test_results dan users sehingga
+        analitik kelas/angkatan tidak perlu membaca baris hasil satu per satu.
+        Siswa tanpa kelas dicatat dengan class_name '' .
+        """
+        self.cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'class_summary'"
+        )
+        created = self.cursor.fetchone() is None
+
+        sum_columns = ",\n".join(
+            f"                {col}_sum REAL NOT NULL DEFAULT 0" for col in RESULT_SCORE_COLUMNS
+        )
+        self.cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS class_summary (
+                class_name TEXT PRIMARY KEY,
+                student_count INTEGER NOT NULL DEFAULT 0,
+                completed_count INTEGER NOT NULL DEFAULT 0,
+{sum_columns}
+            )
+        """)
+        self.cursor.execute("""
+            CREATE TABLE IF NOT EXISTS class_major_counts (
+                class_name TEXT NOT NULL,
+                recommended_major TEXT NOT NULL,
+                student_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (class_name, recommended_major)
+            ) WITHOUT ROWID
+        """)
+        self.cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS daily_summary (
+                day TEXT PRIMARY KEY,
+                completed_count INTEGER NOT NULL DEFAULT 0,
+{sum_columns}
+            )
+        """)
+
+        def user_class(ref):
+            return f"(SELECT COALESCE(class_name, '') FROM users WHERE id = {ref}.student_id)"
+
+        def ensure_row(table, key_columns, key_exprs):
+            # Bukan INSERT OR IGNORE: conflict clause statement luar (mis. upsert) menimpa klausa di trigger
+            aliases = ', '.join(f"{expr} AS k{i}" for i, expr in enumerate(key_exprs))
+            keys = ', '.join(f"k{i}" for i in range(len(key_exprs)))
+            not_null = ' AND '.join(f"k{i} IS NOT NULL" for i in range(len(key_exprs)))
+            match = ' AND '.join(f"t.{col} = k{i}" for i, col in enumerate(key_columns))
+            return (
+                f"INSERT INTO {table} ({', '.join(key_columns)}) SELECT {keys} FROM (SELECT {aliases}) "
+                f"WHERE {not_null} AND NOT EXISTS (SELECT 1 FROM {table} t WHERE {match});"
+            )
+
+        def add_result(ref, class_expr):
+            """Tambah (NEW) atau kurangi (OLD) kontribusi satu baris hasil pada agregat kelas"""
+            sign = '+' if ref == 'NEW' else '-'
+            score_sets = ", ".join(
+                f"{col}_sum = {col}_sum {sign} COALESCE({ref}.{col}, 0)" for col in RESULT_SCORE_COLUMNS
+            )
+            major = f"COALESCE({ref}.recommended_major, '')"
+            return f"""
+                    {ensure_row('class_summary', ['class_name'], [class_expr]) if ref == 'NEW' else ''}
+                    UPDATE class_summary SET completed_count = completed_count {sign} 1, {score_sets}
+                    WHERE class_name = {class_expr};
+                    {ensure_row('class_major_counts', ['class_name', 'recommended_major'], [class_expr, major]) if ref == 'NEW' else ''}
+                    UPDATE class_major_counts SET student_count = student_count {sign} 1
+                    WHERE class_name = {class_expr} AND recommended_major = {major};
+            """
+
+        def add_day(ref):
+            sign = '+' if ref == 'NEW' else '-'
+            score_sets = ", ".join(
+                f"{col}_sum = {col}_sum {sign} COALESCE({ref}.{col}, 0)" for col in RESULT_SCORE_COLUMNS
+            )
+            day = f"date({ref}.completed_at)"
+            return f"""
+                    {ensure_row('daily_summary', ['day'], [day]) if ref == 'NEW' else ''}
+                    UPDATE daily_summary SET completed_count = completed_count {sign} 1, {score_sets}
+                    WHERE day = {day};
+            """
+
+        def add_student(ref):
+            sign = '+' if ref == 'NEW' else '-'
+            class_expr = f"COALESCE({ref}.class_name, '')"
+            return f"""
+                    {ensure_row('class_summary', ['class_name'], [class_expr]) if ref == 'NEW' else ''}
+                    UPDATE class_summary SET student_count = student_count {sign} 1
+                    WHERE class_name = {class_expr} AND {ref}.role = 'student';
+            """
+
+        def move_result(ref):
+            """Pindahkan hasil siswa keluar dari (OLD) / masuk ke (NEW) kelas baris users"""
+            result_row = f"(SELECT * FROM test_results WHERE student_id = {ref}.id)"
+            sign = '+' if ref == 'NEW' else '-'
+            class_expr = f"COALESCE({ref}.class_name, '')"
+            score_sets = ", ".join(
+                f"{col}_sum = {col}_sum {sign} tr.{col}" for col in RESULT_SCORE_COLUMNS
+            )
+            ensure_major = "" if ref == 'OLD' else f"""
+                        INSERT INTO class_major_counts (class_name, recommended_major)
+                        SELECT {class_expr}, COALESCE(tr.recommended_major, '') FROM {result_row} tr
+                        WHERE NOT EXISTS (
+                            SELECT 1 FROM class_major_counts m
+                            WHERE m.class_name = {class_expr} AND m.recommended_major = COALESCE(tr.recommended_major, '')
+                        );"""
+            return f"""
+                        UPDATE class_summary SET completed_count = completed_count {sign} 1, {score_sets}
+                        FROM (SELECT {', '.join(f'COALESCE({col}, 0) AS {col}' for col in RESULT_SCORE_COLUMNS)}
+                              FROM {result_row}) tr
+                        WHERE class_name = {class_expr};
+                        {ensure_major}
+                        UPDATE class_major_counts SET student_count = student_count {sign} 1
+                        WHERE class_name = {class_expr}
+                          AND recommended_major IN (SELECT COALESCE(recommended_major, '') FROM {result_row});
+            """
+
+        triggers = {
+            'trg_summary_result_insert': f"""
+                AFTER INSERT ON test_results
+                BEGIN
+                    {add_result('NEW', user_class('NEW'))}
+                    {add_day('NEW')}
+                END
+            """,
+            'trg_summary_result_update': f"""
+                AFTER UPDATE ON test_results
+                BEGIN
+                    {add_result('OLD', user_class('OLD'))}
+                    {add_result('NEW', user_class('NEW'))}
+                    {add_day('OLD')}
+                    {add_day('NEW')}
+                END
+            """,
+            # Saat users dihapus (cascade), kelasnya sudah tidak terbaca di sini;
+            # kontribusi kelas dikurangi oleh trg_summary_user_delete
+            'trg_summary_result_delete': f"""
+                AFTER DELETE ON test_results
+                BEGIN
+                    {add_result('OLD', user_class('OLD'))}
+                    {add_day('OLD')}
+                END
+            """,
+            'trg_summary_user_insert': f"""
+                AFTER INSERT ON users
+                BEGIN
+                    {add_student('NEW')}
+                END
+            """,
+            'trg_summary_user_update': f"""
+                AFTER UPDATE OF class_name, role ON users
+                WHEN OLD.class_name IS NOT NEW.class_name OR OLD.role IS NOT NEW.role
+                BEGIN
+                    {add_student('OLD')}
+                    {add_student('NEW')}
+                    {move_result('OLD')}
+                    {move_result('NEW')}
+                END
+            """,
+            'trg_summary_user_delete': f"""
+                BEFORE DELETE ON users
+                BEGIN
+                    {add_student('OLD')}
+                    {move_result('OLD')}
+                END
+            """,
+        }
+        for name, body in triggers.items():
+            self.cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+
+        if created:
+            self.rebuild_result_summaries()
+
+    def rebuild_result_summaries(self):
+        """Hitung ulang class_summary, class_major_counts dan daily_summary dari data mentah"""
+        score_columns = ", ".join(f"{col}_sum" for col in RESULT_SCORE_COLUMNS)
+        score_sums = ", ".join(f"SUM(COALESCE(tr.{col}, 0))" for col in RESULT_SCORE_COLUMNS)
+        for table in ('class_summary', 'class_major_counts', 'daily_summary'):
+            self.cursor.execute(f"DELETE FROM {table}")
+        self.cursor.execute(f"""
+            INSERT INTO class_summary (class_name, student_count, completed_count, {score_columns})
+            SELECT class_name, SUM(is_student), SUM(completed), {', '.join(f'SUM({col}_sum)' for col in RESULT_SCORE_COLUMNS)}
+            FROM (
+                SELECT COALESCE(u.class_name, '') AS class_name, 1 AS is_student, 0 AS completed, {', '.join(f'0 AS {col}_sum' for col in RESULT_SCORE_COLUMNS)}
+                FROM users u
+                WHERE u.role = 'student'
+                UNION ALL
+                SELECT COALESCE(u.class_name, ''), 0, COUNT(*), {score_sums}
+                FROM test_results tr
+                JOIN users u ON u.id = tr.student_id
+                GROUP BY COALESCE(u.class_name, '')
+            )
+            GROUP BY class_name
+        """)
+        self.cursor.execute("""
+            INSERT INTO class_major_counts (class_name, recommended_major, student_count)
+            SELECT COALESCE(u.class_name, ''), COALESCE(tr.recommended_major, ''), COUNT(*)
+            FROM test_results tr
+            JOIN users u ON u.id = tr.student_id
+            GROUP BY 1, 2
+        """)
+        self.cursor.execute(f"""
+            INSERT INTO daily_summary (day, completed_count, {score_columns})
+            SELECT date(tr.completed_at), COUNT(*), {score_sums}
+            FROM test_results tr
+            WHERE date(tr.completed_at) IS NOT NULL
+            GROUP BY 1
+        """)
+
+    def rebuild_riasec_totals(self):
+        """Hitung ulang seluruh student_riasec_totals dari student_answers (backfill/perbaikan)"""
+        select_columns = ",\n".join(
+            f"                    SUM(CASE WHEN q.holland_type = '{t}' THEN sa.answer ELSE 0 END),\n"
+            f"                    SUM(CASE WHEN q.holland_type = '{t}' THEN 1 ELSE 0 END)"
+            for t in RIASEC_TYPES
+        )
+        column_names = ", ".join(f"{t.lower()}_sum, {t.lower()}_count" for t in RIASEC_TYPES)
+        self.cursor.execute("DELETE FROM student_riasec_totals")
+        self.cursor.execute(f"""
+            INSERT INTO student_riasec_totals (student_id, {column_names})
+            SELECT sa.student_id,
+{select_columns}
+            FROM student_answers sa
+            JOIN questions q ON q.id = sa.question_id
+            GROUP BY sa.student_id
+        """)
+
+    def _ensure_revision_triggers(self, table_name: str):
+        """Naikkan data_revisions.revision setiap ada INSERT/UPDATE/DELETE pada tabel"""
+        try:
+            self.cursor.execute(
+                "INSERT OR IGNORE INTO data_revisions (table_name, revision) VALUES (?, 0)",
+                (table_name,)
+            )
+            for event in ('INSERT', 'UPDATE', 'DELETE'):
+                self.cursor.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS trg_{table_name}_rev_{event.lower()}
+                    AFTER {event} ON {table_name}
+                    BEGIN
+                        UPDATE data_revisions SET revision = revision + 1
+                        WHERE table_name = '{table_name}';
+                    END
+                """)
+        except sqlite3.Error as exc:
+            raise RuntimeError(f"Failed ensuring revision triggers on {table_name}: {exc}")
+
+
+# Versi skema terbaru; database dengan PRAGMA user_version lebih kecil perlu migrate()
+SCHEMA_VERSION = ExamSystemDB.MIGRATIONS[-1][0]
+
+
+def explain_queries(db_path: str, students: int = 5000, verbose: bool = False) -> int:
+    """
+    Audit EXPLAIN QUERY PLAN untuk query aplikasi (lihat database/query_audit.py).
+    Audit selalu berjalan pada database sementara (skenario servis ikut menulis):
+    bila students > 0 database baru di-migrate dan diisi data sintetis, bila 0
+    salinan dari db_path yang dipakai. Database asli tidak disentuh.
+
+    Returns:
+        Jumlah temuan (full scan tak terduga, query gagal, FK tanpa indeks)
+    """
+    import os
+    import tempfile
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+    from database.query_audit import (
+        audit_foreign_key_indexes, audit_query_plans, audit_service_queries,
+        print_audit_report, seed_audit_database
+    )
+
+    db_path = os.path.abspath(db_path)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        # Servis yang membuka DatabaseManager() sendiri (exam_system.db di direktori
+        # kerja) ikut memakai database audit, bukan database asli
+        os.chdir(tmp)
+        conn = sqlite3.connect(os.path.join(tmp, 'exam_system.db'))
+        try:
+            if students <= 0:
+                source = sqlite3.connect(db_path)
+                try:
+                    source.backup(conn)
+                finally:
+                    source.close()
+            db = ExamSystemDB(conn)
+            db.connect()
+            db.migrate()
+            if students > 0:
+                print(f"Mengisi {students} siswa sintetis untuk audit...")
+                seed_audit_database(conn, students=students)
+            else:
+                # Salinan: jangan sampai skenario laporan menghapus file laporan asli
+                conn.execute("UPDATE report_jobs SET file_path = NULL")
+                conn.commit()
+            results = audit_query_plans(conn) + audit_service_queries(conn)
+            return print_audit_report(results, audit_foreign_key_indexes(conn), verbose=verbose)
+        finally:
+            conn.close()
+            os.chdir(cwd)
+
 
 def main():
     parser = argparse.ArgumentParser(description='Holland System Database Manager')
-    parser.add_argument('command', choices=['migrate', 'seed', 'list'], 
+    parser.add_argument('command', choices=['migrate', 'seed', 'list', 'explain'], 
                        help='Command to execute')
     parser.add_argument('--entity', choices=['students'],
                        help='Entity to list (for list command)')
     parser.add_argument('--db', default='exam_system.db', help='Database file name')
+    parser.add_argument('--students', type=int, default=5000,
+                       help='explain: students seeded into a temporary audit database '
+                            '(0 = audit a copy of --db)')
+    parser.add_argument('--verbose', action='store_true',
+                       help='explain: print the plan of every query, not only flagged ones')
 
     args = parser.parse_args()
 
+    if args.command == 'explain':
+        sys.exit(1 if explain_queries(args.db, args.students, args.verbose) else 0)
+
     conn = sqlite3.connect(args.db)
     db = ExamSystemDB(conn)
     
@@ -338,7 +1061,12 @@ def main():
         db.connect()
         
         if args.command == 'migrate':
-            db.migrate()
+            applied = db.migrate()
+            if applied:
+                print(f"[OK] Migrasi {', '.join(map(str, applied))} diterapkan; "
+                      f"versi skema {SCHEMA_VERSION}")
+            else:
+                print(f"[OK] Skema sudah terbaru (versi {SCHEMA_VERSION})")
         
         elif args.command == 'seed':
             db.seed_data()
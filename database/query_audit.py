@@ -0,0 +1,400 @@
+"""
+Audit rencana eksekusi (EXPLAIN QUERY PLAN) untuk query yang dijalankan aplikasi.
+
+Dipakai oleh perintah `python database/exame_system.py explain`: database
+sementara diisi data sintetis berukuran besar, lalu setiap query di-EXPLAIN
+dan full scan yang tidak diharapkan ditandai. Foreign key tanpa indeks di
+sisi anak (cascade delete menjadi full scan) juga dilaporkan.
+
+Query servis tidak disalin ke sini: SERVICE_SCENARIOS memanggil fungsi
+servis sungguhan dan SQL yang dijalankannya ditangkap lewat trace callback,
+sehingga audit selalu memeriksa SQL yang sama dengan aplikasi. AUDIT_QUERIES
+hanya berisi SQL yang ditulis langsung di halaman/utilitas.
+
+Tambahkan skenario atau query baru setiap kali halaman/servis menambah
+query ke database.
+"""
+import random
+import re
+import sqlite3
+from collections import namedtuple
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from database.db_manager import DatabaseManager
+from database.exame_system import RESULT_SCORE_COLUMNS, RESULT_TOP_TYPE_COLUMNS, RIASEC_TYPES
+from services.cohort_analytics import (
+    load_class_major_counts, load_class_summary, load_daily_summary, load_dominant_type_counts
+)
+from services.dashboard_stats import _source_revisions, compute_dashboard_stats
+from services.export_manager import ExportManager
+from services.report_jobs import _expire_old_reports, _find_job, _requeue_orphaned_jobs
+from services.result_store import (
+    _load_model_version,
+    compact_stored_results,
+    count_result_summaries,
+    load_answer_details,
+    load_result_detail,
+    load_result_summaries,
+    load_top_rankings,
+    search_result_summaries,
+)
+from services.similarity import similarity_rankings
+from utils.holland_calculator import RIASEC_SUM_COLUMNS
+
+# allow_scan: tabel/alias yang memang dibaca seluruhnya (tabel kecil, agregat
+# yang di-cache per revisi, atau penelusuran indeks berurutan dengan LIMIT)
+AuditQuery = namedtuple('AuditQuery', ['name', 'sql', 'params', 'allow_scan'])
+
+AUDIT_QUERIES = [
+    # --- Login & halaman siswa ---
+    AuditQuery('auth.login', """
+        SELECT id, username, password, role, full_name, class_name
+        FROM users WHERE username = ?
+    """, ('student1',), ()),
+    AuditQuery('student.result_exists',
+               "SELECT COUNT(*) FROM test_results WHERE student_id = ?", (1,), ()),
+    AuditQuery('student.answer_count',
+               "SELECT COUNT(*) FROM student_answers WHERE student_id = ?", (1,), ()),
+    AuditQuery('student.question_count', "SELECT COUNT(*) FROM questions", (), ('questions',)),
+    AuditQuery('student_results.answers', """
+        SELECT q.id, q.question_text, q.holland_type, sa.answer, sa.response_time
+        FROM questions q
+        LEFT JOIN student_answers sa ON q.id = sa.question_id AND sa.student_id = ?
+        ORDER BY q.id
+    """, (1,), ('q',)),
+
+    # --- Tes (CAT) & perhitungan ---
+    AuditQuery('cat.question_bank',
+               "SELECT id, question_text, holland_type FROM questions ORDER BY id", (), ('questions',)),
+    AuditQuery('cat.session',
+               "SELECT question_order, started_at FROM test_sessions WHERE student_id = ?", (1,), ()),
+    AuditQuery('cat.saved_answers', """
+        SELECT question_id, answer, question_order, response_time
+        FROM student_answers WHERE student_id = ?
+        ORDER BY question_order, id
+    """, (1,), ()),
+    AuditQuery('cat.reset_answers', "DELETE FROM student_answers WHERE student_id = ?", (1,), ()),
+    AuditQuery('holland.riasec_totals',
+               f"SELECT {RIASEC_SUM_COLUMNS} FROM student_riasec_totals WHERE student_id = ?", (1,), ()),
+    AuditQuery('holland.riasec_totals_batch',
+               f"SELECT student_id, {RIASEC_SUM_COLUMNS} FROM student_riasec_totals WHERE student_id IN (?, ?, ?)",
+               (1, 2, 3), ()),
+
+    # --- Dashboard admin ---
+    AuditQuery('dashboard.recent_students', """
+        SELECT u.full_name, u.class_name, u.created_at,
+               CASE WHEN tr.id IS NOT NULL THEN 'Selesai' ELSE 'Belum' END as status_tes,
+               tr.recommended_major
+        FROM users u
+        LEFT JOIN test_results tr ON u.id = tr.student_id
+        WHERE u.role = 'student'
+        ORDER BY u.created_at DESC
+        LIMIT 10
+    """, (), ()),
+
+    # --- Manajemen data ---
+    AuditQuery('data_management.students', """
+        SELECT u.id, u.username, u.full_name, u.class_name, u.created_at,
+               CASE WHEN tr.id IS NOT NULL THEN 'Sudah' ELSE 'Belum' END
+        FROM users u
+        LEFT JOIN test_results tr ON u.id = tr.student_id
+        WHERE u.role = 'student'
+        ORDER BY u.created_at DESC
+    """, (), ()),
+    AuditQuery('data_management.delete_question_answers',
+               "DELETE FROM student_answers WHERE question_id = ?", (1,), ()),
+    AuditQuery('data_management.delete_student_results',
+               "DELETE FROM test_results WHERE student_id = ?", (1,), ()),
+    AuditQuery('data_management.major_by_name',
+               "SELECT id FROM majors WHERE Major = ?", ('Major 1',), ()),
+    AuditQuery('data_management.majors', "SELECT * FROM majors", (), ('majors',)),
+
+    # --- Job laporan & import CSV ---
+    AuditQuery('report_jobs.queued',
+               "SELECT id FROM report_jobs WHERE status = 'queued' ORDER BY id", (), ()),
+    AuditQuery('import.student_ids', "SELECT id, username FROM users WHERE role = 'student'", (),
+               ('users',)),
+]
+
+
+# ==========================================
+# SKENARIO SERVIS
+# ==========================================
+# run(conn) memanggil fungsi servis; setiap statement yang dijalankannya diaudit
+AuditScenario = namedtuple('AuditScenario', ['name', 'run', 'allow_scan'])
+
+# Kombinasi filter halaman monitoring (lihat _summary_filters)
+SUMMARY_FILTERS = {
+    'all': {},
+    'name': {'name': 'Siswa 1'},
+    'no_class': {'class_name': ''},
+    'class': {'class_name': 'XII IPA 1'},
+    'major': {'recommended_major': 'Major 1'},
+    'dates': {'date_from': '2026-01-01', 'date_to': '2026-01-07'},
+    'class_major': {'class_name': 'XII IPA 1', 'recommended_major': 'Major 1'},
+}
+
+
+class _NoExecutor:
+    """Pengganti executor job laporan: audit tidak menjalankan job yang diantrikan ulang"""
+
+    def submit(self, *args, **kwargs):
+        return None
+
+
+def _export_rows(conn):
+    """Urutan query export_full_admin_report, dijalankan pada koneksi audit"""
+    path = conn.execute("PRAGMA database_list").fetchone()[2]
+    manager = ExportManager(DatabaseManager(path))
+    manager.refresh_row_cache(conn)
+    manager._load_reference_data(conn)
+    manager._context_key = manager._row_cache_context(conn)
+    manager._pending_rows = manager._build_cached_rows(
+        conn, manager._stale_students(conn, manager._context_key)
+    )
+    for part in ('holland', 'answers', 'rankings'):
+        next(manager._cached_rows(conn, part), None)
+
+
+SERVICE_SCENARIOS = [
+    # --- Hasil tes (result_store) ---
+    AuditScenario('result_store.summaries', load_result_summaries, ('tr',)),
+    AuditScenario('result_store.summaries_by_id',
+                  lambda conn: load_result_summaries(conn, [2, 3, 4]), ()),
+    *(
+        AuditScenario(f'result_store.search[{key}]',
+                      lambda conn, f=filters: (count_result_summaries(conn, **f),
+                                               search_result_summaries(conn, **f)),
+                      # tanpa filter berindeks (potongan nama LIKE '%...%' juga tidak bisa
+                      # memakai indeks): COUNT membaca salah satu tabel seluruhnya,
+                      # halaman menelusuri indeks completed_at dengan LIMIT
+                      ('tr', 'u') if key in ('all', 'name') else ())
+        for key, filters in SUMMARY_FILTERS.items()
+    ),
+    AuditScenario('result_store.answer_details', lambda conn: load_answer_details(conn, 2), ('q',)),
+    AuditScenario('result_store.top_rankings',
+                  lambda conn: load_top_rankings(conn, 5, [2, 3, 4]), ()),
+    AuditScenario('result_store.model_version',
+                  lambda conn: _load_model_version(conn, 'audit'), ()),
+    AuditScenario('result_store.detail', lambda conn: load_result_detail(conn, 2), ()),
+    AuditScenario('result_store.compact',
+                  lambda conn: compact_stored_results(conn, 0, 100), ('majors',)),
+
+    # --- Dashboard & analitik kelas ---
+    AuditScenario('dashboard.revisions', _source_revisions, ('data_revisions',)),
+    AuditScenario('dashboard.stats', compute_dashboard_stats,
+                  ('test_results', 'questions', 'majors', 'tr')),
+    AuditScenario('cohort.class_summary', load_class_summary, ('class_summary',)),
+    AuditScenario('cohort.major_totals', load_class_major_counts, ('class_major_counts',)),
+    AuditScenario('cohort.class_majors',
+                  lambda conn: load_class_major_counts(conn, 'XII IPA 1'), ()),
+    AuditScenario('cohort.daily', load_daily_summary, ('daily_summary',)),
+    AuditScenario('cohort.daily_range',
+                  lambda conn: load_daily_summary(conn, '2026-01-01', '2026-01-07'), ('daily_summary',)),
+    AuditScenario('cohort.dominant_types', load_dominant_type_counts, ('test_results',)),
+
+    # --- Laporan Excel & similarity ---
+    AuditScenario('export.report', _export_rows, ('tr', 'u', 'questions', 'majors')),
+    AuditScenario('similarity.rankings',
+                  lambda conn: similarity_rankings(conn, [2, 3, 4]), ('majors',)),
+    AuditScenario('report_jobs.find',
+                  lambda conn: _find_job(conn, 'key1', ('done', 'queued', 'running', 'failed')), ()),
+    AuditScenario('report_jobs.requeue',
+                  lambda conn: _requeue_orphaned_jobs(conn, _NoExecutor()), ()),
+    AuditScenario('report_jobs.expire', _expire_old_reports, ()),
+]
+
+# Statement yang tidak perlu di-EXPLAIN: kontrol transaksi dan baris trigger ("-- TRIGGER ...")
+_SKIPPED_STATEMENT = re.compile(r'^\s*(--|BEGIN|COMMIT|ROLLBACK|SAVEPOINT|RELEASE|PRAGMA)', re.IGNORECASE)
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+
+def capture_service_queries(conn, scenario: AuditScenario) -> List[AuditQuery]:
+    """
+    Jalankan satu skenario dan kembalikan statement yang dieksekusinya sebagai
+    AuditQuery (SQL sudah berisi nilai parameter). Statement yang sama dengan
+    nilai berbeda (mis. executemany) hanya diambil sekali.
+    """
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        scenario.run(conn)
+    finally:
+        conn.set_trace_callback(None)
+
+    queries, seen = [], set()
+    for sql in statements:
+        shape = _LITERAL.sub('?', sql)
+        if _SKIPPED_STATEMENT.match(sql) or shape in seen:
+            continue
+        seen.add(shape)
+        queries.append(AuditQuery(scenario.name, sql, (), scenario.allow_scan))
+    if len(queries) > 1:
+        queries = [query._replace(name=f"{query.name}#{i}") for i, query in enumerate(queries, 1)]
+    return queries
+
+
+def seed_audit_database(conn, students: int = 5000, majors: int = 100,
+                        questions: int = 60, seed: int = 1) -> None:
+    """
+    Isi database (yang sudah di-migrate) dengan data sintetis untuk audit:
+    siswa, jawaban lengkap, hasil tes beserta ranking, lalu ANALYZE agar
+    query planner memakai statistik yang realistis.
+    """
+    rng = random.Random(seed)
+    start = datetime(2026, 1, 1)
+    conn.executemany(
+        "INSERT INTO questions (question_text, holland_type) VALUES (?, ?)",
+        [(f"Soal {i}", RIASEC_TYPES[i % len(RIASEC_TYPES)]) for i in range(questions)]
+    )
+    conn.executemany(
+        f"INSERT INTO majors (Major, {', '.join(RIASEC_TYPES)}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(f"Major {i}", *(round(rng.random(), 2) for _ in RIASEC_TYPES)) for i in range(majors)]
+    )
+    question_ids = [row[0] for row in conn.execute("SELECT id FROM questions")]
+    major_names = [row[0] for row in conn.execute("SELECT Major FROM majors")]
+
+    result_columns = ('student_id', 'top_3_types', 'recommended_major', 'holland_scores',
+                      'anp_results', 'total_items', 'completed_at') + RESULT_SCORE_COLUMNS \
+        + RESULT_TOP_TYPE_COLUMNS + ('holland_code',)
+    for s in range(students):
+        created = start + timedelta(minutes=rng.randrange(60 * 24 * 90))
+        student_id = conn.execute(
+            "INSERT INTO users (username, password, role, full_name, class_name, created_at) "
+            "VALUES (?, 'x', 'student', ?, ?, ?)",
+            (f"audit{s}", f"Siswa {s}", f"XII IPA {s % 12 + 1}", created.strftime('%Y-%m-%d %H:%M:%S'))
+        ).lastrowid
+        conn.executemany(
+            "INSERT INTO student_answers (student_id, question_id, answer, question_order) VALUES (?, ?, ?, ?)",
+            [(student_id, q, rng.randint(1, 5), i) for i, q in enumerate(question_ids)]
+        )
+        if rng.random() < 0.2:
+            continue  # sebagian siswa belum selesai tes
+        scores = [round(rng.random(), 3) for _ in RIASEC_TYPES]
+        top = [t for _, t in sorted(zip(scores, RIASEC_TYPES), reverse=True)[:3]]
+        ranked = rng.sample(major_names, min(5, len(major_names)))
+        completed = created + timedelta(minutes=rng.randrange(60 * 24 * 7))
+        conn.execute(
+            f"INSERT INTO test_results ({', '.join(result_columns)}) "
+            f"VALUES ({', '.join(['?'] * len(result_columns))})",
+            (student_id, '[]', ranked[0], '{}', '{}', len(question_ids),
+             completed.strftime('%Y-%m-%d %H:%M:%S'), *scores, *top, ''.join(t[0] for t in top))
+        )
+        conn.executemany(
+            "INSERT INTO result_rankings (student_id, rank, major_name, anp_score) VALUES (?, ?, ?, ?)",
+            [(student_id, rank, name, 1.0 / rank) for rank, name in enumerate(ranked, 1)]
+        )
+    conn.executemany(
+        "INSERT INTO report_jobs (cache_key, sheets, status) VALUES (?, '[]', ?)",
+        [(f"key{i}", rng.choice(['done', 'expired', 'failed'])) for i in range(200)]
+    )
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.commit()
+
+
+def explain_query(conn, sql: str, params: Sequence = ()) -> List[str]:
+    """Baris detail EXPLAIN QUERY PLAN untuk satu query"""
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", tuple(params))]
+
+
+def _scanned_table(detail: str) -> Optional[str]:
+    """Nama tabel/alias bila baris rencana adalah full scan"""
+    parts = detail.split()
+    if len(parts) < 2 or parts[0] != 'SCAN' or parts[1] == 'CONSTANT' or 'VIRTUAL TABLE' in detail:
+        return None
+    return parts[1]
+
+
+def _audit_plan(conn, query: AuditQuery) -> Dict:
+    try:
+        plan = explain_query(conn, query.sql, query.params)
+        error = None
+    except sqlite3.Error as exc:
+        plan, error = [], str(exc)
+    scans = [
+        table for table in map(_scanned_table, plan)
+        if table and table not in query.allow_scan
+    ]
+    return {'name': query.name, 'plan': plan, 'scans': scans, 'error': error}
+
+
+def audit_query_plans(conn, queries: Sequence[AuditQuery] = AUDIT_QUERIES) -> List[Dict]:
+    """
+    EXPLAIN setiap query katalog.
+
+    Returns:
+        [{'name', 'plan': [baris], 'scans': [tabel full scan yang tidak diizinkan], 'error'}]
+    """
+    return [_audit_plan(conn, query) for query in queries]
+
+
+def audit_service_queries(conn, scenarios: Sequence[AuditScenario] = SERVICE_SCENARIOS) -> List[Dict]:
+    """
+    Jalankan setiap skenario servis dan EXPLAIN statement yang dieksekusinya.
+    Skenario dapat menulis ke database, jadi jalankan hanya pada database audit.
+
+    Returns:
+        Format sama dengan `audit_query_plans`; skenario yang gagal dilaporkan sebagai error
+    """
+    results = []
+    for scenario in scenarios:
+        try:
+            queries = capture_service_queries(conn, scenario)
+        except Exception as exc:
+            if conn.in_transaction:
+                conn.rollback()
+            results.append({'name': scenario.name, 'plan': [], 'scans': [], 'error': str(exc)})
+            continue
+        if conn.in_transaction:
+            conn.commit()
+        results.extend(_audit_plan(conn, query) for query in queries)
+    return results
+
+
+def audit_foreign_key_indexes(conn) -> List[Tuple[str, str, str]]:
+    """
+    Foreign key yang kolom anaknya tidak diawali indeks mana pun: setiap
+    delete/update di tabel induk memicu full scan pada tabel anak.
+
+    Returns:
+        [(tabel anak, kolom, tabel induk)]
+    """
+    missing = []
+    tables = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+    )]
+    for table in tables:
+        leading = set()
+        for index in conn.execute(f"PRAGMA index_list('{table}')").fetchall():
+            columns = conn.execute(f"PRAGMA index_info('{index[1]}')").fetchall()
+            if columns:
+                leading.add(min(columns)[2])
+        # INTEGER PRIMARY KEY (rowid) tidak muncul di index_list
+        leading.update(row[1] for row in conn.execute(f"PRAGMA table_info('{table}')") if row[5] == 1)
+        for fk in conn.execute(f"PRAGMA foreign_key_list('{table}')"):
+            if fk[3] not in leading:
+                missing.append((table, fk[3], fk[2]))
+    return missing
+
+
+def print_audit_report(results: List[Dict], missing_fk: List[Tuple[str, str, str]],
+                       verbose: bool = False) -> int:
+    """Cetak hasil audit; mengembalikan jumlah temuan"""
+    problems = 0
+    for result in results:
+        flagged = result['scans'] or result['error']
+        problems += bool(flagged)
+        if flagged or verbose:
+            status = "ERROR" if result['error'] else ("SCAN" if result['scans'] else "OK")
+            print(f"[{status}] {result['name']}")
+            if result['error']:
+                print(f"    {result['error']}")
+            for line in result['plan']:
+                print(f"    {line}")
+    for table, column, parent in missing_fk:
+        problems += 1
+        print(f"[FK] {table}.{column} -> {parent}: tidak ada indeks, cascade dari {parent} memindai {table}")
+    print(f"\n{len(results)} query diperiksa, {problems} temuan.")
+    return problems
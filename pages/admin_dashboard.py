@@ -1,10 +1,9 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-import json
 from database.db_manager import DatabaseManager
+from services.dashboard_stats import get_dashboard_stats
 from utils.auth import check_login, logout
-from utils.config import connection
 from utils.styles import apply_dark_theme, render_sidebar, page_header
 
 
@@ -23,28 +22,17 @@ if st.session_state.role != 'admin':
 # Render sidebar
 render_sidebar(current_page="admin_dashboard")
 
-# Database connection
-conn = connection()
-cursor = conn.cursor()
-
 # Page header
 page_header("Dashboard Admin", f"Selamat datang, {st.session_state.full_name}")
 
 
-# Stats queries
-cursor.execute("SELECT COUNT(*) FROM users WHERE role = 'student'")
-total_students = cursor.fetchone()[0]
-
-cursor.execute("SELECT COUNT(*) FROM test_results")
-completed_tests = cursor.fetchone()[0]
-
-not_completed = total_students - completed_tests
-
-cursor.execute("SELECT COUNT(*) FROM questions")
-total_questions = cursor.fetchone()[0]
-
-cursor.execute("SELECT COUNT(*) FROM majors")
-total_majors = cursor.fetchone()[0]
+# Stats (satu query, di-cache per revisi data)
+stats = get_dashboard_stats()
+total_students = stats['total_students']
+completed_tests = stats['completed_tests']
+not_completed = stats['not_completed']
+total_questions = stats['total_questions']
+total_majors = stats['total_majors']
 
 # Stats cards
 col1, col2, col3, col4 = st.columns(4)
@@ -109,18 +97,19 @@ with col_chart2:
 
 # Recent students table
 st.markdown("#### 👥 Siswa Terbaru")
-cursor.execute('''
-    SELECT u.full_name, u.class_name, u.created_at,
-           CASE WHEN tr.id IS NOT NULL THEN 'Selesai' ELSE 'Belum' END as status_tes,
-           tr.recommended_major
-    FROM users u
-    LEFT JOIN test_results tr ON u.id = tr.student_id
-    WHERE u.role = 'student'
-    ORDER BY u.created_at DESC
-    LIMIT 10
-''')
-
-students_data = cursor.fetchall()
+# Koneksi hanya dipegang untuk query ini (statistik di atas memakai koneksinya sendiri)
+with DatabaseManager().connection() as conn:
+    students_data = conn.execute('''
+        SELECT u.full_name, u.class_name, u.created_at,
+               CASE WHEN tr.id IS NOT NULL THEN 'Selesai' ELSE 'Belum' END as status_tes,
+               tr.recommended_major
+        FROM users u
+        LEFT JOIN test_results tr ON u.id = tr.student_id
+        WHERE u.role = 'student'
+        ORDER BY u.created_at DESC
+        LIMIT 10
+    ''').fetchall()
+
 if students_data:
     df_students = pd.DataFrame(
         students_data,
@@ -134,18 +123,8 @@ else:
 if completed_tests > 0:
     st.markdown("#### 🎯 Distribusi Tipe Holland")
     
-    cursor.execute('SELECT holland_scores FROM test_results')
-    holland_data = cursor.fetchall()
-    
-    holland_totals = {
-        'Realistic': 0, 'Investigative': 0, 'Artistic': 0,
-        'Social': 0, 'Enterprising': 0, 'Conventional': 0
-    }
-    
-    for row in holland_data:
-        scores = json.loads(row[0])
-        for holland_type, score in scores.items():
-            holland_totals[holland_type] += score
+    # Total per tipe sudah dihitung bersama statistik di atas
+    holland_totals = stats['holland_totals']
     
     df_holland = pd.DataFrame(
         list(holland_totals.items()),
@@ -165,5 +144,3 @@ if completed_tests > 0:
         margin=dict(l=0, r=0, t=20, b=0)
     )
     st.plotly_chart(fig_holland, use_container_width=True)
-
-conn.close()
\ No newline at end of file
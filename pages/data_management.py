@@ -3,6 +3,8 @@ import pandas as pd
 import sqlite3
 from database.db_manager import DatabaseManager
 from utils.auth import check_login, hash_password
+from utils.anp_cache import invalidate_alternative_priorities
+from services.cat_engine import invalidate_question_bank
 from utils.styles import apply_dark_theme, render_sidebar, page_header
 
 # Page config
@@ -165,6 +167,7 @@ with tab1:
                         form_cursor = conn.cursor()
                         form_cursor.execute("DELETE FROM student_answers WHERE student_id=?", (student_id,))
                         form_cursor.execute("DELETE FROM test_results WHERE student_id=?", (student_id,))
+                        form_cursor.execute("DELETE FROM test_sessions WHERE student_id=?", (student_id,))
                         form_cursor.execute("DELETE FROM users WHERE id=?", (student_id,))
                         conn.commit()
                         st.success("Siswa berhasil dihapus.")
@@ -212,6 +215,7 @@ with tab2:
                         )
                     )
                     conn.commit()
+                    invalidate_question_bank()
                     st.success("Soal baru berhasil ditambahkan.")
                     st.rerun()
                 except Exception as e:
@@ -263,6 +267,7 @@ with tab2:
                             )
                         )
                         conn.commit()
+                        invalidate_question_bank()
                         st.success("Soal berhasil diperbarui.")
                         st.rerun()
                     except Exception as e:
@@ -286,6 +291,7 @@ with tab2:
                         form_cursor.execute("DELETE FROM student_answers WHERE question_id=?", (question_id,))
                         form_cursor.execute("DELETE FROM questions WHERE id=?", (question_id,))
                         conn.commit()
+                        invalidate_question_bank()
                         st.success("Soal berhasil dihapus.")
                         st.rerun()
                     except Exception as e:
@@ -343,6 +349,7 @@ with tab3:
                         )
                     )
                     conn.commit()
+                    invalidate_alternative_priorities(db_manager.db_path)
                     st.success("Jurusan baru berhasil ditambahkan.")
                     st.rerun()
                 except sqlite3.IntegrityError:
@@ -397,6 +404,7 @@ with tab3:
                                 )
                             )
                             conn.commit()
+                            invalidate_alternative_priorities(db_manager.db_path)
                             st.success("Jurusan berhasil diperbarui.")
                             st.rerun()
                         except sqlite3.IntegrityError:
@@ -421,6 +429,7 @@ with tab3:
                             form_cursor = conn.cursor()
                             form_cursor.execute("DELETE FROM majors WHERE id=?", (major_id,))
                             conn.commit()
+                            invalidate_alternative_priorities(db_manager.db_path)
                             st.success("Jurusan berhasil dihapus.")
                             st.rerun()
                         except Exception as e:
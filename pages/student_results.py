@@ -1,5 +1,4 @@
 import streamlit as st
-import json
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
@@ -7,6 +6,7 @@ import numpy as np
 from utils.auth import check_login
 from utils.timezone import convert_utc_to_local
 from utils.config import connection
+from services.result_store import load_result_detail
 from utils.styles import apply_dark_theme, render_sidebar, page_header
 
 # Page config
@@ -29,14 +29,8 @@ page_header("Hasil Tes Minat Bakat", "Analisis profil RIASEC dan rekomendasi jur
 
 cursor = conn.cursor()
 
-# Ambil hasil tes siswa
-cursor.execute('''
-    SELECT holland_scores, anp_results, top_3_types, recommended_major, completed_at
-    FROM test_results 
-    WHERE student_id = ?
-''', (st.session_state.user_id,))
-
-result = cursor.fetchone()
+# Ambil hasil tes siswa (payload ringkas dibangun ulang ke bentuk lengkap)
+result = load_result_detail(conn, st.session_state.user_id)
 
 # Fetch all student answers joined with questions
 cursor.execute('''
@@ -55,11 +49,11 @@ if not result:
     st.stop()
 
 # Parse data
-holland_scores = json.loads(result[0])
-anp_results = json.loads(result[1]) if result[1] else {}
-top_3_types = json.loads(result[2])
-recommended_major = result[3]
-completed_at = result[4]
+holland_scores = result['holland_scores']
+anp_results = result['anp_results'] or {}
+top_3_types = result['top_3_types']
+recommended_major = result['recommended_major']
+completed_at = result['completed_at']
 
 # ==========================================
 # EXTRACT DATA FROM NESTED STRUCTURE
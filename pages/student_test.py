@@ -6,7 +6,6 @@ from utils.auth import check_login
 from utils.holland_calculator import HollandCalculator
 from utils.config import connection
 from services.cat_engine import CATHollandEngine
-from database.db_manager import DatabaseManager
 from utils.styles import apply_dark_theme, render_sidebar, page_header
 
 # Page config
@@ -39,38 +38,25 @@ ANSWER_LABELS = {
 }
 
 
-def _persist_answers(session_state):
-    db = DatabaseManager()
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM student_answers WHERE student_id = ?', (session_state['student_id'],))
-    for entry in session_state['answers']:
-        cursor.execute('''
-            INSERT INTO student_answers (student_id, question_id, answer, question_order, response_time)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (
-            session_state['student_id'],
-            entry['question_id'],
-            entry['answer'],
-            entry['question_order'],
-            entry['response_time']
-        ))
-    conn.commit()
-    conn.close()
+def _reset_cat_session(engine: CATHollandEngine):
+    engine.reset_session(st.session_state.user_id)
+    st.session_state['cat_test_session'] = engine.start_session(st.session_state.user_id)
+    st.session_state['cat_test_session']['question_start'] = time.time()
 
 
-def _reset_cat_session(engine: CATHollandEngine):
-    st.session_state['cat_test_session'] = engine.initialize_session(st.session_state.user_id)
+def _resume_cat_session(engine: CATHollandEngine):
+    st.session_state['cat_test_session'] = engine.resume_session(st.session_state.user_id)
     st.session_state['cat_test_session']['question_start'] = time.time()
 
 
-def _finalize_test():
+def _finalize_test(engine: CATHollandEngine):
     session_state = st.session_state['cat_test_session']
     if not session_state['answers']:
         st.warning("Belum ada jawaban yang disimpan.")
         return
 
-    _persist_answers(session_state)
+    # Jawaban sudah tersimpan bertahap; cukup flush sisa buffer lalu hitung skor
+    engine.flush_answers(session_state)
     calculator = HollandCalculator()
     result = calculator.process_test_completion(
         session_state['student_id'],
@@ -78,6 +64,7 @@ def _finalize_test():
     )
     session_state['result'] = result
     session_state['finished'] = True
+    engine.close_session(session_state['student_id'])
     st.success("🎉 Tes berhasil diselesaikan!")
 
 
@@ -89,14 +76,7 @@ def _handle_answer_submission(engine: CATHollandEngine, question_id: int, answer
         return
 
     response_time = max(0.1, time.time() - (session_state.get('question_start') or time.time()))
-    order = len(session_state['answers']) + 1
-    session_state['answers'].append({
-        'question_id': question_id,
-        'answer': answer_value,
-        'question_order': order,
-        'response_time': response_time
-    })
-    session_state['asked_ids'].append(question_id)
+    engine.record_answer(session_state, question_id, answer_value, response_time)
     
     # Update current index untuk soal berikutnya
     session_state['current_index'] += 1
@@ -113,6 +93,9 @@ def _handle_answer_submission(engine: CATHollandEngine, question_id: int, answer
     if engine.should_stop(len(session_state['answers']), session_state):
         session_state['completed'] = True
 
+    if session_state['completed']:
+        engine.flush_answers(session_state)
+
     st.rerun()
 
 
@@ -136,7 +119,7 @@ if not engine.question_bank:
 
 if 'cat_test_session' not in st.session_state or \
         st.session_state['cat_test_session'].get('student_id') != st.session_state.user_id:
-    _reset_cat_session(engine)
+    _resume_cat_session(engine)
 
 session_state = st.session_state['cat_test_session']
 if session_state['question_start'] is None and session_state['current_question_id']:
@@ -183,7 +166,7 @@ else:
     if session_state.get('result') is None:
         if st.button("🚀 Selesaikan Tes & Proses Hasil", type="primary", use_container_width=True):
             with st.spinner("Memproses hasil tes..."):
-                _finalize_test()
+                _finalize_test(engine)
             st.rerun()
 
 if session_state.get('result'):
@@ -1,31 +1,20 @@
 import streamlit as st
 import pandas as pd
-import json
 import plotly.express as px
-from database.db_manager import DatabaseManager
+from database.exame_system import RIASEC_TYPES
+from services.cohort_analytics import (
+    load_class_major_counts, load_class_summary, load_daily_summary, load_dominant_type_counts
+)
+from services.result_store import count_result_summaries, load_answer_details, search_result_summaries
 from utils.auth import check_login
 from utils.config import connection
 from utils.styles import apply_dark_theme, render_sidebar, page_header
 from datetime import datetime, date
 
 # ==========================================
-# OPTIMIZED: Cached query function
+# OPTIMIZED: filter & paginasi dijalankan di SQL
 # ==========================================
-@st.cache_data(ttl=300)  # Cache selama 5 menit
-def get_test_results():
-    """Fetch test results with caching to avoid repeated queries"""
-    conn = connection()
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT u.full_name, u.class_name, tr.top_3_types, tr.recommended_major,
-               tr.holland_scores, tr.completed_at, tr.anp_results, tr.student_id
-        FROM test_results tr
-        JOIN users u ON tr.student_id = u.id
-        ORDER BY tr.completed_at DESC
-    ''')
-    results = cursor.fetchall()
-    conn.close()
-    return results
+PAGE_SIZE_OPTIONS = [25, 50, 100]
 
 # Page config
 st.set_page_config(page_title="Monitoring Hasil Tes", page_icon="📊", layout="wide")
@@ -40,125 +29,78 @@ if st.session_state.get("role") != 'admin':
 # Sidebar
 render_sidebar(current_page="test_monitoring")
 
-# Database connection (for detail queries later)
-conn = connection()
-
 # Page header
 page_header("Monitoring Hasil Tes", "Lihat dan analisis hasil tes siswa")
 
-# Button Download Laporan (OPTIMIZED: Lazy Loading)
-from services.export_manager import ExportManager
+# Button Download Laporan (OPTIMIZED: job latar belakang + file cache per revisi data)
+from services.export_manager import REPORT_SHEETS
+from services.report_jobs import find_report_job, get_job, submit_report_job
 st.markdown("### 📥 Laporan Hasil")
+
+REPORT_POLL_SECONDS = 2
+
+
+def _read_report_file(path):
+    # Dipanggil Streamlit saat tombol download diklik (file tidak ditahan di session_state)
+    with open(path, 'rb') as fh:
+        return fh.read()
+
+
+@st.fragment(run_every=REPORT_POLL_SECONDS)
+def _report_progress(job_id):
+    """Polling status job tanpa memblokir halaman; muat ulang halaman saat selesai"""
+    job = get_job(job_id)
+    if job is None or job['status'] not in ('queued', 'running'):
+        st.rerun()
+    label = "dalam antrian" if job['status'] == 'queued' else "sedang dibuat"
+    st.info(f"⏳ Laporan {label}... halaman akan diperbarui otomatis.")
+
+
 col_exp, _ = st.columns([1, 2])
 with col_exp:
-    # Lazy loading: hanya generate Excel saat tombol diklik
-    if 'excel_report' not in st.session_state:
-        st.session_state['excel_report'] = None
-    if 'excel_ready' not in st.session_state:
-        st.session_state['excel_ready'] = False
-    
-    if not st.session_state['excel_ready']:
-        if st.button("📊 Siapkan Laporan Lengkap (Excel)", use_container_width=True):
-            try:
-                with st.spinner("Menyiapkan laporan... (ini mungkin memakan waktu)"):
-                    export_mgr = ExportManager()
-                    excel_data = export_mgr.generate_full_admin_report()
-                    st.session_state['excel_report'] = excel_data
-                    st.session_state['excel_ready'] = True
-                    st.rerun()
-            except Exception as e:
-                st.error(f"Gagal menyiapkan laporan: {e}")
-    else:
+    selected_sheets = st.multiselect(
+        "Sheet yang disertakan",
+        options=list(REPORT_SHEETS),
+        default=list(REPORT_SHEETS),
+        format_func=REPORT_SHEETS.get,
+    )
+    # Laporan untuk revisi data saat ini (dibagi antar admin, bertahan saat refresh)
+    report_job = find_report_job(selected_sheets) if selected_sheets else None
+
+    if report_job and report_job['status'] == 'done':
         st.download_button(
             label="⬇️ Download Laporan Lengkap (Siap!)",
-            data=st.session_state['excel_report'],
+            data=lambda path=report_job['file_path']: _read_report_file(path),
             file_name=f"Laporan_Hasil_Tes_Lengkap_{datetime.now().strftime('%Y%m%d')}.xlsx",
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
             use_container_width=True
         )
-        if st.button("🔄 Reset", use_container_width=True):
-            st.session_state['excel_ready'] = False
-            st.session_state['excel_report'] = None
+        st.caption(f"Sesuai data terbaru · dibuat {report_job['finished_at']}")
+    elif report_job and report_job['status'] in ('queued', 'running'):
+        _report_progress(report_job['id'])
+    else:
+        if report_job and report_job['status'] == 'failed':
+            st.error(f"Gagal menyiapkan laporan: {report_job['error']}")
+        if st.button("📊 Siapkan Laporan Lengkap (Excel)", use_container_width=True,
+                     disabled=not selected_sheets):
+            submit_report_job(selected_sheets, requested_by=st.session_state.get('user_id'))
             st.rerun()
 
 
-cursor = conn.cursor()
-
-# Ambil data hasil tes (OPTIMIZED: menggunakan cached function)
-raw_results = get_test_results()
+# Koneksi halaman diambil setelah bagian laporan: service laporan memakai koneksinya sendiri
+conn = connection()
 
+# Statistik & pilihan filter dari tabel agregat (tidak membaca seluruh hasil tes)
+class_summary = load_class_summary(conn)
+cohort_major_counts = load_class_major_counts(conn)
+dominant_type_counts = load_dominant_type_counts(conn)
+total_results = sum(row['completed_count'] for row in class_summary)
 
-if not raw_results:
+if total_results == 0:
     st.info("Belum ada siswa yang menyelesaikan tes.")
     conn.close()
     st.stop()
 
-# Normalisasi hasil dari DB ke list of dict
-results_data = []
-for row in raw_results:
-    # row indices based on SELECT order
-    full_name = row[0]
-    class_name = row[1]
-    raw_top3 = row[2]
-    recommended_major = row[3]
-    raw_scores = row[4]
-    completed_at_raw = row[5]
-    raw_anp = row[6]
-    student_id = row[7] if len(row) > 7 else None
-
-    # top_3_types stored sebagai JSON string di DB (mis. '["Realistic","Investigative",...]')
-    try:
-        top_types = json.loads(raw_top3) if raw_top3 else []
-    except Exception:
-        # fallback: jika sudah list
-        top_types = raw_top3 if isinstance(raw_top3, (list, tuple)) else []
-
-    # holland_scores mungkin JSON string atau dict
-    try:
-        holland_scores = json.loads(raw_scores) if raw_scores else {}
-    except Exception:
-        holland_scores = raw_scores if isinstance(raw_scores, dict) else {}
-
-    # anp_results mungkin JSON string atau dict
-    try:
-        anp_results = json.loads(raw_anp) if raw_anp else None
-    except Exception:
-        anp_results = raw_anp if isinstance(raw_anp, dict) else None
-
-    # completed_at: simpan sebagai string untuk ditampilkan, tapi coba parse untuk filtering tanggal
-    completed_at_str = str(completed_at_raw) if completed_at_raw is not None else ""
-
-    # also try to produce a parsed date for easier comparisons
-    parsed_completed_at = None
-    if isinstance(completed_at_raw, (int, float)):
-        # unix timestamp?
-        try:
-            parsed_completed_at = datetime.fromtimestamp(int(completed_at_raw))
-        except Exception:
-            parsed_completed_at = None
-    else:
-        # try ISO parse
-        try:
-            parsed_completed_at = datetime.fromisoformat(completed_at_str)
-        except Exception:
-            # try common sqlite format
-            try:
-                parsed_completed_at = datetime.strptime(completed_at_str, "%Y-%m-%d %H:%M:%S")
-            except Exception:
-                parsed_completed_at = None
-
-    results_data.append({
-        'full_name': full_name,
-        'class_name': class_name,
-        'top_3_types': top_types,
-        'recommended_major': recommended_major,
-        'holland_scores': holland_scores,
-        'completed_at': completed_at_str,
-        'completed_at_dt': parsed_completed_at,  # bisa None
-        'anp_results': anp_results,
-        'student_id': student_id
-    })
-
 # Statistik umum
 st.subheader("📈 Statistik Umum")
 # buat 4 kolom untuk metric
@@ -166,76 +108,71 @@ col1, col2, col3, col4 = st.columns(4)
 
 # Total hasil tes
 with col1:
-    st.metric("Total Hasil Tes", len(results_data))
+    st.metric("Total Hasil Tes", total_results)
 
 # Jurusan terpopuler
 with col2:
-    majors = [row.get('recommended_major') or "N/A" for row in results_data]
-    majors_clean = [m for m in majors if m and m != "N/A"]
-    most_popular_major = max(set(majors_clean), key=majors_clean.count) if majors_clean else "N/A"
-    st.metric("Jurusan Terpopuler", most_popular_major)
+    popular = [row for row in cohort_major_counts if row['recommended_major']]
+    st.metric("Jurusan Terpopuler", popular[0]['recommended_major'] if popular else "N/A")
 
 # Tipe dominan (top tipe pertama)
 with col3:
-    all_top_types = [
-        row['top_3_types'][0]
-        for row in results_data
-        if row.get('top_3_types') and isinstance(row['top_3_types'], (list, tuple)) and len(row['top_3_types']) > 0
-    ]
-    most_dominant_type = max(set(all_top_types), key=all_top_types.count) if all_top_types else "N/A"
-    st.metric("Tipe Dominan", most_dominant_type)
+    st.metric("Tipe Dominan", next(iter(dominant_type_counts), "N/A"))
 
 # Tes hari ini
 with col4:
-    today = date.today()
-    today_results = []
-    for row in results_data:
-        dt = row.get('completed_at_dt')
-        if dt:
-            if dt.date() == today:
-                today_results.append(row)
-        else:
-            # fallback: jika completed_at string dimulai dengan YYYY-MM-DD cocok
-            s = row.get('completed_at', '')
-            if s.startswith(str(today)):
-                today_results.append(row)
-    st.metric("Tes Hari Ini", len(today_results))
+    today = date.today().isoformat()
+    today_summary = load_daily_summary(conn, start=today, end=today)
+    st.metric("Tes Hari Ini", today_summary[0]['completed_count'] if today_summary else 0)
 
 st.markdown("---")
 
-# --- Filter dan Pencarian ---
+# --- Filter dan Pencarian (dijalankan di SQL) ---
 st.subheader("🔍 Filter dan Pencarian")
-filter_col1, filter_col2, filter_col3 = st.columns(3)
+filter_col1, filter_col2, filter_col3, filter_col4 = st.columns(4)
 
 with filter_col1:
-    all_classes = sorted(list({row['class_name'] for row in results_data if row.get('class_name')}))
-    selected_class = st.selectbox("Filter Kelas", options=['Semua'] + all_classes)
+    class_options = {row['class_name'] or 'Tidak Ada Kelas': row['class_name'] for row in class_summary
+                     if row['completed_count'] > 0}
+    selected_class = st.selectbox("Filter Kelas", options=['Semua'] + sorted(class_options))
 
 with filter_col2:
-    all_majors = sorted(list({row.get('recommended_major') or 'N/A' for row in results_data}))
-    selected_major = st.selectbox("Filter Jurusan", options=['Semua'] + all_majors)
+    major_options = {row['recommended_major'] or 'N/A': row['recommended_major'] for row in cohort_major_counts}
+    selected_major = st.selectbox("Filter Jurusan", options=['Semua'] + sorted(major_options))
 
 with filter_col3:
+    date_range = st.date_input("Rentang Tanggal Tes", value=(), format="YYYY-MM-DD")
+
+with filter_col4:
     search_name = st.text_input("Cari Nama Siswa")
 
-# Apply filters
-filtered_data = results_data.copy()
+date_from = date_range[0] if len(date_range) > 0 else None
+date_to = date_range[1] if len(date_range) > 1 else date_from
 
-if selected_class != 'Semua':
-    filtered_data = [row for row in filtered_data if row.get('class_name') == selected_class]
+page_col1, page_col2, _ = st.columns([1, 1, 2])
+with page_col1:
+    page_size = st.selectbox("Baris per halaman", options=PAGE_SIZE_OPTIONS, index=1)
 
-if selected_major != 'Semua':
-    filtered_data = [row for row in filtered_data if (row.get('recommended_major') or 'N/A') == selected_major]
+filters = dict(
+    name=search_name.strip() or None,
+    class_name=class_options[selected_class] if selected_class != 'Semua' else None,
+    recommended_major=major_options[selected_major] if selected_major != 'Semua' else None,
+    date_from=date_from.isoformat() if date_from else None,
+    date_to=date_to.isoformat() if date_to else None,
+)
+total_filtered = count_result_summaries(conn, **filters)
+total_pages = max(1, -(-total_filtered // page_size))
+with page_col2:
+    page = st.number_input("Halaman", min_value=1, max_value=total_pages, value=1, step=1)
 
-if search_name:
-    filtered_data = [row for row in filtered_data if search_name.lower() in (row.get('full_name') or "").lower()]
+page_rows = search_result_summaries(conn, page=page, page_size=page_size, **filters)
 
 # --- Tabel Hasil ---
 st.subheader("📋 Hasil Tes Siswa")
-if filtered_data:
+if page_rows:
     # Prepare data for display
     display_data = []
-    for row in filtered_data:
+    for row in page_rows:
         top_3_types = row.get('top_3_types') or []
         display_data.append({
             'Nama': row.get('full_name') or 'N/A',
@@ -249,6 +186,9 @@ if filtered_data:
 
     df_results = pd.DataFrame(display_data)
     st.dataframe(df_results, use_container_width=True, hide_index=True)
+    first_row = (page - 1) * page_size + 1
+    st.caption(f"Menampilkan {first_row}–{first_row + len(page_rows) - 1} dari {total_filtered} hasil "
+               f"(halaman {page} dari {total_pages})")
 else:
     st.info("Tidak ada data yang sesuai dengan filter.")
 
@@ -257,79 +197,94 @@ st.markdown("---")
 # Analisis dan visualisasi
 st.subheader("📊 Analisis Data")
 
-if results_data:
-    vcol1, vcol2 = st.columns(2)
-
-    with vcol1:
-        # Distribusi jurusan rekomendasi
-        major_counts = {}
-        for row in results_data:
-            major = row.get('recommended_major') or 'N/A'
-            major_counts[major] = major_counts.get(major, 0) + 1
-
-        df_majors = pd.DataFrame(list(major_counts.items()), columns=['Jurusan', 'Jumlah'])
-        df_majors = df_majors.sort_values('Jumlah', ascending=True)
-
-        fig_majors = px.bar(df_majors, x='Jumlah', y='Jurusan', orientation='h',
-                           title="Distribusi Jurusan Rekomendasi",
-                           color='Jumlah', color_continuous_scale='viridis')
-        st.plotly_chart(fig_majors, use_container_width=True)
-
-    with vcol2:
-        # Distribusi tipe Holland dominan
-        dominant_type_counts = {}
-        for row in results_data:
-            top_3 = row.get('top_3_types') or []
-            if top_3:
-                dominant_type = top_3[0]
-                dominant_type_counts[dominant_type] = dominant_type_counts.get(dominant_type, 0) + 1
-
-        if dominant_type_counts:
-            df_types = pd.DataFrame(list(dominant_type_counts.items()), columns=['Tipe Holland', 'Jumlah'])
-            fig_types = px.pie(df_types, values='Jumlah', names='Tipe Holland',
-                              title="Distribusi Tipe Holland Dominan")
-            st.plotly_chart(fig_types, use_container_width=True)
-        else:
-            st.info("Belum ada data tipe Holland untuk divisualisasikan.")
-
-    # Analisis per kelas
-    class_names = [row.get('class_name') for row in results_data if row.get('class_name')]
-    if len(set(class_names)) > 1:
-        st.subheader("📚 Analisis per Kelas")
-
-        class_analysis = {}
-        for row in results_data:
-            class_name = row.get('class_name') or 'Tidak Ada Kelas'
-            if class_name not in class_analysis:
-                class_analysis[class_name] = {'total': 0, 'majors': {}}
-            class_analysis[class_name]['total'] += 1
-            major = row.get('recommended_major') or 'N/A'
-            class_analysis[class_name]['majors'][major] = class_analysis[class_name]['majors'].get(major, 0) + 1
-
-        for class_name, data in class_analysis.items():
-            with st.expander(f"Kelas {class_name} ({data['total']} siswa)"):
-                most_popular = max(data['majors'].items(), key=lambda x: x[1])
-                st.write(f"**Jurusan terpopuler:** {most_popular[0]} ({most_popular[1]} siswa)")
-
-                df_class_majors = pd.DataFrame(list(data['majors'].items()), columns=['Jurusan', 'Jumlah'])
-                fig_class = px.bar(df_class_majors, x='Jurusan', y='Jumlah',
-                                  title=f"Distribusi Jurusan - Kelas {class_name}")
-                st.plotly_chart(fig_class, use_container_width=True)
-
-# Detail hasil individual
+vcol1, vcol2 = st.columns(2)
+
+with vcol1:
+    # Distribusi jurusan rekomendasi
+    df_majors = pd.DataFrame([
+        {'Jurusan': row['recommended_major'] or 'N/A', 'Jumlah': row['count']}
+        for row in cohort_major_counts
+    ])
+    df_majors = df_majors.sort_values('Jumlah', ascending=True)
+
+    fig_majors = px.bar(df_majors, x='Jumlah', y='Jurusan', orientation='h',
+                       title="Distribusi Jurusan Rekomendasi",
+                       color='Jumlah', color_continuous_scale='viridis')
+    st.plotly_chart(fig_majors, use_container_width=True)
+
+with vcol2:
+    # Distribusi tipe Holland dominan
+    if dominant_type_counts:
+        df_types = pd.DataFrame(list(dominant_type_counts.items()), columns=['Tipe Holland', 'Jumlah'])
+        fig_types = px.pie(df_types, values='Jumlah', names='Tipe Holland',
+                          title="Distribusi Tipe Holland Dominan")
+        st.plotly_chart(fig_types, use_container_width=True)
+    else:
+        st.info("Belum ada data tipe Holland untuk divisualisasikan.")
+
+# Analisis per kelas & angkatan (dari tabel agregat, bukan baris hasil)
+st.subheader("📚 Analisis per Kelas & Angkatan")
+if class_summary:
+    df_classes = pd.DataFrame([
+        {
+            'Kelas': row['class_name'] or 'Tidak Ada Kelas',
+            'Jumlah Siswa': row['student_count'],
+            'Tes Selesai': row['completed_count'],
+            'Penyelesaian (%)': round(row['completion_rate'] * 100, 1),
+            **{t: round(v, 3) for t, v in row['avg_profile'].items()},
+        }
+        for row in class_summary
+    ])
+    st.dataframe(df_classes, use_container_width=True, hide_index=True)
+
+    ccol1, ccol2 = st.columns(2)
+    with ccol1:
+        fig_completion = px.bar(df_classes, x='Kelas', y='Penyelesaian (%)',
+                                title="Tingkat Penyelesaian per Kelas",
+                                color='Penyelesaian (%)', color_continuous_scale='viridis')
+        st.plotly_chart(fig_completion, use_container_width=True)
+    with ccol2:
+        df_profile = df_classes.melt(id_vars='Kelas', value_vars=list(RIASEC_TYPES),
+                                     var_name='Tipe Holland', value_name='Rata-rata Skor')
+        fig_profile = px.bar(df_profile, x='Kelas', y='Rata-rata Skor', color='Tipe Holland',
+                             barmode='group', title="Rata-rata Profil RIASEC per Kelas")
+        st.plotly_chart(fig_profile, use_container_width=True)
+
+    class_labels = {row['class_name'] or 'Tidak Ada Kelas': row['class_name'] for row in class_summary}
+    selected_cohort = st.selectbox("Distribusi Jurusan untuk", options=['Semua Kelas'] + list(class_labels))
+    major_counts_class = load_class_major_counts(conn, class_labels.get(selected_cohort))
+    if major_counts_class:
+        df_class_majors = pd.DataFrame([
+            {'Jurusan': row['recommended_major'] or 'N/A', 'Jumlah': row['count']}
+            for row in major_counts_class
+        ])
+        fig_class = px.bar(df_class_majors, x='Jurusan', y='Jumlah',
+                           title=f"Distribusi Jurusan - {selected_cohort}")
+        st.plotly_chart(fig_class, use_container_width=True)
+
+daily = load_daily_summary(conn)
+if daily:
+    df_daily = pd.DataFrame([
+        {'Tanggal': row['day'], 'Tes Selesai': row['completed_count']} for row in daily
+    ])
+    fig_daily = px.line(df_daily, x='Tanggal', y='Tes Selesai', markers=True,
+                        title="Tes Selesai per Hari")
+    st.plotly_chart(fig_daily, use_container_width=True)
+
+# Detail hasil individual (siswa pada halaman yang sedang ditampilkan)
 st.markdown("---")
 st.subheader("🔍 Detail Hasil Individual")
 
-if results_data:
+if page_rows:
     student_options = {
         f"{row.get('full_name')} ({row.get('class_name') or 'N/A'})": i
-        for i, row in enumerate(results_data)
+        for i, row in enumerate(page_rows)
     }
     selected_student = st.selectbox("Pilih Siswa untuk Melihat Detail", options=list(student_options.keys()))
 
     if selected_student:
         student_index = student_options[selected_student]
-        student_data = results_data[student_index]
+        student_data = page_rows[student_index]
 
         dcol1, dcol2 = st.columns(2)
 
@@ -372,19 +327,13 @@ if results_data:
         st.subheader("📝 Riwayat Jawaban Per Butir Soal")
         
         student_id = student_data.get('student_id')
-        if student_id:
-            cursor.execute('''
-                SELECT q.id, q.question_text, q.holland_type, sa.answer
-                FROM student_answers sa
-                JOIN questions q ON sa.question_id = q.id
-                WHERE sa.student_id = ?
-                ORDER BY q.id
-            ''', (student_id,))
-            answers_detail = cursor.fetchall()
-            
+        # Jawaban dimuat hanya saat diminta
+        if student_id and st.toggle("Tampilkan riwayat jawaban", key=f"answers_{student_id}"):
+            answers_detail = load_answer_details(conn, student_id)
+
             if answers_detail:
                 df_answers = pd.DataFrame(answers_detail, columns=['ID', 'Pertanyaan', 'Tipe', 'Jawaban'])
-                
+
                 st.dataframe(df_answers, use_container_width=True, hide_index=True)
                 
                 # RIASEC Summary
@@ -0,0 +1,60 @@
+import numpy as np
+import sys
+import os
+import time
+from scipy.linalg import eig
+
+# Menambahkan direktori root ke sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.anp import ANPProcessor
+
+
+def eig_priority(matrix):
+    """Versi lama calculate_priority (scipy.linalg.eig penuh) sebagai pembanding"""
+    eigenvalues, eigenvectors = eig(matrix)
+    max_idx = np.argmax(eigenvalues.real)
+    vec = eigenvectors[:, max_idx].real
+    return np.abs(vec / np.sum(vec)), float(eigenvalues[max_idx].real)
+
+
+def best_time(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_priority(sizes=(8, 100, 500, 1000)):
+    print("=== Benchmark Solver Eigenvector Prioritas ===")
+    processor = ANPProcessor()
+    rng = np.random.default_rng(7)
+    choices = [0.0, 0.1, 0.3, 0.5, 0.7, 0.9, 1.0, 2.5]
+
+    print(f"\n{'n':>6} {'eig (s)':>12} {'power (s)':>12} {'speedup':>9} {'max |dw|':>11} {'|d lambda|':>11}")
+    for n in sizes:
+        matrix = processor._pairwise_from_scores(rng.choice(choices, n))
+        repeat = 5 if n <= 500 else 2
+
+        t_eig = best_time(lambda: eig_priority(matrix), repeat)
+        t_new = best_time(lambda: processor.calculate_priority(matrix), repeat)
+
+        w_ref, l_ref = eig_priority(matrix)
+        w_new, l_new = processor.calculate_priority(matrix)
+        print(
+            f"{n:>6} {t_eig:>12.5f} {t_new:>12.5f} {t_eig / t_new:>8.1f}x "
+            f"{np.abs(w_ref - w_new).max():>11.2e} {abs(l_ref - l_new):>11.2e}"
+        )
+
+    print("\nBatch 6 kriteria sekaligus (tensor 6 x n x n):")
+    for n in sizes:
+        tensor = processor._pairwise_from_scores(rng.choice(choices, (6, n)))
+        repeat = 3 if n <= 500 else 1
+        t_eig = best_time(lambda: [eig_priority(m) for m in tensor], repeat)
+        t_new = best_time(lambda: processor.calculate_priority_batch(tensor), repeat)
+        print(f"{n:>6} {t_eig:>12.5f} {t_new:>12.5f} {t_eig / t_new:>8.1f}x")
+
+if __name__ == "__main__":
+    bench_priority()
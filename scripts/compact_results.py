@@ -0,0 +1,71 @@
+
+import os
+import sys
+import time
+import argparse
+
+# Menambahkan directory root ke sys.path agar bisa import module lokal
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from database.db_manager import DatabaseManager
+from database.exame_system import upgrade_legacy_results
+from services.result_store import compact_stored_results
+
+
+def compact_all_results(batch_size=500, vacuum=False):
+    """
+    Migrasi test_results.anp_results lama (ranking lengkap + profil semua jurusan
+    per siswa) ke payload ringkas yang merujuk model_versions dan result_rankings.
+    Aman dijalankan berulang: baris yang sudah ringkas dilewati.
+    """
+    print("=== Memulai Migrasi Payload Hasil Ringkas ===")
+
+    db_manager = DatabaseManager()
+    totals = {'compacted': 0, 'skipped': 0, 'bytes_before': 0, 'bytes_after': 0}
+    last_id = 0
+    started = time.perf_counter()
+
+    # Peringkasan merujuk result_rankings; lengkapi dulu baris lama yang belum ter-normalisasi
+    with db_manager.connection() as conn:
+        upgraded = upgrade_legacy_results(conn.cursor())
+    if upgraded:
+        print(f"  > {upgraded} hasil lama dinormalisasi")
+
+    while last_id is not None:
+        # Satu transaksi per potongan agar penulis lain tidak tertahan lama
+        with db_manager.connection() as conn:
+            stats = compact_stored_results(conn, last_id, batch_size)
+        last_id = stats.pop('last_id')
+        for key, value in stats.items():
+            totals[key] += value
+        if last_id is not None:
+            print(f"  > s/d siswa {last_id}: {totals['compacted']} diringkas, {totals['skipped']} dilewati")
+
+    if vacuum:
+        print("Menjalankan VACUUM untuk mengembalikan ruang kosong...")
+        conn = db_manager.get_connection()
+        try:
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+
+    elapsed = time.perf_counter() - started
+    saved = totals['bytes_before'] - totals['bytes_after']
+    print("\n=== Migrasi Selesai ===")
+    print(f"Diringkas    : {totals['compacted']}")
+    print(f"Dilewati     : {totals['skipped']}")
+    print(f"Ukuran JSON  : {totals['bytes_before'] / 1024:.1f} KB -> {totals['bytes_after'] / 1024:.1f} KB "
+          f"(hemat {saved / 1024:.1f} KB)")
+    print(f"Waktu        : {elapsed:.2f} detik")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ringkas payload anp_results lama di test_results')
+    parser.add_argument('--batch-size', type=int, default=500, help='Jumlah baris per transaksi')
+    parser.add_argument('--vacuum', action='store_true', help='Jalankan VACUUM setelah migrasi')
+    args = parser.parse_args()
+
+    compact_all_results(batch_size=args.batch_size, vacuum=args.vacuum)
+
+if __name__ == "__main__":
+    main()
@@ -9,7 +9,9 @@ def get_detailed_calculation():
     
     # Ambil 1 siswa
     cursor.execute('''
-        SELECT u.full_name, tr.holland_scores, tr.anp_results 
+        SELECT u.full_name, tr.anp_results, tr.student_id,
+               tr.realistic_score, tr.investigative_score, tr.artistic_score,
+               tr.social_score, tr.enterprising_score, tr.conventional_score
         FROM test_results tr 
         JOIN users u ON tr.student_id = u.id 
         LIMIT 1
@@ -20,15 +22,21 @@ def get_detailed_calculation():
         return
 
     name = row[0]
-    scores = json.loads(row[1]) if isinstance(row[1], str) else row[1]
-    anp = json.loads(row[2]) if isinstance(row[2], str) else row[2]
+    student_id = row[2]
+    scores = dict(zip(
+        ['Realistic', 'Investigative', 'Artistic', 'Social', 'Enterprising', 'Conventional'],
+        row[3:]
+    ))
+    anp = json.loads(row[1]) if isinstance(row[1], str) else row[1]
     
     print(f"=== PERHITUNGAN LENGKAP ANP: {name} ===")
     print("\n1. SKOR RIASEC (CRITERIA SCORES)")
     for k, v in scores.items():
         print(f"   - {k}: {v}")
     
-    details = anp.get('calculation_details', {})
+    # Payload ringkas ('anp'), format bertingkat ('anp_results') maupun datar
+    core = anp.get('anp') or anp.get('anp_results') or anp
+    details = core.get('calculation_details', {})
     
     print("\n2. BOBOT PRIORITAS KRITERIA (CRITERIA WEIGHTS)")
     cp = details.get('criteria_priorities', {})
@@ -39,10 +47,13 @@ def get_detailed_calculation():
     print(f"   Status: {'Konsisten' if details.get('is_consistent') else 'Tidak Konsisten'}")
     
     print("\n4. TOP 5 REKOMENDASI JURUSAN (FINAL PRIORITY)")
-    ranked = anp.get('top_5_majors', [])
-    for i, item in enumerate(ranked, 1):
-        major = item.get('major_name')
-        score = item.get('anp_score')
+    cursor.execute('''
+        SELECT rank, major_name, anp_score
+        FROM result_rankings
+        WHERE student_id = ? AND rank <= 5
+        ORDER BY rank
+    ''', (student_id,))
+    for i, major, score in cursor.fetchall():
         print(f"   {i}. {major}: {score:.4f}")
 
     conn.close()
@@ -1,27 +1,22 @@
 import sqlite3
-import json
 import pandas as pd
 
 def get_gusti_top_5():
     conn = sqlite3.connect('exam_system.db')
     cursor = conn.cursor()
     
-    # Get top 5 major names from anp_results for Gusti Ayul Asischa
+    # Top 5 jurusan Gusti Ayul Asischa langsung dari result_rankings
     cursor.execute('''
-        SELECT tr.anp_results 
-        FROM test_results tr 
-        JOIN users u ON tr.student_id = u.id 
-        WHERE u.full_name = 'Gusti Ayul Asischa'
+        SELECT rr.major_name
+        FROM result_rankings rr
+        JOIN users u ON rr.student_id = u.id
+        WHERE u.full_name = 'Gusti Ayul Asischa' AND rr.rank <= 5
+        ORDER BY rr.rank
     ''')
-    row = cursor.fetchone()
-    if not row:
+    major_names = [row[0] for row in cursor.fetchall()]
+    if not major_names:
         print("Student Gusti Ayul Asischa not found in test_results.")
         return
-
-    anp_results = json.loads(row[0])
-    top_5 = anp_results.get('top_5_majors', [])
-    
-    major_names = [m['major_name'] for m in top_5]
     
     print("Top 5 Majors for Gusti Ayul Asischa:")
     
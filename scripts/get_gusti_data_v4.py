@@ -1,5 +1,4 @@
 import sqlite3
-import json
 import pandas as pd
 
 def get_student_top_5():
@@ -8,7 +7,7 @@ def get_student_top_5():
     
     student_name = 'Gusti Ayul Asischa'
     cursor.execute('''
-        SELECT u.full_name, tr.anp_results 
+        SELECT u.id, u.full_name 
         FROM test_results tr 
         JOIN users u ON tr.student_id = u.id 
         WHERE u.full_name LIKE ?
@@ -19,19 +18,17 @@ def get_student_top_5():
         print("Student not found.")
         return
 
-    name, combined_str = row
-    combined_json = json.loads(combined_str)
-    
-    # Structure is: combined_json['anp_results']['top_5_majors']
-    anp_core = combined_json.get('anp_results', {})
-    top_5 = anp_core.get('top_5_majors', [])
+    student_id, name = row
+    cursor.execute('''
+        SELECT major_name, anp_score
+        FROM result_rankings
+        WHERE student_id = ? AND rank <= 5
+        ORDER BY rank
+    ''', (student_id,))
+    top_5 = [{'major_name': major, 'anp_score': score} for major, score in cursor.fetchall()]
     
     if not top_5:
-        print("No top 5 recommendations found in JSON.")
-        # Debug: list keys
-        print(f"Keys available: {combined_json.keys()}")
-        if 'anp_results' in combined_json:
-             print(f"Sub-keys available: {combined_json['anp_results'].keys()}")
+        print("No top 5 recommendations found in result_rankings.")
         return
 
     major_names = [m['major_name'].strip() for m in top_5]
@@ -1,68 +1,198 @@
-
 import os
 import sys
 import json
-import sqlite3
-from datetime import datetime
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # Menambahkan directory root ke sys.path agar bisa import module lokal
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from database.db_manager import DatabaseManager
 from utils.holland_calculator import HollandCalculator
+from utils.anp import ANPProcessor
+
+DEFAULT_CHECKPOINT = "recalculate_checkpoint.json"
+DEFAULT_TOTAL_ITEMS = 60
+
+_worker_calculator = None
+
+
+def _compute_chunk(student_ids, total_items):
+    """Dijalankan di worker: hitung hasil satu potongan siswa tanpa menulis ke DB"""
+    global _worker_calculator
+    if _worker_calculator is None:
+        _worker_calculator = HollandCalculator()
+    results, records = _worker_calculator.compute_test_completion_batch(student_ids, total_items)
+    summary = [(r['student_id'], r['recommended_major']) for r in results]
+    return student_ids, records, summary
+
+
+def load_students(cursor, class_name=None, since=None):
+    """
+    Ambil siswa yang punya jawaban (opsional filter kelas / tanggal jawaban) dalam satu query.
+    Returns: [(id, nama, total_items lama, sudah punya hasil)]
+    """
+    answer_filter = "AND sa.created_at >= ?" if since else ""
+    class_filter = "AND u.class_name = ?" if class_name else ""
+    params = [p for p in (since, class_name) if p]
+
+    cursor.execute(f'''
+        SELECT u.id, u.full_name, tr.total_items, tr.student_id IS NOT NULL
+        FROM users u
+        LEFT JOIN test_results tr ON tr.student_id = u.id
+        WHERE EXISTS (
+            SELECT 1 FROM student_answers sa
+            WHERE sa.student_id = u.id {answer_filter}
+        ) {class_filter}
+        ORDER BY u.id
+    ''', params)
+    return cursor.fetchall()
+
+
+def load_checkpoint(path, filters):
+    """Baca ID yang sudah selesai dari checkpoint bila filternya sama"""
+    if not os.path.exists(path):
+        return set()
+    try:
+        with open(path) as fh:
+            data = json.load(fh)
+    except (OSError, ValueError):
+        return set()
+    if data.get('filters') != filters:
+        print("Checkpoint diabaikan: filter berbeda dengan run sebelumnya.")
+        return set()
+    return set(data.get('completed', []))
+
+
+def save_checkpoint(path, filters, completed):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as fh:
+        json.dump({'filters': filters, 'completed': sorted(completed)}, fh)
+    os.replace(tmp_path, path)
+
+
+def chunked(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
 
-def recalculate_all_results():
+def recalculate_all_results(class_name=None, since=None, dry_run=False, workers=None,
+                            chunk_size=200, checkpoint=DEFAULT_CHECKPOINT, restart=False):
     print("=== Memulai Kalkulasi Ulang Jawaban Siswa ===")
-    
+
     db_manager = DatabaseManager()
-    conn = db_manager.get_connection()
-    cursor = conn.cursor()
-    
-    # 1. Ambil semua student_id yang sudah memberikan jawaban
-    cursor.execute("SELECT DISTINCT student_id FROM student_answers")
-    student_ids = [row[0] for row in cursor.fetchall()]
-    
-    if not student_ids:
+    # 1. Ambil semua siswa yang sudah memberikan jawaban (beserta nama & total_items lama)
+    with db_manager.connection() as conn:
+        students = load_students(conn.cursor(), class_name, since)
+
+    if not students:
         print("Tidak ada data jawaban siswa untuk dihitung ulang.")
-        conn.close()
         return
 
-    print(f"Ditemukan {len(student_ids)} siswa dengan jawaban.")
-    
+    filters = {'class': class_name, 'since': since}
+    completed = set() if (restart or dry_run) else load_checkpoint(checkpoint, filters)
+    names = {sid: name for sid, name, _, _ in students}
+    # total_items lama dipertahankan (termasuk NULL); default 60 hanya bila belum ada hasil
+    total_items = {sid: items if has_result else DEFAULT_TOTAL_ITEMS
+                   for sid, _, items, has_result in students}
+    pending = [sid for sid, _, _, _ in students if sid not in completed]
+
+    print(f"Ditemukan {len(students)} siswa dengan jawaban.")
+    if completed:
+        print(f"Melanjutkan dari checkpoint: {len(students) - len(pending)} siswa sudah selesai.")
+    if not pending:
+        print("Semua siswa sudah diproses.")
+        return
+
+    workers = max(1, workers or os.cpu_count() or 1)
+    chunks = list(chunked(pending, chunk_size))
+    workers = min(workers, len(chunks))
+    print(f"Memproses {len(pending)} siswa dalam {len(chunks)} potongan dengan {workers} worker"
+          f"{' (dry-run, tidak menulis ke DB)' if dry_run else ''}.")
+
+    # Hangatkan cache prioritas alternatif sekali sebelum worker dimulai.
+    # Tanpa data jurusan tidak ada yang di-cache; hasil tetap dihitung tanpa rekomendasi.
+    anp = ANPProcessor()
+    try:
+        major_map = anp.load_majors_from_db()
+    except RuntimeError as e:
+        print(f"Peringatan: {e} Cache prioritas alternatif dilewati.")
+    else:
+        anp.compute_alternative_priorities(major_map)
+
     calculator = HollandCalculator()
-    
     success_count = 0
     fail_count = 0
-    
-    for student_id in student_ids:
-        # Ambil nama siswa untuk log
-        cursor.execute("SELECT full_name FROM users WHERE id = ?", (student_id,))
-        user_row = cursor.fetchone()
-        student_name = user_row[0] if user_row else f"Unknown (ID: {student_id})"
-        
-        # Ambil total_items lama jika ada
-        cursor.execute("SELECT total_items FROM test_results WHERE student_id = ?", (student_id,))
-        result_row = cursor.fetchone()
-        total_items = result_row[0] if result_row else 60 # Default ke 60 jika tidak ada
-        
-        print(f"Memproses [{student_id}] {student_name}...")
-        
-        try:
-            # Jalankan kalkulasi ulang
-            # process_test_completion akan menghitung skor, menjalankan ANP, dan menyimpan ke DB
-            results = calculator.process_test_completion(student_id, total_items=total_items)
-            print(f"  > Sukses: Rekomendasi -> {results['recommended_major']}")
-            success_count += 1
-        except Exception as e:
-            print(f"  > GAGAL memproses {student_name}: {str(e)}")
-            fail_count += 1
-            
-    conn.close()
-    
+    started = time.perf_counter()
+
+    def handle(student_ids, records, summary):
+        # Writer tunggal: satu executemany upsert per potongan, lalu checkpoint
+        nonlocal success_count
+        if not dry_run:
+            calculator.save_test_results_bulk(records)
+            completed.update(student_ids)
+            save_checkpoint(checkpoint, filters, completed)
+        else:
+            for sid, major in summary[:3]:
+                print(f"  > [{sid}] {names.get(sid)}: Rekomendasi -> {major}")
+        success_count += len(student_ids)
+        elapsed = time.perf_counter() - started
+        print(f"  > {success_count + fail_count}/{len(pending)} siswa "
+              f"({success_count / elapsed:.1f} siswa/detik)")
+
+    if workers == 1:
+        for chunk in chunks:
+            try:
+                handle(*_compute_chunk(chunk, total_items))
+            except Exception as e:
+                print(f"  > GAGAL memproses potongan {chunk[0]}..{chunk[-1]}: {str(e)}")
+                fail_count += len(chunk)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(_compute_chunk, chunk, {sid: total_items[sid] for sid in chunk}): chunk
+                for chunk in chunks
+            }
+            for future in as_completed(futures):
+                chunk = futures[future]
+                try:
+                    handle(*future.result())
+                except Exception as e:
+                    print(f"  > GAGAL memproses potongan {chunk[0]}..{chunk[-1]}: {str(e)}")
+                    fail_count += len(chunk)
+
+    elapsed = time.perf_counter() - started
+    if not dry_run and fail_count == 0 and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
     print("\n=== Kalkulasi Ulang Selesai ===")
-    print(f"Total diproses: {len(student_ids)}")
+    print(f"Total diproses: {len(pending)}")
     print(f"Berhasil     : {success_count}")
     print(f"Gagal        : {fail_count}")
+    print(f"Throughput   : {len(pending) / elapsed:.1f} siswa/detik ({elapsed:.2f} detik)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Kalkulasi ulang hasil tes semua siswa (paralel)')
+    parser.add_argument('--class', dest='class_name', help='Hanya siswa pada kelas ini')
+    parser.add_argument('--since', help='Hanya siswa dengan jawaban sejak tanggal ini (YYYY-MM-DD)')
+    parser.add_argument('--dry-run', action='store_true', help='Hitung tanpa menyimpan ke database')
+    parser.add_argument('--workers', type=int, default=None, help='Jumlah proses worker (default: jumlah core)')
+    parser.add_argument('--chunk-size', type=int, default=200, help='Jumlah siswa per potongan kerja')
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT, help='File checkpoint untuk melanjutkan run')
+    parser.add_argument('--restart', action='store_true', help='Abaikan checkpoint dan mulai dari awal')
+    args = parser.parse_args()
+
+    recalculate_all_results(
+        class_name=args.class_name,
+        since=args.since,
+        dry_run=args.dry_run,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        checkpoint=args.checkpoint,
+        restart=args.restart,
+    )
 
 if __name__ == "__main__":
-    recalculate_all_results()
+    main()
@@ -7,6 +7,74 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from utils.anp import ANPProcessor
 
+
+# ================= REFERENSI SUPERMATRIX PENUH =================
+# Runtime memakai limit berstruktur (ANPProcessor.limit_alternative_priorities);
+# fungsi di bawah membangun supermatrix lengkap hanya untuk memverifikasinya.
+def build_supermatrix(processor, criteria_weights, alt_weights):
+    """Bangun Supermatrix (Pure ANP)"""
+    n_c = len(processor.riasec_types)
+    n_a = len(next(iter(alt_weights.values())))
+    size = n_c + n_a
+    S = np.zeros((size, size))
+
+    # W11: Inner Dependency (Feedback/Influence antar kriteria)
+    # Menggunakan matriks korelasi Holland Hexagon dikalikan bobot kriteria
+    for j in range(n_c):
+        for i in range(n_c):
+            S[i, j] = processor.holland_correlation[i, j] * criteria_weights[i]
+
+    # W21: Alternatif terhadap Kriteria
+    for j, crit in enumerate(processor.riasec_types):
+        weights = alt_weights[crit]
+        for i in range(n_a):
+            S[n_c+i, j] = weights[i]
+
+    # W12: Feedback (Kriteria terhadap Alternatif)
+    for j in range(n_a):
+        for i in range(n_c):
+            S[i, n_c+j] = criteria_weights[i]
+
+    # Normalisasi kolom agar stochastic
+    for j in range(size):
+        col_sum = S[:,j].sum()
+        if col_sum > 0:
+            S[:,j] /= col_sum
+    return S
+
+
+def stationary_vector(M, start=0, tol=1e-12, max_iter=1000):
+    """
+    Hitung kolom limit supermatrix dengan power iteration pada satu vektor.
+
+    Supermatrix kolom-stokastik yang primitif memiliki limit M^k -> v 1^T,
+    sehingga cukup mengiterasi v = M v dari kolom awal `start` hingga
+    perubahan (norma L1) di bawah `tol`.
+
+    Returns:
+        (vector, iterations, residual, converged)
+    """
+    v = np.asarray(M[:, start], dtype=float).copy()
+    residual = np.inf
+    iterations = 0
+    for iterations in range(1, max_iter + 1):
+        nxt = M @ v
+        total = nxt.sum()
+        if total > 0:
+            nxt /= total
+        residual = float(np.abs(nxt - v).sum())
+        v = nxt
+        if residual < tol:
+            break
+    return v, iterations, residual, residual < tol
+
+
+def limit_supermatrix(M, tol=1e-12, max_iter=1000):
+    """Hitung Limit Supermatrix (semua kolom sama dengan vektor stasioner)"""
+    v, _, _, _ = stationary_vector(M, tol=tol, max_iter=max_iter)
+    return np.tile(v[:, None], (1, M.shape[1]))
+
+
 def verify_anp_logic():
     print("=== Memulai Verifikasi Logika ANP ===")
     
@@ -29,7 +97,7 @@ def verify_anp_logic():
     }
     criteria_weights = np.array([0.3, 0.3, 0.1, 0.1, 0.1, 0.1])
     
-    supermatrix = processor.build_supermatrix(criteria_weights, dummy_alt_weights)
+    supermatrix = build_supermatrix(processor, criteria_weights, dummy_alt_weights)
     
     print("   - Mengecek blok W11 (Inner Dependency)...")
     w11_block = supermatrix[0:6, 0:6]
@@ -44,7 +112,7 @@ def verify_anp_logic():
         return False
 
     print("\n2. Menjalankan Limit Supermatrix...")
-    limit_matrix = processor.limit_supermatrix(supermatrix)
+    limit_matrix = limit_supermatrix(supermatrix)
     
     # Cek konvergensi (kolom harus identik/hampir sama dalam limit)
     col1 = limit_matrix[:, 0]
@@ -63,6 +131,37 @@ def verify_anp_logic():
         print(f"   [ERROR] Gagal menghitung skor ANP: {e}")
         return False
 
+    print("\n4. Membandingkan Jalur Batch dengan Jalur Tunggal...")
+    batch_scores = [
+        dummy_scores,
+        {t: 0.0 for t in processor.riasec_types},
+        {'Realistic': 1.0, 'Investigative': 0.2, 'Artistic': 0.0, 'Social': 0.7, 'Enterprising': 0.1, 'Conventional': 0.9},
+    ]
+    rows = [[s[t] for t in processor.riasec_types] for s in batch_scores]
+    batch_results = processor.calculate_anp_scores_batch(rows)
+    for scores, batch_result in zip(batch_scores, batch_results):
+        single = processor.calculate_anp_scores(scores)
+        single_rank = [(m, d['anp_score']) for m, d in single['ranked_majors']]
+        batch_rank = [(m, d['anp_score']) for m, d in batch_result['ranked_majors']]
+        if single_rank != batch_rank:
+            print("   [ERROR] Ranking batch berbeda dengan jalur tunggal.")
+            return False
+    print(f"   [OK] {len(batch_scores)} siswa: ranking batch identik dengan jalur tunggal.")
+
+    print("\n5. Membandingkan Limit Berstruktur dengan Supermatrix Penuh...")
+    major_map = processor.load_majors_from_db()
+    alt_priorities, names = processor.compute_alternative_priorities(major_map)
+    weights = np.array([results['calculation_details']['criteria_priorities'][t] for t in processor.riasec_types])
+    full = limit_supermatrix(build_supermatrix(processor, weights, alt_priorities))[6:, 0]
+    full = full / full.sum()
+    structured = {m: d['anp_score'] for m, d in results['ranked_majors']}
+    diff = max(abs(full[i] - structured[m]) for i, m in enumerate(names))
+    if diff < 1e-9:
+        print(f"   [OK] Selisih maksimum {diff:.2e}.")
+    else:
+        print(f"   [ERROR] Selisih terlalu besar ({diff:.2e}).")
+        return False
+
     print("\n=== Verifikasi Selesai: SEMUA LOGIKA VALID ===")
     return True
 
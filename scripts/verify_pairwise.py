@@ -0,0 +1,92 @@
+import numpy as np
+import sys
+import os
+
+# Menambahkan direktori root ke sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.anp import ANPProcessor
+
+
+# ================= REFERENSI (VERSI LOOP LAMA) =================
+def reference_criteria_pairwise(riasec_types, riasec_scores):
+    size = len(riasec_types)
+    matrix = np.ones((size, size))
+    scores = [max(float(riasec_scores.get(c, 0)), 1e-4) for c in riasec_types]
+
+    for i in range(size):
+        for j in range(i+1, size):
+            ratio = scores[i] / scores[j]
+            ratio = np.clip(ratio, 1/9, 9)
+            matrix[i,j] = ratio
+            matrix[j,i] = 1/ratio
+    return matrix
+
+
+def reference_alt_pairwise(major_map, criterion):
+    majors = list(major_map.keys())
+    n = len(majors)
+    matrix = np.ones((n, n))
+    scores = [major_map[m][criterion] for m in majors]
+
+    for i in range(n):
+        for j in range(i+1, n):
+            if scores[j] == 0:
+                ratio = 9 if scores[i] > 0 else 1
+            else:
+                ratio = scores[i] / scores[j]
+            ratio = np.clip(ratio, 1/9, 9)
+            matrix[i,j] = ratio
+            matrix[j,i] = 1/ratio
+    return matrix, majors
+
+
+def random_major_map(rng, n, riasec_types):
+    # Campuran nilai nol, nilai kecil, dan nilai besar agar aturan 9/1 serta clipping teruji
+    choices = [0.0, 0.0, 0.01, 0.1, 0.3, 0.5, 0.9, 1.0, 2.5, 10.0]
+    return {
+        f"Major {i}": {t: float(rng.choice(choices)) for t in riasec_types}
+        for i in range(n)
+    }
+
+
+def verify_pairwise():
+    print("=== Memulai Verifikasi Pairwise Vektorisasi ===")
+
+    processor = ANPProcessor()
+    types = processor.riasec_types
+    rng = np.random.default_rng(42)
+
+    print("\n1. Matriks kriteria (6x6)...")
+    for _ in range(200):
+        scores = {t: float(v) for t, v in zip(types, rng.choice([0.0, 1e-5, 0.2, 0.5, 1.0, 3.0], 6))}
+        expected = reference_criteria_pairwise(types, scores)
+        actual = processor.build_criteria_pairwise(scores)
+        if not np.array_equal(expected, actual):
+            print(f"   [ERROR] Berbeda untuk skor {scores}")
+            return False
+    print("   [OK] 200 kasus identik.")
+
+    print("\n2. Matriks alternatif per kriteria...")
+    for n in (1, 2, 8, 57):
+        major_map = random_major_map(rng, n, types)
+        tensor, tensor_majors = processor.build_alt_pairwise_tensor(major_map)
+        for k, crit in enumerate(types):
+            expected, majors = reference_alt_pairwise(major_map, crit)
+            actual, actual_majors = processor.build_alt_pairwise_by_criterion(major_map, crit)
+            if majors != actual_majors or majors != tensor_majors:
+                print(f"   [ERROR] Urutan jurusan berbeda (n={n})")
+                return False
+            if not np.array_equal(expected, actual) or not np.array_equal(expected, tensor[k]):
+                print(f"   [ERROR] Matriks berbeda (n={n}, kriteria={crit})")
+                return False
+        print(f"   [OK] n={n}: keenam kriteria identik (tensor {tensor.shape}).")
+
+    print("\n=== Verifikasi Selesai: PAIRWISE IDENTIK ===")
+    return True
+
+if __name__ == "__main__":
+    if verify_pairwise():
+        sys.exit(0)
+    else:
+        sys.exit(1)
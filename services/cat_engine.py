@@ -1,9 +1,90 @@
+import json
+import os
 import random
-from typing import Dict, List, Optional
+import threading
+import time
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional
 
 from database.db_manager import DatabaseManager
 
 
+# Selang minimal (detik) antar pengecekan revisi soal di database.
+# Perubahan dari proses ini sendiri langsung membatalkan cache lewat
+# invalidate_question_bank(); pengecekan revisi menangkap perubahan dari proses lain.
+REVISION_CHECK_INTERVAL = float(os.environ.get("HOLLAND_QUESTION_CHECK_INTERVAL", "5"))
+
+# Jumlah jawaban yang ditampung di sesi sebelum ditulis ke database
+ANSWER_FLUSH_SIZE = int(os.environ.get("HOLLAND_ANSWER_FLUSH_SIZE", "5"))
+
+UPSERT_ANSWER_SQL = """
+    INSERT INTO student_answers (student_id, question_id, answer, question_order, response_time)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(student_id, question_id) DO UPDATE SET
+        answer = excluded.answer,
+        question_order = excluded.question_order,
+        response_time = excluded.response_time
+"""
+
+UPSERT_SESSION_SQL = """
+    INSERT INTO test_sessions (student_id, question_order, current_index, started_at, updated_at)
+    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT(student_id) DO UPDATE SET
+        question_order = excluded.question_order,
+        current_index = excluded.current_index,
+        started_at = excluded.started_at,
+        updated_at = CURRENT_TIMESTAMP
+"""
+
+_bank_lock = threading.Lock()
+_bank_cache = {'db_path': None, 'revision': None, 'bank': None, 'checked_at': 0.0}
+
+
+def invalidate_question_bank():
+    """Buang cache bank soal bersama (dipanggil setelah tabel questions diubah)"""
+    with _bank_lock:
+        _bank_cache.update(db_path=None, revision=None, bank=None, checked_at=0.0)
+
+
+def get_question_bank(db: Optional[DatabaseManager] = None) -> Mapping[int, Mapping]:
+    """
+    Bank soal bersama untuk seluruh sesi (read-only).
+
+    Dimuat ulang hanya bila revisi tabel questions berubah; di antara
+    pengecekan revisi tidak ada query SQL sama sekali.
+    """
+    db = db or DatabaseManager()
+    now = time.monotonic()
+    with _bank_lock:
+        cached = _bank_cache['bank']
+        if (cached is not None and _bank_cache['db_path'] == db.db_path
+                and now - _bank_cache['checked_at'] < REVISION_CHECK_INTERVAL):
+            return cached
+
+        with db.connection() as conn:
+            revision = db.get_revision('questions', conn)
+            if (cached is None or _bank_cache['db_path'] != db.db_path
+                    or _bank_cache['revision'] != revision):
+                rows = conn.execute(
+                    """
+                    SELECT id, question_text, holland_type
+                    FROM questions
+                    ORDER BY id
+                    """
+                ).fetchall()
+                cached = MappingProxyType({
+                    row[0]: MappingProxyType({
+                        'id': row[0],
+                        'question_text': row[1],
+                        'holland_type': row[2],
+                    })
+                    for row in rows
+                })
+
+        _bank_cache.update(db_path=db.db_path, revision=revision, bank=cached, checked_at=now)
+        return cached
+
+
 class CATHollandEngine:
     """
     Simplified Test Engine dengan Random Question Selection.
@@ -14,29 +95,9 @@ class CATHollandEngine:
         self.max_items = max_items
         self.question_bank = self._load_questions()
 
-    def _load_questions(self) -> Dict[int, Dict]:
-        """Load soal dari database - hanya ambil field yang diperlukan"""
-        db = DatabaseManager()
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT id, question_text, holland_type
-            FROM questions
-            ORDER BY id
-            """
-        )
-        rows = cursor.fetchall()
-        conn.close()
-
-        question_map = {}
-        for row in rows:
-            question_map[row[0]] = {
-                'id': row[0],
-                'question_text': row[1],
-                'holland_type': row[2],
-            }
-        return question_map
+    def _load_questions(self) -> Mapping[int, Mapping]:
+        """Ambil bank soal dari cache bersama (read-only, dimuat ulang saat soal berubah)"""
+        return get_question_bank()
 
     def initialize_session(self, student_id: int) -> Dict:
         """Inisialisasi sesi tes dengan urutan soal acak"""
@@ -52,16 +113,175 @@ class CATHollandEngine:
         return {
             'student_id': student_id,
             'answers': [],
+            'pending_answers': [],
             'asked_ids': [],
             'question_order': question_order,  # Urutan soal acak
             'current_index': 0,
             'current_question_id': initial_question_id,
             'question_start': None,
+            'started_at': time.time(),
             'completed': False,
             'result': None,
             'max_questions': len(question_order),  # Semua soal
         }
 
+    def start_session(self, student_id: int) -> Dict:
+        """Inisialisasi sesi baru dan simpan urutan soalnya ke test_sessions"""
+        session = self.initialize_session(student_id)
+        self.save_session(session)
+        return session
+
+    def save_session(self, session: Dict, conn=None, persisted: Optional[int] = None) -> None:
+        """
+        Upsert rekaman sesi (urutan soal, kursor jawaban tersimpan, waktu mulai).
+        persisted: jumlah jawaban yang sudah tersimpan; default semua kecuali isi buffer
+        """
+        if conn is None:
+            with DatabaseManager().connection() as conn:
+                return self.save_session(session, conn, persisted)
+
+        if persisted is None:
+            persisted = len(session['answers']) - len(session.get('pending_answers') or [])
+        conn.execute(
+            UPSERT_SESSION_SQL,
+            (
+                session['student_id'],
+                json.dumps(session['question_order'], separators=(',', ':')),
+                persisted,
+                session.get('started_at') or time.time(),
+            )
+        )
+
+    def resume_session(self, student_id: int) -> Dict:
+        """
+        Pulihkan sesi dari test_sessions dan student_answers (dua query).
+        Soal yang sudah dijawab ditempatkan di awal urutan sesuai question_order;
+        bila belum ada rekaman sesi, sesi baru dibuat dan disimpan.
+        """
+        db = DatabaseManager()
+        with db.connection() as conn:
+            row = conn.execute(
+                "SELECT question_order, started_at FROM test_sessions WHERE student_id = ?",
+                (student_id,)
+            ).fetchone()
+            saved = self._fetch_saved_answers(conn, student_id)
+
+        if row is None and not saved:
+            return self.start_session(student_id)
+
+        session = self.initialize_session(student_id)
+        base_order = session['question_order']
+        if row is not None:
+            # Urutan tersimpan; soal yang dihapus dibuang, soal baru ditambahkan di akhir
+            stored = [qid for qid in json.loads(row[0]) if qid in self.question_bank]
+            stored_set = set(stored)
+            base_order = stored + [qid for qid in base_order if qid not in stored_set]
+            session['started_at'] = row[1]
+
+        saved = [a for a in saved if a['question_id'] in self.question_bank]
+        answered_ids = [a['question_id'] for a in saved]
+        answered_set = set(answered_ids)
+        remaining = [qid for qid in base_order if qid not in answered_set]
+        question_order = answered_ids + remaining
+
+        session.update({
+            'answers': saved,
+            'asked_ids': list(answered_ids),
+            'question_order': question_order,
+            'current_index': len(saved),
+            'current_question_id': remaining[0] if remaining else None,
+            'completed': not remaining,
+            'max_questions': len(question_order),
+        })
+        if row is None:
+            self.save_session(session)
+        return session
+
+    def load_saved_answers(self, student_id: int) -> List[Dict]:
+        """Ambil jawaban siswa yang sudah tersimpan, urut sesuai question_order"""
+        db = DatabaseManager()
+        with db.connection() as conn:
+            return self._fetch_saved_answers(conn, student_id)
+
+    def _fetch_saved_answers(self, conn, student_id: int) -> List[Dict]:
+        rows = conn.execute(
+            """
+            SELECT question_id, answer, question_order, response_time
+            FROM student_answers
+            WHERE student_id = ?
+            ORDER BY question_order, id
+            """,
+            (student_id,)
+        ).fetchall()
+        return [
+            {
+                'question_id': row[0],
+                'answer': row[1],
+                'question_order': order,
+                'response_time': row[3],
+            }
+            for order, row in enumerate(rows, 1)
+        ]
+
+    def record_answer(self, session: Dict, question_id: int, answer: int, response_time: float) -> Dict:
+        """
+        Catat jawaban ke sesi dan buffer tulis; buffer di-flush ke database
+        setiap ANSWER_FLUSH_SIZE jawaban.
+        """
+        entry = {
+            'question_id': question_id,
+            'answer': answer,
+            'question_order': len(session['answers']) + 1,
+            'response_time': response_time,
+        }
+        session['answers'].append(entry)
+        session['asked_ids'].append(question_id)
+        session.setdefault('pending_answers', []).append(entry)
+
+        if len(session['pending_answers']) >= ANSWER_FLUSH_SIZE:
+            self.flush_answers(session)
+        return entry
+
+    def flush_answers(self, session: Dict) -> int:
+        """Upsert jawaban di buffer dan majukan kursor sesi dalam satu transaksi"""
+        pending = session.get('pending_answers') or []
+        if not pending:
+            return 0
+
+        rows = [
+            (session['student_id'], e['question_id'], e['answer'], e['question_order'], e['response_time'])
+            for e in pending
+        ]
+        db = DatabaseManager()
+        with db.connection() as conn:
+            conn.executemany(UPSERT_ANSWER_SQL, rows)
+            cursor = conn.execute(
+                """
+                UPDATE test_sessions
+                SET current_index = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE student_id = ?
+                """,
+                (len(session['answers']), session['student_id'])
+            )
+            if cursor.rowcount == 0:
+                self.save_session(session, conn, persisted=len(session['answers']))
+        # Buffer dikosongkan setelah commit; bila commit gagal (mis. SQLITE_BUSY) jawaban tetap di buffer
+        del session['pending_answers'][:len(pending)]
+        return len(rows)
+
+    def reset_session(self, student_id: int) -> None:
+        """Hapus jawaban dan rekaman sesi siswa (untuk mengulang tes)"""
+        db = DatabaseManager()
+        with db.connection() as conn:
+            conn.execute('DELETE FROM student_answers WHERE student_id = ?', (student_id,))
+            conn.execute('DELETE FROM test_sessions WHERE student_id = ?', (student_id,))
+
+    def close_session(self, student_id: int) -> None:
+        """Hapus rekaman sesi setelah tes selesai diproses"""
+        db = DatabaseManager()
+        with db.connection() as conn:
+            conn.execute('DELETE FROM test_sessions WHERE student_id = ?', (student_id,))
+
     def get_question(self, question_id: int) -> Optional[Dict]:
         """Ambil data soal berdasarkan ID"""
         if question_id is None:
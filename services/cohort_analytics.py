@@ -0,0 +1,90 @@
+"""
+Analitik kelas dan angkatan dari tabel agregat class_summary,
+class_major_counts dan daily_summary (dijaga trigger di database).
+
+Setiap query membaca satu baris per kelas / jurusan / hari, bukan per siswa,
+sehingga waktu respon tidak bergantung pada jumlah hasil tes.
+"""
+from typing import Dict, List, Optional
+
+from database.exame_system import RESULT_SCORE_COLUMNS, RIASEC_TYPES
+
+
+def _average_profile(completed, sums) -> Dict[str, float]:
+    return {t: (s / completed if completed else 0.0) for t, s in zip(RIASEC_TYPES, sums)}
+
+
+def load_class_summary(conn) -> List[Dict]:
+    """
+    Ringkasan per kelas: jumlah siswa, tes selesai, tingkat penyelesaian
+    dan rata-rata profil RIASEC. Siswa tanpa kelas tercatat dengan class_name ''.
+    """
+    sums = ', '.join(f"{col}_sum" for col in RESULT_SCORE_COLUMNS)
+    rows = conn.execute(f"""
+        SELECT class_name, student_count, completed_count, {sums}
+        FROM class_summary
+        WHERE student_count > 0 OR completed_count > 0
+        ORDER BY class_name
+    """).fetchall()
+    return [
+        {
+            'class_name': class_name,
+            'student_count': students,
+            'completed_count': completed,
+            'completion_rate': completed / students if students else 0.0,
+            'avg_profile': _average_profile(completed, sums),
+        }
+        for class_name, students, completed, *sums in rows
+    ]
+
+
+def load_class_major_counts(conn, class_name: Optional[str] = None) -> List[Dict]:
+    """Jumlah rekomendasi per jurusan untuk satu kelas atau seluruh angkatan (None)"""
+    if class_name is None:
+        rows = conn.execute("""
+            SELECT recommended_major, SUM(student_count) AS total
+            FROM class_major_counts
+            GROUP BY recommended_major
+            HAVING total > 0
+            ORDER BY total DESC, recommended_major
+        """).fetchall()
+    else:
+        rows = conn.execute("""
+            SELECT recommended_major, student_count
+            FROM class_major_counts
+            WHERE class_name = ? AND student_count > 0
+            ORDER BY student_count DESC, recommended_major
+        """, (class_name,)).fetchall()
+    return [{'recommended_major': major, 'count': count} for major, count in rows]
+
+
+def load_daily_summary(conn, start: Optional[str] = None, end: Optional[str] = None) -> List[Dict]:
+    """
+    Jumlah tes selesai dan rata-rata profil RIASEC per hari.
+
+    Args:
+        start, end: batas tanggal 'YYYY-MM-DD' (inklusif), opsional
+    """
+    sums = ', '.join(f"{col}_sum" for col in RESULT_SCORE_COLUMNS)
+    rows = conn.execute(f"""
+        SELECT day, completed_count, {sums}
+        FROM daily_summary
+        WHERE completed_count > 0
+          AND (? IS NULL OR day >= ?)
+          AND (? IS NULL OR day <= ?)
+        ORDER BY day
+    """, (start, start, end, end)).fetchall()
+    return [
+        {'day': day, 'completed_count': completed, 'avg_profile': _average_profile(completed, sums)}
+        for day, completed, *sums in rows
+    ]
+
+
+def load_dominant_type_counts(conn) -> Dict[str, int]:
+    """Jumlah siswa per tipe Holland teratas (indeks test_results(top_type_1))"""
+    return dict(conn.execute("""
+        SELECT top_type_1, COUNT(*) FROM test_results
+        WHERE top_type_1 IS NOT NULL
+        GROUP BY top_type_1
+        ORDER BY COUNT(*) DESC, top_type_1
+    """).fetchall())
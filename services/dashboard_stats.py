@@ -0,0 +1,70 @@
+"""
+Statistik dashboard admin.
+
+Semua penghitung (siswa, tes selesai, soal, jurusan) dan total skor per tipe
+RIASEC dihitung dengan satu query dari kolom skor ter-normalisasi. Hasilnya
+di-cache bersama untuk seluruh sesi dan hanya dihitung ulang bila revisi salah
+satu tabel sumbernya berubah, sehingga rerun dashboard cukup membaca revisi.
+"""
+import threading
+from types import MappingProxyType
+from typing import Mapping, Optional
+
+from database.db_manager import DatabaseManager
+from database.exame_system import RESULT_SCORE_COLUMNS, RIASEC_TYPES
+
+# Tabel yang memengaruhi statistik dashboard
+DASHBOARD_SOURCE_TABLES = ('users', 'test_results', 'questions', 'majors')
+
+_stats_lock = threading.Lock()
+_stats_cache = {'db_path': None, 'revisions': None, 'stats': None}
+
+
+def _source_revisions(conn) -> tuple:
+    placeholders = ', '.join(['?'] * len(DASHBOARD_SOURCE_TABLES))
+    revisions = dict(conn.execute(
+        f"SELECT table_name, revision FROM data_revisions WHERE table_name IN ({placeholders})",
+        DASHBOARD_SOURCE_TABLES
+    ).fetchall())
+    return tuple(revisions.get(table, 0) for table in DASHBOARD_SOURCE_TABLES)
+
+
+def compute_dashboard_stats(conn) -> Mapping:
+    """Hitung semua statistik dashboard dengan satu query (tanpa cache)"""
+    sums = ', '.join(f"COALESCE(SUM({col}), 0)" for col in RESULT_SCORE_COLUMNS)
+    row = conn.execute(f"""
+        SELECT
+            (SELECT COUNT(*) FROM users WHERE role = 'student'),
+            (SELECT COUNT(*) FROM questions),
+            (SELECT COUNT(*) FROM majors),
+            tr.*
+        FROM (SELECT COUNT(*), {sums} FROM test_results) tr
+    """).fetchone()
+    total_students, total_questions, total_majors, completed_tests, *totals = row
+    return MappingProxyType({
+        'total_students': total_students,
+        'completed_tests': completed_tests,
+        'not_completed': total_students - completed_tests,
+        'total_questions': total_questions,
+        'total_majors': total_majors,
+        'holland_totals': MappingProxyType(dict(zip(RIASEC_TYPES, totals))),
+    })
+
+
+def get_dashboard_stats(db: Optional[DatabaseManager] = None) -> Mapping:
+    """
+    Statistik dashboard bersama (read-only).
+    Dihitung ulang hanya bila revisi users, test_results, questions atau majors berubah.
+    Lock hanya dipegang untuk membaca/memperbarui cache, tidak selama menunggu koneksi.
+    """
+    db = db or DatabaseManager()
+    with db.connection() as conn:
+        revisions = _source_revisions(conn)
+        with _stats_lock:
+            if (_stats_cache['stats'] is not None and _stats_cache['db_path'] == db.db_path
+                    and _stats_cache['revisions'] == revisions):
+                return _stats_cache['stats']
+        stats = compute_dashboard_stats(conn)
+    with _stats_lock:
+        _stats_cache.update(db_path=db.db_path, revisions=revisions, stats=stats)
+    return stats
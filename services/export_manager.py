@@ -1,262 +1,322 @@
 import pandas as pd
+import hashlib
 import io
 import json
+import os
 import sqlite3
+import tempfile
+import xlsxwriter
 from database.db_manager import DatabaseManager
 from utils.anp import ANPProcessor
+from database.exame_system import RESULT_SCORE_COLUMNS, RIASEC_TYPES
+from services.similarity import MajorProfiles, rank_by_similarity
+
+# Sheets of the full admin report (key -> sheet name), in workbook order
+REPORT_SHEETS = {
+    'holland': 'Perhitungan Holland',
+    'answers': 'Jawaban Siswa',
+    'rankings': 'Perbandingan Top 5',
+    'majors': 'Master Data Jurusan',
+}
+
+# Students recomputed per batch when refreshing the row cache
+EXPORT_CHUNK_SIZE = 1000
+
+# Bump when the layout of cached report rows changes
+EXPORT_ROW_VERSION = 1
+
+UPSERT_ROW_CACHE_SQL = """
+    INSERT INTO export_row_cache (student_id, completed_at, context_key, holland_row, answer_row, ranking_rows)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(student_id) DO UPDATE SET
+        completed_at = excluded.completed_at,
+        context_key = excluded.context_key,
+        holland_row = excluded.holland_row,
+        answer_row = excluded.answer_row,
+        ranking_rows = excluded.ranking_rows
+"""
 
 class ExportManager:
-    def __init__(self):
-        self.db = DatabaseManager()
+    def __init__(self, db=None):
+        self.db = db or DatabaseManager()
         self.anp_processor = ANPProcessor()
         self.questions_map = {}
         self.majors_map = {}
 
-    def _load_reference_data(self):
+    def _load_reference_data(self, conn=None):
         """Pre-load questions and majors for lookup"""
-        conn = self.db.get_connection()
-        
+        if conn is None:
+            with self.db.connection() as conn:
+                return self._load_reference_data(conn)
+
         # Load Questions
         q_cursor = conn.cursor()
         q_cursor.execute("SELECT id, question_text, holland_type FROM questions ORDER BY id")
         self.questions_map = {row[0]: {'text': row[1], 'type': row[2]} for row in q_cursor.fetchall()}
-        
+
         # Load Majors
         m_cursor = conn.cursor()
         m_cursor.execute("SELECT * FROM majors")
         cols = [description[0] for description in m_cursor.description]
-        
+
         self.majors_map = {}
         for row in m_cursor.fetchall():
             major_data = dict(zip(cols, row))
             self.majors_map[major_data['Major']] = major_data # Key by Name
-            
-        conn.close()
 
-    def generate_full_admin_report(self):
+    def generate_full_admin_report(self, sheets=None):
         """
-        Generates a comprehensive Excel report as requested by the admin.
-        Sheets:
-        1. Ringkasan Hasil (Summary: Holland, Top 1 Sim, Top 1 ANP)
-        2. Jawaban Siswa (Raw points for each question)
-        3. Perhitungan Holland (Sums & Normalized scores)
-        4. Perbandingan Ranking (Top 5 Similarity vs Top 5 ANP with scores)
-        5. Data Master Jurusan (Raw RIASEC profiles for all majors)
+        Generates the full admin report and returns it as bytes.
+        Kept for callers that need the whole file in memory; prefer
+        `export_full_admin_report`, which leaves the report on disk.
         """
-        self._load_reference_data()
-        
-        output = io.BytesIO()
-        writer = pd.ExcelWriter(output, engine='xlsxwriter')
-        workbook = writer.book
+        path = self.export_full_admin_report(sheets=sheets)
+        try:
+            with open(path, 'rb') as fh:
+                return fh.read()
+        finally:
+            os.remove(path)
+
+    def export_full_admin_report(self, path=None, sheets=None):
+        """
+        Streams the comprehensive admin report into an .xlsx file.
+
+        Per-student rows come from the export_row_cache table; only students
+        whose result, answers or profile changed since the last report are
+        recomputed (see `refresh_row_cache`). Rows are then written with
+        xlsxwriter's constant_memory mode, so memory use does not grow with
+        the number of students.
+
+        Sheets (keys of REPORT_SHEETS, default all):
+        1. holland  - Perhitungan Holland (Sums & Normalized scores)
+        2. answers  - Jawaban Siswa (Raw points for each question)
+        3. rankings - Perbandingan Top 5 (Top 5 Similarity vs Top 5 ANP with scores)
+        4. majors   - Data Master Jurusan (Raw RIASEC profiles for all majors)
+
+        Args:
+            path: target file; a new temporary file is created when omitted
+            sheets: iterable of sheet keys to include
+
+        Returns:
+            Path of the written file (the caller owns and removes it)
+        """
+        selected = [key for key in REPORT_SHEETS if sheets is None or key in sheets]
+        if not selected:
+            raise ValueError("Pilih minimal satu sheet untuk laporan.")
+
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix='laporan_hasil_', suffix='.xlsx')
+            os.close(fd)
 
+        workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
         # Styles
         header_fmt = workbook.add_format({'bold': True, 'bg_color': '#1e293b', 'font_color': 'white', 'border': 1, 'align': 'center'})
-        num_fmt = workbook.add_format({'num_format': '0.0000', 'border': 1})
-        text_fmt = workbook.add_format({'border': 1})
-        
-        conn = self.db.get_connection()
-        cursor = conn.cursor()
-
-        # 1. Fetch Students with Results
-        cursor.execute('''
-            SELECT u.id, u.full_name, u.class_name, tr.holland_scores, tr.anp_results, tr.completed_at
-            FROM users u
-            JOIN test_results tr ON u.id = tr.student_id
-            ORDER BY u.full_name
-        ''')
-        students_with_results = cursor.fetchall()
-        
-        if not students_with_results:
-            conn.close()
-            # If no results, still return an empty file or basic info?
-            # Let's assume there are results or handle elegantly
-            pass
-
-        # Prepare Holland Types
-        holland_types = ['Realistic', 'Investigative', 'Artistic', 'Social', 'Enterprising', 'Conventional']
-        
-        # ==========================================
-        # OPTIMIZED: Batch fetch all student answers ONCE
-        # instead of N+1 queries per student
-        # ==========================================
-        cursor.execute("""
-            SELECT sa.student_id, q.holland_type, sa.answer, sa.question_id
-            FROM student_answers sa
-            JOIN questions q ON sa.question_id = q.id
-        """)
-        all_answers_raw = cursor.fetchall()
-        
-        # Group answers by student_id
-        from collections import defaultdict
-        answers_by_student = defaultdict(list)
-        answers_by_student_qid = defaultdict(dict)  # For answer_rows sheet
-        
-        for student_id, holland_type, answer, q_id in all_answers_raw:
-            answers_by_student[student_id].append((holland_type, answer))
-            answers_by_student_qid[student_id][q_id] = answer
-        
-        # ==========================================
-        # SHEET 1: RINGKASAN & HOLLAND
-        # ==========================================
-        holland_data = []
-        for s in students_with_results:
-            s_id, name, cls, h_scores_json, anp_json, date = s
-            
-            # Use pre-fetched data instead of per-student query
-            student_raw_ans = answers_by_student.get(s_id, [])
-            
-            sums = {t: 0 for t in holland_types}
-            for q_type, score in student_raw_ans:
-                if q_type in sums:
-                    sums[q_type] += score
-            
-            max_score = max(sums.values()) if sums.values() else 0
-            
-            row = {
-                'ID Siswa': s_id,
-                'Nama Lengkap': name,
-                'Kelas': cls,
-                'Tanggal': date
-            }
-            # Add Holland SUMs
-            for t in holland_types:
-                row[f'SUM {t}'] = sums.get(t, 0)
-            
-            row['Max Score'] = max_score
-            
-            # Add Holland NORM scores
-            for t in holland_types:
-                row[f'NORM {t}'] = sums.get(t, 0) / max_score if max_score > 0 else 0
-            
-            holland_data.append(row)
-        
-        df_holland = pd.DataFrame(holland_data)
-        df_holland.to_excel(writer, sheet_name='Perhitungan Holland', index=False)
-        
-        # Apply formatting to Holland sheet
-        ws_h = writer.sheets['Perhitungan Holland']
-        for col_num, value in enumerate(df_holland.columns.values):
-            ws_h.write(0, col_num, value, header_fmt)
-            ws_h.set_column(col_num, col_num, 15)
-
-        # ==========================================
-        # SHEET 2: JAWABAN SISWA
-        # ==========================================
-        # Matrix: Students (Rows) x Questions (Cols)
-        # Use pre-fetched answers instead of per-student query
+
+        writers = {
+            'holland': self._write_holland_sheet,
+            'answers': self._write_answers_sheet,
+            'rankings': self._write_rankings_sheet,
+            'majors': self._write_majors_sheet,
+        }
+        try:
+            with self.db.connection() as conn:
+                self.refresh_row_cache(conn)
+
+                # All sheets are rendered from one read snapshot. Students changed
+                # after the refresh above are rebuilt in memory for this report only.
+                conn.execute("BEGIN")
+                self._load_reference_data(conn)
+                self._context_key = self._row_cache_context(conn)
+                self._pending_rows = self._build_cached_rows(
+                    conn, self._stale_students(conn, self._context_key)
+                )
+                for key in selected:
+                    worksheet = workbook.add_worksheet(REPORT_SHEETS[key])
+                    writers[key](conn, worksheet, header_fmt)
+        finally:
+            workbook.close()
+        return path
+
+    @staticmethod
+    def _write_header(worksheet, columns, header_fmt, width=None):
+        for col_num, value in enumerate(columns):
+            worksheet.write(0, col_num, value, header_fmt)
+        if width is not None:
+            worksheet.set_column(0, len(columns) - 1, width)
+
+    # ==========================================
+    # INCREMENTAL ROW CACHE
+    # ==========================================
+    def _row_cache_context(self, conn):
+        """Cache key shared by all rows: majors/questions revisions and row layout"""
+        raw = json.dumps([EXPORT_ROW_VERSION] + [self.db.get_revision(t, conn) for t in ('majors', 'questions')])
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _stale_students(conn, context_key):
+        """Students with a result but no valid cached row"""
+        return [row[0] for row in conn.execute('''
+            SELECT tr.student_id
+            FROM test_results tr
+            LEFT JOIN export_row_cache c ON c.student_id = tr.student_id
+            WHERE c.student_id IS NULL
+               OR c.context_key != ?
+               OR c.completed_at IS NOT tr.completed_at
+        ''', (context_key,))]
+
+    def refresh_row_cache(self, conn):
+        """
+        Rebuild cached report rows for students that changed since the last
+        report (new or recalculated result, edited answers, renamed student),
+        and for everyone after majors or questions change.
+
+        Returns:
+            Number of students recomputed
+        """
+        self._load_reference_data(conn)
+        context_key = self._row_cache_context(conn)
+        stale = self._stale_students(conn, context_key)
+        for start in range(0, len(stale), EXPORT_CHUNK_SIZE):
+            rows = self._build_cached_rows(conn, stale[start:start + EXPORT_CHUNK_SIZE])
+            conn.executemany(UPSERT_ROW_CACHE_SQL, [
+                (s_id, completed_at, context_key, *(json.dumps(part) for part in parts))
+                for s_id, (completed_at, *parts) in rows.items()
+            ])
+            conn.commit()
+        return len(stale)
+
+    def _build_cached_rows(self, conn, student_ids):
+        """
+        Compute the report rows of the given students.
+
+        Returns:
+            {student_id: (completed_at, holland_row, answer_row, ranking_rows)}
+        """
+        if not student_ids:
+            return {}
+        holland_types = list(RIASEC_TYPES)
         sorted_q_ids = sorted(self.questions_map.keys())
-        answer_rows = []
-        for s in students_with_results:
-            s_id, name, cls, _, _, _ = s
-            ans_map = answers_by_student_qid.get(s_id, {})
-            
-            row = {'Nama Siswa': name, 'Kelas': cls}
-            for q_id in sorted_q_ids:
-                row[f'Q{q_id}'] = ans_map.get(q_id, 0)
-            answer_rows.append(row)
-            
-        df_answers = pd.DataFrame(answer_rows)
-        df_answers.to_excel(writer, sheet_name='Jawaban Siswa', index=False)
-        ws_ans = writer.sheets['Jawaban Siswa']
-        for col_num, value in enumerate(df_answers.columns.values):
-            ws_ans.write(0, col_num, value, header_fmt)
+        placeholders = ', '.join(['?'] * len(student_ids))
 
+        # Holland sums come from the trigger-maintained student_riasec_totals table;
+        # answers are aggregated by SQLite into one JSON object per student
+        sum_columns = ', '.join(f"COALESCE(rt.{t.lower()}_sum, 0)" for t in holland_types)
+        score_columns = ', '.join(f"tr.{col}" for col in RESULT_SCORE_COLUMNS)
+        students = conn.execute(f'''
+            SELECT u.id, u.full_name, u.class_name, tr.completed_at, {sum_columns}, {score_columns},
+                   (SELECT json_group_object(sa.question_id, sa.answer)
+                    FROM student_answers sa WHERE sa.student_id = u.id)
+            FROM test_results tr
+            JOIN users u ON u.id = tr.student_id
+            LEFT JOIN student_riasec_totals rt ON rt.student_id = tr.student_id
+            WHERE tr.student_id IN ({placeholders})
+        ''', list(student_ids)).fetchall()
+        if not students:
+            return {}
 
-        # ==========================================
-        # SHEET 3: PERBANDINGAN RANKING (SIM vs ANP)
-        # ==========================================
-        # This will list top 5 for each student side-by-side
-        import numpy as np
-        
-        # Pre-calc major vectors for Cosine Similarity
-        major_names = list(self.majors_map.keys())
-        major_profiles = np.array([[self.majors_map[m][t] for t in holland_types] for m in major_names])
-        major_norms = np.linalg.norm(major_profiles, axis=1)
-
-        ranking_rows = []
-        for s in students_with_results:
-            s_id, name, cls, h_scores_json, anp_json, _ = s
-            h_scores = json.loads(h_scores_json)
-            s_vec = np.array([h_scores.get(t, 0) for t in holland_types])
-            s_norm = np.linalg.norm(s_vec)
-            
-            # A. Calculate Cosine Similarity for ALL majors
-            sim_scores = []
-            if s_norm > 0:
-                for i, m_name in enumerate(major_names):
-                    if major_norms[i] > 0:
-                        cos_sim = np.dot(s_vec, major_profiles[i]) / (s_norm * major_norms[i])
-                    else:
-                        cos_sim = 0
-                    sim_scores.append((m_name, float(cos_sim)))
-            else:
-                sim_scores = [(m, 0.0) for m in major_names]
-            
-            top_5_sim = sorted(sim_scores, key=lambda x: x[1], reverse=True)[:5]
-            
-            # B. Extract ANP ranking from JSON
-            anp_data = json.loads(anp_json)
-            # Handle nested structure
-            anp_top_5 = []
-            if 'anp_results' in anp_data and isinstance(anp_data['anp_results'], dict):
-                anp_top_5 = anp_data['anp_results'].get('top_5_majors', [])
-            elif 'top_5_majors' in anp_data:
-                anp_top_5 = anp_data['top_5_majors']
-            
-            # Fill rows for top 5
+        # ANP top 5 in rank order (primary-key range of result_rankings)
+        anp_top_5 = {}
+        for s_id, major_name, anp_score in conn.execute(f'''
+            SELECT student_id, major_name, anp_score FROM result_rankings
+            WHERE student_id IN ({placeholders}) AND rank <= 5
+            ORDER BY student_id, rank
+        ''', list(student_ids)):
+            anp_top_5.setdefault(s_id, []).append((major_name, anp_score))
+
+        # Cosine similarity top 5 for the whole batch (one matrix product)
+        majors = MajorProfiles(
+            {m: {t: self.majors_map[m][t] for t in holland_types} for m in self.majors_map},
+            holland_types
+        )
+        n_types = len(holland_types)
+        top_5_sims = rank_by_similarity([row[4 + n_types:4 + 2 * n_types] for row in students], majors, k=5)
+
+        rows = {}
+        for row, top_5_sim in zip(students, top_5_sims):
+            s_id, name, cls, date = row[:4]
+            sums = list(row[4:4 + n_types])
+
+            # Sheet 1: sums & normalized scores
+            max_score = max(sums) if sums else 0
+            norms = [v / max_score if max_score > 0 else 0 for v in sums]
+            holland_row = [s_id, name, cls, date, *sums, max_score, *norms]
+
+            # Sheet 2: raw points per question
+            ans_map = json.loads(row[-1]) if row[-1] else {}
+            answer_row = [name, cls] + [ans_map.get(str(q_id), 0) for q_id in sorted_q_ids]
+
+            # Sheet 3: top 5 similarity vs ANP side by side
+            anp_rows = anp_top_5.get(s_id, [])
+            ranking_rows = []
             for i in range(5):
-                row = {'Nama Siswa': name, 'Rank': i+1}
-                
-                # Similarity part
-                if i < len(top_5_sim):
-                    row['Jurusan (Cosine Sim)'] = top_5_sim[i][0]
-                    row['Skor Sim'] = top_5_sim[i][1]
-                else:
-                    row['Jurusan (Cosine Sim)'] = '-'
-                    row['Skor Sim'] = 0
-                
-                # ANP part
-                if i < len(anp_top_5):
-                    m_item = anp_top_5[i]
-                    if isinstance(m_item, dict):
-                        row['Jurusan (ANP)'] = m_item.get('major_name', '-')
-                        row['Skor ANP'] = m_item.get('anp_score', 0)
-                    else: # Legacy tuple format
-                        row['Jurusan (ANP)'] = m_item[0]
-                        row['Skor ANP'] = m_item[1].get('anp_score', 0) if isinstance(m_item[1], dict) else m_item[1]
-                else:
-                    row['Jurusan (ANP)'] = '-'
-                    row['Skor ANP'] = 0
-                
-                ranking_rows.append(row)
-            
-        df_rankings = pd.DataFrame(ranking_rows)
-        df_rankings.to_excel(writer, sheet_name='Perbandingan Top 5', index=False)
-        ws_rank = writer.sheets['Perbandingan Top 5']
-        for col_num, value in enumerate(df_rankings.columns.values):
-            ws_rank.write(0, col_num, value, header_fmt)
-            ws_rank.set_column(col_num, col_num, 20)
-
-        # ==========================================
-        # SHEET 4: MASTER DATA JURUSAN
-        # ==========================================
-        master_majors = []
-        for m_name, profile in self.majors_map.items():
-            row = {'Nama Jurusan': m_name}
-            for t in holland_types:
-                row[t] = profile.get(t, 0)
-            master_majors.append(row)
-            
-        df_master = pd.DataFrame(master_majors)
-        df_master.to_excel(writer, sheet_name='Master Data Jurusan', index=False)
-        ws_m = writer.sheets['Master Data Jurusan']
-        for col_num, value in enumerate(df_master.columns.values):
-            ws_m.write(0, col_num, value, header_fmt)
-            ws_m.set_column(col_num, col_num, 15)
-
-        conn.close()
-        writer.close()
-        return output.getvalue()
+                sim_name, sim_score = top_5_sim[i] if i < len(top_5_sim) else ('-', 0)
+                anp_name, anp_score = anp_rows[i] if i < len(anp_rows) else ('-', 0)
+                ranking_rows.append([name, i + 1, sim_name, sim_score, anp_name, anp_score])
+
+            rows[s_id] = (date, holland_row, answer_row, ranking_rows)
+        return rows
+
+    def _cached_rows(self, conn, part):
+        """Cached rows of one sheet for all students with results, ordered by name"""
+        column, index = {'holland': ('holland_row', 1), 'answers': ('answer_row', 2),
+                         'rankings': ('ranking_rows', 3)}[part]
+        cursor = conn.execute(f'''
+            SELECT tr.student_id, c.{column}
+            FROM test_results tr
+            JOIN users u ON u.id = tr.student_id
+            LEFT JOIN export_row_cache c
+                   ON c.student_id = tr.student_id
+                  AND c.context_key = ?
+                  AND c.completed_at IS tr.completed_at
+            ORDER BY u.full_name, u.id
+        ''', (self._context_key,))
+        for s_id, raw in cursor:
+            yield json.loads(raw) if raw is not None else self._pending_rows[s_id][index]
+
+    # ==========================================
+    # SHEET 1: RINGKASAN & HOLLAND
+    # ==========================================
+    def _write_holland_sheet(self, conn, worksheet, header_fmt):
+        holland_types = list(RIASEC_TYPES)
+        columns = (['ID Siswa', 'Nama Lengkap', 'Kelas', 'Tanggal']
+                   + [f'SUM {t}' for t in holland_types]
+                   + ['Max Score']
+                   + [f'NORM {t}' for t in holland_types])
+        self._write_header(worksheet, columns, header_fmt, width=15)
+        for row_num, row in enumerate(self._cached_rows(conn, 'holland'), 1):
+            worksheet.write_row(row_num, 0, row)
+
+    # ==========================================
+    # SHEET 2: JAWABAN SISWA
+    # ==========================================
+    def _write_answers_sheet(self, conn, worksheet, header_fmt):
+        # Matrix: Students (Rows) x Questions (Cols)
+        sorted_q_ids = sorted(self.questions_map.keys())
+        self._write_header(worksheet, ['Nama Siswa', 'Kelas'] + [f'Q{q_id}' for q_id in sorted_q_ids], header_fmt)
+        for row_num, row in enumerate(self._cached_rows(conn, 'answers'), 1):
+            worksheet.write_row(row_num, 0, row)
+
+    # ==========================================
+    # SHEET 3: PERBANDINGAN RANKING (SIM vs ANP)
+    # ==========================================
+    def _write_rankings_sheet(self, conn, worksheet, header_fmt):
+        # This will list top 5 for each student side-by-side
+        columns = ['Nama Siswa', 'Rank', 'Jurusan (Cosine Sim)', 'Skor Sim', 'Jurusan (ANP)', 'Skor ANP']
+        self._write_header(worksheet, columns, header_fmt, width=20)
+        row_num = 1
+        for ranking_rows in self._cached_rows(conn, 'rankings'):
+            for row in ranking_rows:
+                worksheet.write_row(row_num, 0, row)
+                row_num += 1
+
+    # ==========================================
+    # SHEET 4: MASTER DATA JURUSAN
+    # ==========================================
+    def _write_majors_sheet(self, conn, worksheet, header_fmt):
+        holland_types = list(RIASEC_TYPES)
+        self._write_header(worksheet, ['Nama Jurusan'] + holland_types, header_fmt, width=15)
+        for row_num, (m_name, profile) in enumerate(self.majors_map.items(), 1):
+            worksheet.write_row(row_num, 0, [m_name] + [profile.get(t, 0) for t in holland_types])
 
     def generate_anp_template_excel(self):
         """
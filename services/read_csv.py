@@ -1,4 +1,9 @@
-import io
+import codecs
+import functools
+import itertools
+import re
+import sys
+import numpy as np
 import pandas as pd
 import streamlit as st
 from datetime import datetime, timedelta, timezone
@@ -6,53 +11,129 @@ import unicodedata
 import traceback
 
 from database.db_manager import DatabaseManager
-from utils.auth import hash_password
+from utils.auth import hash_passwords
+from utils.anp_cache import invalidate_alternative_priorities
+from services.cat_engine import invalidate_question_bank
 
 WITA = timezone(timedelta(hours=8))
+IMPORT_CHUNK_SIZE = 5000
+ENCODING_BLOCK_BYTES = 1 << 20
 
 
 # -------------------------
 # Helper util
 # -------------------------
-def _try_read_csv(file_like):
+def _is_excel(file_like):
+    name = file_like if isinstance(file_like, str) else getattr(file_like, "name", "")
+    return str(name).lower().endswith((".xls", ".xlsx"))
+
+
+def _detect_encoding(stream):
+    """
+    Detect the encoding of the whole byte stream: utf-8 (with or without BOM)
+    if every byte decodes, otherwise latin1 (which never fails, same as the old
+    fallback order). The stream is validated block by block, not parsed, and is
+    rewound afterwards so the file can then be decoded strictly.
     """
-    Try read CSV with multiple encodings. Return pandas.DataFrame.
+    first = stream.read(ENCODING_BLOCK_BYTES)
+    encoding = "utf-8-sig" if first.startswith(codecs.BOM_UTF8) else "utf-8"
+    decoder = codecs.getincrementaldecoder(encoding)()
+    try:
+        block = first
+        while block:
+            decoder.decode(block)
+            block = stream.read(ENCODING_BLOCK_BYTES)
+        decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        encoding = "latin1"
+    stream.seek(0)
+    return encoding
+
+
+def _iter_upload_chunks(file_like, chunksize=IMPORT_CHUNK_SIZE):
+    """
+    Yield DataFrame chunks of at most `chunksize` rows with columns auto-renamed.
+    CSV is streamed after encoding detection over the whole file; Excel cannot be streamed
+    by pandas, so it is read once and then sliced.
     """
-    encodings = ["utf-8", "latin1", "cp1252"]
-    last_exc = None
-    for enc in encodings:
+    if _is_excel(file_like):
+        df = pd.read_excel(file_like)
+        chunks = (df.iloc[i:i + chunksize] for i in range(0, len(df), chunksize))
+        opened = None
+    else:
+        opened = open(file_like, "rb") if isinstance(file_like, str) else None
+        stream = opened or file_like
         try:
-            # If file_like is an UploadedFile (Streamlit), .read() moves pointer, so we reset using BytesIO
-            if hasattr(file_like, "read") and not isinstance(file_like, str):
-                raw = file_like.read()
-                # reset pointer for future ops
-                try:
-                    file_like.seek(0)
-                except Exception:
-                    pass
-                df = pd.read_csv(io.BytesIO(raw), encoding=enc)
-            else:
-                df = pd.read_csv(file_like, encoding=enc)
-            return df
-        except Exception as e:
-            last_exc = e
-            # try next encoding
-            continue
-    # if all fail, raise last exception
-    raise last_exc
-
-
-def _normalize_text(s):
-    """Trim, normalize unicode, remove zero-width spaces etc."""
-    if pd.isna(s):
-        return s
-    if not isinstance(s, str):
-        s = str(s)
-    s = s.strip()
-    s = unicodedata.normalize("NFC", s)
-    # remove weird control chars
-    s = "".join(ch for ch in s if unicodedata.category(ch)[0] != "C")
-    return s
+            # strict decoding: the encoding was checked against the whole file
+            chunks = pd.read_csv(
+                stream,
+                encoding=_detect_encoding(stream),
+                chunksize=chunksize,
+            )
+        except pd.errors.EmptyDataError:
+            chunks = iter(())
+
+    try:
+        for chunk in chunks:
+            rename_map = _auto_rename_columns(list(chunk.columns))
+            yield chunk.rename(columns=rename_map) if rename_map else chunk
+    finally:
+        if opened is not None:
+            opened.close()
+
+
+def _upload_progress(file_like):
+    """Fraction of the upload consumed so far (0-1), based on the stream position"""
+    try:
+        size = getattr(file_like, "size", None)
+        if size is None:
+            size = len(file_like.getbuffer())
+        return min(1.0, file_like.tell() / size) if size else 1.0
+    except Exception:
+        return 1.0
+
+
+@functools.lru_cache(maxsize=1)
+def _control_chars_pattern():
+    """Regex class of every Unicode 'C*' (control/format/unassigned) char, built on first use"""
+    ranges = []
+    start = None
+    for cp in range(sys.maxunicode + 1):
+        if unicodedata.category(chr(cp))[0] == "C":
+            if start is None:
+                start = cp
+        elif start is not None:
+            ranges.append((start, cp - 1))
+            start = None
+    if start is not None:
+        ranges.append((start, sys.maxunicode))
+    char_class = "".join(
+        f"\\U{lo:08x}" if lo == hi else f"\\U{lo:08x}-\\U{hi:08x}" for lo, hi in ranges
+    )
+    return re.compile(f"[{char_class}]")
+
+
+def _normalize_text_series(values):
+    """
+    Trim, normalize unicode (NFC), remove zero-width spaces / control chars for a whole column.
+    Returns an object column with str values and None for missing cells.
+    """
+    text = values.astype("string").str.strip()
+    result = text.astype(object).where(text.notna(), None)
+
+    # Pure printable-ASCII values are already NFC and contain no control chars
+    needs_work = text.str.contains(r"[^\x20-\x7e]", regex=True).fillna(False).astype(bool)
+    if needs_work.any():
+        pattern = _control_chars_pattern()
+        result[needs_work] = [
+            pattern.sub("", unicodedata.normalize("NFC", v)).strip()
+            for v in text[needs_work]
+        ]
+    return result
+
+
+def _text_columns(df):
+    return [c for c in df.columns if df[c].dtype == object or pd.api.types.is_string_dtype(df[c])]
 
 
 def _auto_rename_columns(cols):
@@ -116,38 +197,17 @@ def _auto_rename_columns(cols):
     return mapping
 
 
-def _as_custom_userid(raw_id):
-    """Convert input student identifier to integer id used in database."""
-    if pd.isna(raw_id):
-        return None
-    s = str(raw_id).strip()
-    if s == "":
-        return None
-
-    # format U123
-    if s[0].upper() == "U" and s[1:].isdigit():
-        return int(s[1:])
-
-    # numeric string / float string
-    try:
-        return int(float(s))
-    except (ValueError, TypeError):
-        return None
-
-
-def _as_custom_questionid(raw_q):
-    """Convert input question identifier to integer id."""
-    if pd.isna(raw_q):
-        return None
-    s = str(raw_q).strip()
-    if s == "":
-        return None
-    if s[0].upper() == "Q" and s[1:].isdigit():
-        return int(s[1:])
-    try:
-        return int(float(s))
-    except (ValueError, TypeError):
-        return None
+def _as_custom_id_series(values, prefix):
+    """
+    Convert identifier column to integer ids (vectorized).
+    Accepts numeric (1), float strings ("1.0") and prefixed format ("U1" / "Q1");
+    anything else becomes <NA>.
+    """
+    text = values.astype("string").str.strip()
+    text = text.str.replace(rf"^[{prefix.upper()}{prefix.lower()}](?=\d+$)", "", regex=True)
+    numbers = pd.to_numeric(text, errors="coerce")
+    numbers = numbers.where(np.isfinite(numbers))
+    return np.trunc(numbers).astype("Int64")
 
 
 def _reset_sequence_if_table_empty(conn, table_name):
@@ -174,38 +234,24 @@ def save_csv_to_db_student(file_csv):
     db = DatabaseManager()
     conn = None
     inserted = 0
+    existing = 0
     skipped = 0
     errors = 0
+    hashed_count = 0
+    hash_seconds = 0.0
     try:
-        # read csv with encoding fallback
-        if hasattr(file_csv, "name") and (file_csv.name.endswith(".xls") or file_csv.name.endswith(".xlsx")):
-            df = pd.read_excel(file_csv)
-        else:
-            df = _try_read_csv(file_csv)
-
-        if df is None or df.shape[0] == 0:
+        # read csv/excel in chunks (encoding detected once per file)
+        chunks = _iter_upload_chunks(file_csv)
+        first = next(chunks, None)
+        if first is None or first.shape[0] == 0:
             return "❌ Error: File kosong atau tidak terbaca."
 
-        # auto rename columns
-        rename_map = _auto_rename_columns(list(df.columns))
-        if rename_map:
-            df = df.rename(columns=rename_map)
-
         required = ["username", "password", "full_name", "class_name"]
-        missing = [c for c in required if c not in df.columns]
-        # allow class_name to be optional
-        if "class_name" in missing:
-            # not fatal: fill with None
-            df["class_name"] = None
-            missing = [c for c in missing if c != "class_name"]
-
+        # allow class_name to be optional (filled with None)
+        missing = [c for c in required if c not in first.columns and c != "class_name"]
         if missing:
             return f"❌ Format CSV tidak valid. Kolom hilang: {missing}"
 
-        # clean & normalize columns
-        for c in ["username", "password", "full_name", "class_name"]:
-            df[c] = df[c].apply(_normalize_text)
-
         # add role and created_at
         now = datetime.now(WITA).isoformat(sep=" ", timespec="seconds")
 
@@ -214,44 +260,74 @@ def save_csv_to_db_student(file_csv):
 
         _reset_sequence_if_table_empty(conn, "users")
 
-        cursor.execute("BEGIN")
-        for _, row in df.iterrows():
-            try:
-                username = row["username"]
-                password = row["password"]
-                full_name = row["full_name"]
-                class_name = row.get("class_name", None)
-
-                if not username or not password or not full_name:
-                    skipped += 1
-                    continue
-
-                hashed_pw = hash_password(password)
-
-                cursor.execute("""
-                    INSERT INTO users (username, password, role, full_name, class_name, created_at)
-                    VALUES (?, ?, 'student', ?, ?, ?)
-                """, (username, hashed_pw, full_name, class_name, now))
-                if cursor.rowcount == 1:
-                    user_id = cursor.lastrowid
-                else:
-                    cursor.execute("SELECT id FROM users WHERE username = ?", (username,))
-                    existing = cursor.fetchone()
-                    user_id = existing[0] if existing else None
-
-                if user_id:
-                    # db.ensure_student_profile(cursor, user_id, full_name, class_name) # Removed
-                    pass
-                inserted += 1
-
-            except Exception as exc_row:
-                errors += 1
-                # continue processing others
-                print(f"[read_csv] Error inserting student row: {exc_row}")
+        # username yang sudah terdaftar tidak perlu di-hash ulang
+        cursor.execute("SELECT username FROM users")
+        registered = {row[0] for row in cursor.fetchall()}
+
+        for df in itertools.chain([first], chunks):
+            if "class_name" not in df.columns:
+                df = df.assign(class_name=None)
+
+            # clean & normalize columns
+            for c in required:
+                df[c] = _normalize_text_series(df[c])
+
+            # skip rows without username / password / full_name
+            complete = df["username"].notna() & df["password"].notna() & df["full_name"].notna()
+            for c in ["username", "password", "full_name"]:
+                complete &= df[c] != ""
+            skipped += int((~complete).sum())
+            df = df[complete]
+
+            new_rows = df[~df["username"].isin(registered)].drop_duplicates(subset=["username"], keep="first")
+            existing += len(df) - len(new_rows)
+            if new_rows.empty:
                 continue
 
-        conn.commit()
-        return f"✅ Data siswa berhasil dimasukkan. Inserted: {inserted}, Skipped: {skipped}, Errors: {errors}"
+            # hash di luar transaksi, paralel di beberapa proses
+            hashed, hash_rate = hash_passwords(new_rows["password"].tolist())
+            hashed_count += len(hashed)
+            hash_seconds += len(hashed) / hash_rate
+
+            # password yang ditolak bcrypt (mis. > 72 byte) dihitung sebagai error
+            hashed = pd.Series(hashed, index=new_rows.index, dtype=object)
+            failed = hashed.isna()
+            errors += int(failed.sum())
+            new_rows, hashed = new_rows[~failed], hashed[~failed]
+            if new_rows.empty:
+                continue
+
+            records = list(zip(
+                new_rows["username"],
+                hashed,
+                new_rows["full_name"],
+                new_rows["class_name"],
+                itertools.repeat(now),
+            ))
+
+            # total_changes ikut menghitung baris yang ditulis trigger pada users,
+            # jadi jumlah yang benar-benar masuk diambil dari COUNT(*) sebelum/sesudah
+            cursor.execute("SELECT COUNT(*) FROM users")
+            count_before = cursor.fetchone()[0]
+            cursor.executemany("""
+                INSERT INTO users (username, password, role, full_name, class_name, created_at)
+                VALUES (?, ?, 'student', ?, ?, ?)
+                ON CONFLICT(username) DO NOTHING
+            """, records)
+            cursor.execute("SELECT COUNT(*) FROM users")
+            written = cursor.fetchone()[0] - count_before
+            conn.commit()
+            inserted += written
+            existing += len(records) - written
+            registered.update(new_rows["username"])
+
+        conn.close()
+
+        hash_rate = hashed_count / hash_seconds if hash_seconds else 0.0
+        return (
+            f"✅ Data siswa berhasil dimasukkan. Inserted: {inserted}, Sudah ada: {existing}, "
+            f"Skipped: {skipped}, Errors: {errors} ({hash_rate:.1f} hash/detik)"
+        )
 
     except Exception as e:
         if conn:
@@ -271,28 +347,17 @@ def save_csv_to_db_soal(file_csv):
     skipped = 0
     errors = 0
     try:
-        # read file
-        if hasattr(file_csv, "name") and (file_csv.name.endswith(".xls") or file_csv.name.endswith(".xlsx")):
-            df = pd.read_excel(file_csv)
-        else:
-            df = _try_read_csv(file_csv)
-
-        if df is None or df.shape[0] == 0:
+        # read file in chunks
+        chunks = _iter_upload_chunks(file_csv)
+        first = next(chunks, None)
+        if first is None or first.shape[0] == 0:
             return "❌ Error: File kosong atau tidak terbaca."
 
-        rename_map = _auto_rename_columns(list(df.columns))
-        if rename_map:
-            df = df.rename(columns=rename_map)
-
         required = ["question_text", "holland_type"]
-        missing = [c for c in required if c not in df.columns]
+        missing = [c for c in required if c not in first.columns]
         if missing:
             return f"❌ Format CSV soal tidak valid. Kolom hilang: {missing}"
 
-        # normalize
-        df["question_text"] = df["question_text"].apply(_normalize_text)
-        df["holland_type"] = df["holland_type"].apply(_normalize_text)
-
         # Map short codes to full
         mapping = {
             "R": "Realistic",
@@ -302,7 +367,7 @@ def save_csv_to_db_soal(file_csv):
             "E": "Enterprising",
             "C": "Conventional"
         }
-        df["holland_type"] = df["holland_type"].apply(lambda v: mapping.get(v.upper(), v) if isinstance(v, str) else v)
+        valid_types = set(mapping.values())
 
         now = datetime.now(WITA).isoformat(sep=" ", timespec="seconds")
 
@@ -310,31 +375,27 @@ def save_csv_to_db_soal(file_csv):
         cursor = conn.cursor()
         _reset_sequence_if_table_empty(conn, "questions")
         cursor.execute("BEGIN")
-        for _, row in df.iterrows():
-            try:
-                qtext = row["question_text"]
-                qtype = row["holland_type"]
-
-                if not qtext or not qtype:
-                    skipped += 1
-                    continue
-
-                cursor.execute("""
-                    INSERT INTO questions (
-                        question_text, holland_type, created_at
-                    ) VALUES (?, ?, ?)
-                """, (
-                    qtext,
-                    qtype,
-                    now
-                ))
-                inserted += 1
-            except Exception as exc_row:
-                errors += 1
-                print(f"[read_csv] Error inserting question row: {exc_row}")
-                continue
+        for df in itertools.chain([first], chunks):
+            # normalize
+            qtext = _normalize_text_series(df["question_text"])
+            qtype = _normalize_text_series(df["holland_type"])
+            qtype = qtype.map(lambda v: mapping.get(v.upper(), v) if isinstance(v, str) else v)
+
+            present = qtext.notna() & qtype.notna() & (qtext != "") & (qtype != "")
+            valid = present & qtype.isin(valid_types)
+            skipped += int((~present).sum())
+            errors += int((present & ~valid).sum())
+
+            cursor.executemany("""
+                INSERT INTO questions (
+                    question_text, holland_type, created_at
+                ) VALUES (?, ?, ?)
+            """, zip(qtext[valid], qtype[valid], itertools.repeat(now)))
+            inserted += int(valid.sum())
 
         conn.commit()
+        conn.close()
+        invalidate_question_bank()
         return f"✅ Data soal berhasil dimasukkan. Inserted: {inserted}, Skipped: {skipped}, Errors: {errors}"
 
     except Exception as e:
@@ -355,58 +416,49 @@ def save_csv_to_db_majors(file_csv):
     skipped = 0
     errors = 0
     try:
-        if hasattr(file_csv, "name") and (file_csv.name.endswith(".xls") or file_csv.name.endswith(".xlsx")):
-            df = pd.read_excel(file_csv)
-        else:
-            df = _try_read_csv(file_csv)
-
-        if df is None or df.shape[0] == 0:
+        chunks = _iter_upload_chunks(file_csv)
+        first = next(chunks, None)
+        if first is None or first.shape[0] == 0:
             return "❌ Error: File kosong atau tidak terbaca."
 
-        rename_map = _auto_rename_columns(list(df.columns))
-        if rename_map:
-            df = df.rename(columns=rename_map)
-
-        required = ["Major", "Realistic", "Investigative", "Artistic", "Social", "Enterprising", "Conventional"]
-        missing = [c for c in required if c not in df.columns]
+        traits = ["Realistic", "Investigative", "Artistic", "Social", "Enterprising", "Conventional"]
+        required = ["Major"] + traits
+        missing = [c for c in required if c not in first.columns]
         if missing:
             return f"❌ Format CSV majors tidak valid. Kolom hilang: {missing}"
 
-        # normalize text and numeric cast
-        df["Major"] = df["Major"].apply(_normalize_text)
-        for trait in ["Realistic", "Investigative", "Artistic", "Social", "Enterprising", "Conventional"]:
-            df[trait] = pd.to_numeric(df[trait], errors="coerce").fillna(0.0)
-
         conn = db.get_connection()
         cursor = conn.cursor()
         _reset_sequence_if_table_empty(conn, "majors")
+        cursor.execute("SELECT Major FROM majors")
+        known_majors = {row[0] for row in cursor.fetchall()}
+
         cursor.execute("BEGIN")
-        for _, row in df.iterrows():
-            try:
-                major_name = row["Major"]
-                if not major_name:
-                    skipped += 1
-                    continue
-
-                cursor.execute("""
-                    INSERT INTO majors (Major, Realistic, Investigative, Artistic, Social, Enterprising, Conventional)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    major_name,
-                    float(row["Realistic"]),
-                    float(row["Investigative"]),
-                    float(row["Artistic"]),
-                    float(row["Social"]),
-                    float(row["Enterprising"]),
-                    float(row["Conventional"])
-                ))
-                inserted += 1
-            except Exception as exc_row:
-                errors += 1
-                print(f"[read_csv] Error inserting major row: {exc_row}")
-                continue
+        for df in itertools.chain([first], chunks):
+            # normalize text and numeric cast
+            df = df.assign(Major=_normalize_text_series(df["Major"]))
+            for trait in traits:
+                df[trait] = pd.to_numeric(df[trait], errors="coerce").fillna(0.0).astype(float)
+
+            present = df["Major"].notna() & (df["Major"] != "")
+            skipped += int((~present).sum())
+            df = df[present]
+
+            # Major is UNIQUE: names already stored (or repeated in the file) are errors
+            duplicate = df["Major"].isin(known_majors) | df["Major"].duplicated(keep="first")
+            errors += int(duplicate.sum())
+            df = df[~duplicate]
+
+            cursor.executemany("""
+                INSERT INTO majors (Major, Realistic, Investigative, Artistic, Social, Enterprising, Conventional)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, df[required].itertuples(index=False, name=None))
+            inserted += len(df)
+            known_majors.update(df["Major"])
 
         conn.commit()
+        conn.close()
+        invalidate_alternative_priorities(db.db_path)
         return f"✅ Data jurusan berhasil dimasukkan. Inserted: {inserted}, Skipped: {skipped}, Errors: {errors}"
 
     except Exception as e:
@@ -425,195 +477,217 @@ def save_csv_to_db_student_answers(uploaded_file):
     Supports:
       - student_id numeric (1) or prefixed format (U1)
       - question_id numeric (1) or prefixed format (Q1)
+    The file is streamed in chunks into a temp table, then merged with one upsert.
     """
     db = DatabaseManager()
     conn = None
 
     success_count = 0
     update_count = 0
-    error_count = 0
-    skipped_rows = 0
-    bad_rows = []
 
     try:
-        # read file
-        if hasattr(uploaded_file, "name") and (uploaded_file.name.endswith(".xls") or uploaded_file.name.endswith(".xlsx")):
-            df = pd.read_excel(uploaded_file)
-        else:
-            df = _try_read_csv(uploaded_file)
-
-        if df is None or df.shape[0] == 0:
+        chunks = _iter_upload_chunks(uploaded_file)
+        first = next(chunks, None)
+        if first is None or first.shape[0] == 0:
             st.error("❌ File kosong atau tidak terbaca.")
             return "❌ File kosong atau tidak terbaca."
 
-        # auto rename columns
-        rename_map = _auto_rename_columns(list(df.columns))
-        if rename_map:
-            df = df.rename(columns=rename_map)
-
         required_opt1 = ["student_id", "question_id", "answer"]
         required_opt2 = ["username", "question_id", "answer"]
 
         use_student_id = False
-        if all(col in df.columns for col in required_opt1):
+        if all(col in first.columns for col in required_opt1):
             use_student_id = True
-        elif all(col in df.columns for col in required_opt2):
+        elif all(col in first.columns for col in required_opt2):
             use_student_id = False
         else:
             st.error("❌ Format CSV tidak valid. Butuh kolom: student_id OR username, plus question_id & answer.")
-            st.info(f"Kolom ditemukan: {list(df.columns)}")
+            st.info(f"Kolom ditemukan: {list(first.columns)}")
             return
 
-        # clean columns
-        df_columns_before = list(df.columns)
-        for c in df_columns_before:
-            if df[c].dtype == object:
-                df[c] = df[c].apply(_normalize_text)
-
-        # If username provided, map to student_id
-        conn = db.get_connection()
-        cursor = conn.cursor()
-        _reset_sequence_if_table_empty(conn, "student_answers")
-        # If username provided, map to student_id
         conn = db.get_connection()
         cursor = conn.cursor()
         _reset_sequence_if_table_empty(conn, "student_answers")
+
+        # Lookup sets loaded once for all chunks
+        username_map = {}
         if not use_student_id:
             st.info("🔄 Mengonversi username -> student_id (case-insensitive) ...")
             cursor.execute("SELECT id, username FROM users WHERE role = 'student'")
             # Use lower() for both to ensure case-insensitive match
             username_map = {row[1].lower(): row[0] for row in cursor.fetchall()}  # username.lower() -> id
-            
-            df["student_id"] = df["username"].apply(lambda x: username_map.get(str(x).lower()) if pd.notna(x) else None)
-            
-            missing_usernames = df[df["student_id"].isna()]["username"].unique()
-            if len(missing_usernames) > 0:
-                st.warning(f"⚠️ Username tidak ditemukan: {', '.join(map(str, missing_usernames))}")
-                # drop missing users
-                df = df.dropna(subset=["student_id"])
-
-        # Convert identifiers to integer IDs
-        df["student_id"] = df["student_id"].apply(_as_custom_userid)
-        df["question_id"] = df["question_id"].apply(_as_custom_questionid)
-
-        # Ensure answer numeric
-        df["answer"] = pd.to_numeric(df["answer"], errors="coerce")
-
-        # Validate answer range
-        invalid_answers = df[(df["answer"] < 1) | (df["answer"] > 5) | (df["answer"].isna())]
-        if len(invalid_answers) > 0:
-            st.warning(f"⚠️ Ditemukan {len(invalid_answers)} baris dengan jawaban tidak valid (1-5). Baris ini akan diabaikan.")
-            df = df[~df.index.isin(invalid_answers.index)]
-
-        # Validate student_id exists
+
         cursor.execute("SELECT id FROM users WHERE role = 'student'")
         valid_student_ids = {row[0] for row in cursor.fetchall()}
-        invalid_students = df[~df["student_id"].isin(valid_student_ids)]
-        if len(invalid_students) > 0:
-            st.warning(f"⚠️ Ditemukan {len(invalid_students)} baris dengan student_id tidak valid. Baris ini diabaikan.")
-            df = df[df["student_id"].isin(valid_student_ids)]
-
-        # Validate question_id exists
         cursor.execute("SELECT id FROM questions")
         valid_question_ids = {row[0] for row in cursor.fetchall()}
-        invalid_questions = df[~df["question_id"].isin(valid_question_ids)]
-        if len(invalid_questions) > 0:
-            st.warning(f"⚠️ Ditemukan {len(invalid_questions)} baris dengan question_id tidak valid. Baris ini diabaikan.")
-            df = df[df["question_id"].isin(valid_question_ids)]
-
-        if len(df) == 0:
-            st.error("❌ Tidak ada data valid untuk disimpan setelah validasi.")
-            conn.close()
-            return "❌ Tidak ada data valid untuk disimpan."
 
-        # Setup progress bar
-        total_rows = len(df)
+        # Setup progress bar (diperbarui per potongan, bukan per baris)
         progress_bar = st.progress(0)
         status_text = st.empty()
 
-        # Track students whose results should be recalculated
-        affected_student_ids = set()
-
-        # Insert/update rows
-        cursor.execute("BEGIN")
-        for idx, row in df.iterrows():
-            try:
-                sid = int(row["student_id"])
-                qid = int(row["question_id"])
-                ans = int(row["answer"])
-                
-                affected_student_ids.add(sid)
-
-                # check existing
-                cursor.execute("""
-                    SELECT id FROM student_answers WHERE student_id = ? AND question_id = ?
-                """, (sid, qid))
-                existing = cursor.fetchone()
-                if existing:
-                    cursor.execute("""
-                        UPDATE student_answers SET answer = ?, created_at = datetime('now', '+8 hours')
-                        WHERE student_id = ? AND question_id = ?
-                    """, (ans, sid, qid))
-                    update_count += 1
-                else:
-                    cursor.execute("""
-                        INSERT INTO student_answers (student_id, question_id, answer, created_at)
-                        VALUES (?, ?, ?, datetime('now', '+8 hours'))
-                    """, (sid, qid, ans))
-                    success_count += 1
-
-            except Exception as exc_row:
-                error_count += 1
-                bad_rows.append((idx, str(exc_row)))
-                print(f"[read_csv] Error processing row {idx}: {exc_row}")
+        # Tiap potongan dimuat ke tabel sementara; baris ganda -> jawaban terakhir menang
+        cursor.execute("DROP TABLE IF EXISTS temp.import_answers")
+        cursor.execute("""
+            CREATE TEMP TABLE import_answers (
+                student_id INTEGER NOT NULL,
+                question_id INTEGER NOT NULL,
+                answer INTEGER NOT NULL,
+                PRIMARY KEY (student_id, question_id)
+            ) WITHOUT ROWID
+        """)
+
+        total_rows = 0
+        missing_usernames = set()
+        invalid_answer_count = 0
+        invalid_student_count = 0
+        invalid_question_count = 0
+        preview = None
+
+        for df in itertools.chain([first], chunks):
+            total_rows += len(df)
+
+            # clean columns
+            for c in _text_columns(df):
+                df[c] = _normalize_text_series(df[c])
+
+            # If username provided, map to student_id
+            if not use_student_id:
+                usernames = df["username"].astype("string").str.lower()
+                df["student_id"] = usernames.map(username_map)
+                unknown = df["student_id"].isna()
+                missing_usernames.update(df.loc[unknown, "username"].dropna().astype(str))
+                df = df[~unknown]
+
+            # Convert identifiers to integer IDs
+            df["student_id"] = _as_custom_id_series(df["student_id"], "U")
+            df["question_id"] = _as_custom_id_series(df["question_id"], "Q")
+
+            # Ensure answer numeric & validate range
+            df["answer"] = pd.to_numeric(df["answer"], errors="coerce")
+            valid_answer = df["answer"].between(1, 5)
+            invalid_answer_count += int((~valid_answer).sum())
+            df = df[valid_answer]
+
+            # Validate student_id / question_id exist
+            valid_student = df["student_id"].isin(valid_student_ids).astype(bool)
+            invalid_student_count += int((~valid_student).sum())
+            df = df[valid_student]
+
+            valid_question = df["question_id"].isin(valid_question_ids).astype(bool)
+            invalid_question_count += int((~valid_question).sum())
+            df = df[valid_question]
+
+            if df.empty:
                 continue
-            finally:
-                progress = (idx + 1) / total_rows
-                progress_bar.progress(progress)
-                status_text.text(f"Memproses: {idx + 1}/{total_rows} baris...")
 
+            answers = df[["student_id", "question_id", "answer"]].astype(
+                {"student_id": "int64", "question_id": "int64", "answer": "int64"}
+            )
+            if preview is None:
+                preview = answers.head()
+            cursor.executemany("""
+                INSERT INTO import_answers (student_id, question_id, answer) VALUES (?, ?, ?)
+                ON CONFLICT(student_id, question_id) DO UPDATE SET answer = excluded.answer
+            """, answers.itertuples(index=False, name=None))
+
+            progress_bar.progress(_upload_progress(uploaded_file) * 0.9)
+            status_text.text(f"Memuat: {total_rows} baris...")
+
+        if missing_usernames:
+            st.warning(f"⚠️ Username tidak ditemukan: {', '.join(sorted(missing_usernames))}")
+        if invalid_answer_count:
+            st.warning(f"⚠️ Ditemukan {invalid_answer_count} baris dengan jawaban tidak valid (1-5). Baris ini akan diabaikan.")
+        if invalid_student_count:
+            st.warning(f"⚠️ Ditemukan {invalid_student_count} baris dengan student_id tidak valid. Baris ini diabaikan.")
+        if invalid_question_count:
+            st.warning(f"⚠️ Ditemukan {invalid_question_count} baris dengan question_id tidak valid. Baris ini diabaikan.")
+
+        cursor.execute("SELECT COUNT(*), COUNT(DISTINCT student_id), COUNT(DISTINCT question_id) FROM import_answers")
+        loaded_rows, unique_students, unique_questions = cursor.fetchone()
+        if loaded_rows == 0:
+            cursor.execute("DROP TABLE temp.import_answers")
+            conn.commit()
+            progress_bar.empty()
+            status_text.empty()
+            st.error("❌ Tidak ada data valid untuk disimpan setelah validasi.")
+            conn.close()
+            return "❌ Tidak ada data valid untuk disimpan."
+
+        # Jumlah baru vs update dari irisan himpunan kunci (sebelum upsert)
+        cursor.execute("""
+            SELECT COUNT(*)
+            FROM import_answers i
+            JOIN student_answers sa
+              ON sa.student_id = i.student_id AND sa.question_id = i.question_id
+        """)
+        update_count = cursor.fetchone()[0]
+        success_count = loaded_rows - update_count
+
+        cursor.execute("SELECT DISTINCT student_id FROM import_answers")
+        affected_student_ids = {row[0] for row in cursor.fetchall()}
+
+        status_text.text("Menyimpan ke database...")
+        cursor.execute("""
+            INSERT INTO student_answers (student_id, question_id, answer, created_at)
+            SELECT student_id, question_id, answer, datetime('now', '+8 hours')
+            FROM import_answers
+            WHERE true
+            ON CONFLICT(student_id, question_id) DO UPDATE SET
+                answer = excluded.answer,
+                created_at = excluded.created_at
+        """)
+        cursor.execute("DROP TABLE temp.import_answers")
         conn.commit()
+        # Kembalikan koneksi sebelum hitung ulang (kalkulator memakai koneksinya sendiri)
+        conn.close()
+        conn = None
+        progress_bar.progress(1.0)
         
         # --- Automatic Recalculation ---
+        recalculation_error = None
         if affected_student_ids:
             st.info(f"🔄 Menghitung ulang hasil untuk {len(affected_student_ids)} siswa...")
             from utils.holland_calculator import HollandCalculator
             calculator = HollandCalculator()
-            for sid in affected_student_ids:
-                try:
-                    calculator.process_test_completion(sid)
-                except Exception as e:
-                    print(f"Error recalculating for student {sid}: {e}")
+            try:
+                calculator.process_test_completion_batch(sorted(affected_student_ids))
+            except Exception as e:
+                print(traceback.format_exc())
+                recalculation_error = e
+                st.error(
+                    f"❌ Jawaban tersimpan, tetapi hitung ulang hasil {len(affected_student_ids)} siswa gagal: {e}. "
+                    "Jalankan scripts/recalculate_results.py untuk mengulang."
+                )
 
         progress_bar.empty()
         status_text.empty()
-        conn.close()
 
         # Summary
-        st.success("✅ Data berhasil diproses!")
-        col1, col2, col3, col4 = st.columns(4)
+        ignored_count = invalid_answer_count + invalid_student_count + invalid_question_count
+        if recalculation_error is None:
+            st.success("✅ Data berhasil diproses!")
+        col1, col2, col3 = st.columns(3)
         with col1:
             st.metric("📥 Data Baru", success_count)
         with col2:
             st.metric("🔄 Data Diupdate", update_count)
         with col3:
-            st.metric("⚠️ Diabaikan", len(invalid_answers) + len(invalid_students) + len(invalid_questions))
-        with col4:
-            st.metric("❌ Error", error_count)
-
-        if bad_rows:
-            with st.expander("🔍 Baris yang error (preview)"):
-                st.write(bad_rows[:20])
+            st.metric("⚠️ Diabaikan", ignored_count)
 
         # preview
         with st.expander("📊 Detail Upload"):
             st.write(f"**Total baris diproses:** {total_rows}")
-            st.write(f"**Siswa unik:** {df['student_id'].nunique()}")
-            st.write(f"**Soal dijawab:** {df['question_id'].nunique()}")
+            st.write(f"**Siswa unik:** {unique_students}")
+            st.write(f"**Soal dijawab:** {unique_questions}")
             st.write("**Preview 5 baris pertama:**")
-            st.dataframe(df[["student_id", "question_id", "answer"]].head(), use_container_width=True)
+            st.dataframe(preview, use_container_width=True)
 
-        return f"✅ Data jawaban siswa berhasil dimasukkan ke database. Baru: {success_count}, Update: {update_count}, Errors: {error_count}"
+        if recalculation_error is not None:
+            return (f"⚠️ Data jawaban siswa tersimpan (Baru: {success_count}, Update: {update_count}, "
+                    f"Diabaikan: {ignored_count}), tetapi hitung ulang hasil gagal: {recalculation_error}")
+        return (f"✅ Data jawaban siswa berhasil dimasukkan ke database. Baru: {success_count}, "
+                f"Update: {update_count}, Diabaikan: {ignored_count}")
 
     except Exception as e:
         print(traceback.format_exc())
@@ -0,0 +1,299 @@
+"""
+Antrian job laporan admin di latar belakang.
+
+Job dicatat di tabel report_jobs (status bertahan lintas restart) dan
+dikerjakan oleh thread pool milik proses. File laporan disimpan di folder
+reports/ di samping database dan diberi kunci revisi data yang dimuatnya;
+permintaan identik selama data belum berubah langsung memakai file yang sama.
+Job yang berjalan mencatat pemiliknya (host, pid) dan heartbeat, sehingga
+proses lain hanya mengantrikan ulang job yang pemiliknya sudah berhenti.
+"""
+import hashlib
+import json
+import os
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional
+
+from database.db_manager import DatabaseManager
+from services.export_manager import ExportManager, REPORT_SHEETS
+
+# Tabel yang isinya masuk ke laporan; perubahan pada salah satunya membuat laporan baru
+REPORT_SOURCE_TABLES = ('test_results', 'student_answers', 'users', 'majors', 'questions')
+
+REPORT_DIR_NAME = "reports"
+REPORT_WORKERS = int(os.environ.get("HOLLAND_REPORT_WORKERS", "1"))
+# Jumlah file laporan selesai yang disimpan; yang lebih lama dihapus
+REPORT_KEEP_FILES = int(os.environ.get("HOLLAND_REPORT_KEEP", "10"))
+# Job yang berjalan memperbarui heartbeat_at; job tanpa heartbeat selama
+# REPORT_STALE_SECONDS dianggap yatim (proses pemiliknya berhenti)
+REPORT_HEARTBEAT_SECONDS = int(os.environ.get("HOLLAND_REPORT_HEARTBEAT", "30"))
+REPORT_STALE_SECONDS = int(os.environ.get("HOLLAND_REPORT_STALE", "300"))
+# Pool koneksi terpisah untuk worker & heartbeat (slot sendiri, tidak berebut dengan halaman)
+REPORT_POOL_NAME = "report-jobs"
+
+JOB_COLUMNS = ('id', 'cache_key', 'sheets', 'status', 'file_path', 'error',
+               'requested_by', 'created_at', 'started_at', 'finished_at')
+
+_executor = None
+_executor_lock = threading.Lock()
+# Job yang sedang dikerjakan thread pool proses ini
+_running_jobs = set()
+
+
+def report_dir(db_path):
+    """Folder laporan di samping file database"""
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), REPORT_DIR_NAME)
+
+
+def _normalize_sheets(sheets: Optional[Iterable[str]]):
+    selected = [key for key in REPORT_SHEETS if sheets is None or key in set(sheets)]
+    if not selected:
+        raise ValueError("Pilih minimal satu sheet untuk laporan.")
+    return selected
+
+
+def report_cache_key(conn, sheets: Optional[Iterable[str]] = None) -> str:
+    """Kunci laporan: revisi tabel sumber + daftar sheet"""
+    db = DatabaseManager()
+    revisions = [db.get_revision(table, conn) for table in REPORT_SOURCE_TABLES]
+    raw = json.dumps([revisions, _normalize_sheets(sheets)], separators=(',', ':'))
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+def _job_dict(row) -> Optional[Dict]:
+    if row is None:
+        return None
+    job = dict(zip(JOB_COLUMNS, row))
+    job['sheets'] = json.loads(job['sheets'])
+    return job
+
+
+def get_job(job_id: int) -> Optional[Dict]:
+    """Status satu job laporan"""
+    with DatabaseManager().connection() as conn:
+        row = conn.execute(
+            f"SELECT {', '.join(JOB_COLUMNS)} FROM report_jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+    return _job_dict(row)
+
+
+def find_report_job(sheets: Optional[Iterable[str]] = None) -> Optional[Dict]:
+    """
+    Job terbaru untuk data saat ini dan sheet yang sama (selesai, berjalan,
+    atau gagal); None bila laporan untuk revisi ini belum pernah diminta.
+    """
+    executor = _get_executor()
+    with DatabaseManager().connection() as conn:
+        _requeue_orphaned_jobs(conn, executor)
+        cache_key = report_cache_key(conn, sheets)
+        return _find_job(conn, cache_key, ('done', 'queued', 'running', 'failed'))
+
+
+def _find_job(conn, cache_key, statuses):
+    placeholders = ', '.join(['?'] * len(statuses))
+    rows = conn.execute(f"""
+        SELECT {', '.join(JOB_COLUMNS)}
+        FROM report_jobs
+        WHERE cache_key = ? AND status IN ({placeholders})
+        ORDER BY id DESC
+    """, (cache_key, *statuses)).fetchall()
+    for row in rows:
+        job = _job_dict(row)
+        # File laporan bisa sudah dihapus dari disk
+        if job['status'] != 'done' or (job['file_path'] and os.path.exists(job['file_path'])):
+            return job
+    return None
+
+
+def submit_report_job(sheets: Optional[Iterable[str]] = None,
+                      requested_by: Optional[int] = None) -> Dict:
+    """
+    Minta laporan untuk data saat ini.
+    Mengembalikan job selesai (file cache) atau job yang sedang berjalan bila ada;
+    selain itu job baru dimasukkan ke antrian.
+    """
+    selected = _normalize_sheets(sheets)
+    executor = _get_executor()
+    db = DatabaseManager()
+    with db.connection() as conn:
+        _requeue_orphaned_jobs(conn, executor)
+        cache_key = report_cache_key(conn, selected)
+        existing = _find_job(conn, cache_key, ('done', 'queued', 'running'))
+        if existing is not None:
+            return existing
+        cursor = conn.execute(
+            "INSERT INTO report_jobs (cache_key, sheets, status, requested_by) VALUES (?, ?, 'queued', ?)",
+            (cache_key, json.dumps(selected), requested_by)
+        )
+        job_id = cursor.lastrowid
+
+    executor.submit(_run_job, job_id)
+    return get_job(job_id)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Thread pool proses ini; saat dibuat, job yatim dari proses sebelumnya dipulihkan"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(1, REPORT_WORKERS),
+                                           thread_name_prefix="report-job")
+            _recover_jobs(_executor)
+        return _executor
+
+
+def _recover_jobs(executor):
+    # Job 'queued' tidak punya pemilik: siapa pun boleh mengerjakannya (klaim di _run_job atomik)
+    with DatabaseManager().connection() as conn:
+        _requeue_orphaned_jobs(conn, executor)
+        queued = [row[0] for row in conn.execute(
+            "SELECT id FROM report_jobs WHERE status = 'queued' ORDER BY id"
+        )]
+    for job_id in queued:
+        executor.submit(_run_job, job_id)
+
+
+def _owner_alive(job_id, host, pid) -> bool:
+    """
+    Apakah proses pemilik job masih hidup. Hanya bisa dipastikan untuk proses di
+    host ini (selain itu dianggap hidup dan diputuskan oleh heartbeat).
+    """
+    if host != socket.gethostname() or pid is None:
+        return True
+    if pid == os.getpid():
+        # pid sama tapi job tidak dikerjakan di sini: sisa proses lama dengan pid yang dipakai ulang
+        return job_id in _running_jobs
+    if os.name == 'nt':
+        # os.kill(pid, 0) di Windows mengirim CTRL_C_EVENT, bukan cek keberadaan proses
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _requeue_orphaned_jobs(conn, executor) -> None:
+    """
+    Antrikan ulang job 'running' yang pemiliknya sudah berhenti (pid hilang di host
+    ini) atau heartbeat-nya melewati REPORT_STALE_SECONDS. Job milik proses lain
+    yang masih hidup tidak disentuh.
+    """
+    rows = conn.execute(f"""
+        SELECT id, owner_host, owner_pid, COALESCE(heartbeat_at, started_at),
+               COALESCE(heartbeat_at, started_at) < datetime('now', '-{REPORT_STALE_SECONDS} seconds')
+        FROM report_jobs
+        WHERE status = 'running'
+    """).fetchall()
+    requeued = []
+    for job_id, host, pid, beat, stale in rows:
+        if not stale and _owner_alive(job_id, host, pid):
+            continue
+        # Bandingkan heartbeat: bila proses lain lebih dulu mengantrikan ulang, rowcount 0
+        if conn.execute("""
+            UPDATE report_jobs
+            SET status = 'queued', started_at = NULL, heartbeat_at = NULL, owner_host = NULL, owner_pid = NULL
+            WHERE id = ? AND status = 'running' AND COALESCE(heartbeat_at, started_at) IS ?
+        """, (job_id, beat)).rowcount:
+            requeued.append(job_id)
+    if requeued:
+        conn.commit()
+    for job_id in requeued:
+        executor.submit(_run_job, job_id)
+
+
+def _worker_db() -> DatabaseManager:
+    """DatabaseManager untuk thread latar belakang: satu slot per worker + heartbeat"""
+    workers = max(1, REPORT_WORKERS)
+    return DatabaseManager(pool_size=2 * workers, pool_name=REPORT_POOL_NAME)
+
+
+def _heartbeat(db, job_id, owner, stop) -> None:
+    """Perbarui heartbeat_at selama job berjalan"""
+    while not stop.wait(REPORT_HEARTBEAT_SECONDS):
+        try:
+            with db.connection() as conn:
+                conn.execute("""
+                    UPDATE report_jobs SET heartbeat_at = CURRENT_TIMESTAMP
+                    WHERE id = ? AND status = 'running' AND owner_host = ? AND owner_pid = ?
+                """, (job_id, *owner))
+        except Exception as e:
+            print(f"Warning: heartbeat job laporan {job_id} gagal - {e}")
+
+
+def _run_job(job_id: int) -> None:
+    """Dikerjakan di thread pool: klaim job, tulis laporan ke disk, catat hasilnya"""
+    db = _worker_db()
+    owner = (socket.gethostname(), os.getpid())
+    _running_jobs.add(job_id)
+    try:
+        with db.connection() as conn:
+            # Klaim atomik: job hanya dikerjakan satu worker
+            claimed = conn.execute("""
+                UPDATE report_jobs
+                SET status = 'running', started_at = CURRENT_TIMESTAMP, heartbeat_at = CURRENT_TIMESTAMP,
+                    owner_host = ?, owner_pid = ?
+                WHERE id = ? AND status = 'queued'
+            """, (*owner, job_id)).rowcount
+            row = conn.execute("SELECT cache_key, sheets FROM report_jobs WHERE id = ?", (job_id,)).fetchone()
+        if claimed and row is not None:
+            stop = threading.Event()
+            threading.Thread(target=_heartbeat, args=(db, job_id, owner, stop),
+                             name=f"report-heartbeat-{job_id}", daemon=True).start()
+            try:
+                _write_report(db, job_id, owner, row[0], json.loads(row[1]))
+            finally:
+                stop.set()
+    finally:
+        _running_jobs.discard(job_id)
+
+
+def _write_report(db, job_id, owner, cache_key, sheets) -> None:
+    directory = report_dir(db.db_path)
+    final_path = os.path.join(directory, f"report_{cache_key}.xlsx")
+    tmp_path = os.path.join(directory, f".report_{job_id}.xlsx.tmp")
+    try:
+        os.makedirs(directory, exist_ok=True)
+        ExportManager(db).export_full_admin_report(path=tmp_path, sheets=sheets)
+        os.replace(tmp_path, final_path)
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        with db.connection() as conn:
+            conn.execute("""
+                UPDATE report_jobs SET status = 'failed', error = ?, finished_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND owner_host = ? AND owner_pid = ?
+            """, (str(e), job_id, *owner))
+        return
+
+    # Bila job sempat diantrikan ulang (dianggap yatim), status milik pemilik barunya
+    with db.connection() as conn:
+        conn.execute("""
+            UPDATE report_jobs SET status = 'done', file_path = ?, finished_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND owner_host = ? AND owner_pid = ?
+        """, (final_path, job_id, *owner))
+        _expire_old_reports(conn)
+
+
+def _expire_old_reports(conn):
+    """Hapus file laporan selesai di luar REPORT_KEEP_FILES terbaru"""
+    rows = conn.execute("""
+        SELECT id, file_path FROM report_jobs
+        WHERE status = 'done'
+        ORDER BY id DESC
+    """).fetchall()
+    # Job dengan kunci sama berbagi file; jangan hapus file yang masih dipakai job terbaru
+    kept_paths = {path for _, path in rows[:REPORT_KEEP_FILES]}
+    for job_id, path in rows[REPORT_KEEP_FILES:]:
+        if path and path not in kept_paths and os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+        conn.execute(
+            "UPDATE report_jobs SET status = 'expired', file_path = NULL WHERE id = ?", (job_id,)
+        )
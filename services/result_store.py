@@ -0,0 +1,426 @@
+"""
+Akses hasil tes ter-normalisasi.
+
+Skor RIASEC, tipe teratas dan Holland Code disimpan sebagai kolom di
+test_results; peringkat jurusan per siswa disimpan di result_rankings.
+Ringkasan dan ranking dapat dibaca langsung dengan SQL tanpa json.loads
+per baris. Baris lama yang hanya berisi JSON di-upgrade otomatis saat dibaca.
+
+Kolom anp_results berisi payload ringkas (COMPACT_RESULT_FORMAT): hanya detail
+perhitungan per siswa dan rujukan ke model_versions (snapshot profil jurusan
+dan matriks inner dependency). Bentuk lama dibangun ulang oleh
+expand_result_payload untuk UI.
+"""
+import hashlib
+import json
+import threading
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from database.exame_system import (
+    RESULT_SCORE_COLUMNS,
+    RESULT_TOP_TYPE_COLUMNS,
+    RIASEC_TYPES,
+)
+
+INSERT_RANKING_SQL = """
+    INSERT INTO result_rankings (student_id, rank, major_id, major_name, anp_score)
+    VALUES (?, ?, ?, ?, ?)
+"""
+
+INSERT_MODEL_VERSION_SQL = """
+    INSERT OR IGNORE INTO model_versions (fingerprint, majors, inner_dependency_matrix)
+    VALUES (?, ?, ?)
+"""
+
+# Penanda payload ringkas di test_results.anp_results
+COMPACT_RESULT_FORMAT = 2
+
+# Snapshot model bersifat immutable (dialamatkan oleh fingerprint), aman di-cache per proses
+_model_cache: Dict[str, Dict] = {}
+_model_lock = threading.Lock()
+
+
+def _anp_core(anp_results) -> Optional[dict]:
+    """Bagian inti hasil ANP dari format bertingkat ({'anp_results': {...}}) maupun datar"""
+    if not isinstance(anp_results, dict):
+        return None
+    core = anp_results.get('anp_results', anp_results)
+    return core if isinstance(core, dict) else None
+
+
+# ==========================================
+# PENULISAN
+# ==========================================
+def extract_rankings(anp_results: Optional[dict]) -> List[Tuple[int, str, float]]:
+    """Daftar (rank, nama jurusan, skor ANP) dari hasil ANP (format bertingkat maupun datar)"""
+    core = _anp_core(anp_results)
+    if core is None:
+        return []
+    return [
+        (rank, item[0], float(item[1].get('anp_score', 0)))
+        for rank, item in enumerate(core.get('ranked_majors') or [], 1)
+    ]
+
+
+def model_snapshot(anp_results) -> Optional[Dict]:
+    """
+    Snapshot model bersama dari hasil ANP: profil RIASEC semua jurusan dan
+    matriks inner dependency, beserta fingerprint isinya.
+    None bila hasil tidak memuat profil jurusan (format lama).
+    """
+    core = _anp_core(anp_results)
+    ranked = core.get('ranked_majors') if core else None
+    if not ranked or not all(isinstance(item[1].get('riasec_profile'), dict) for item in ranked):
+        return None
+
+    majors = {name: data['riasec_profile'] for name, data in sorted(ranked, key=lambda item: item[0])}
+    inner = (core.get('calculation_details') or {}).get('inner_dependency_matrix')
+    raw = json.dumps([majors, inner], sort_keys=True, separators=(',', ':'))
+    return {
+        'fingerprint': hashlib.sha256(raw.encode('utf-8')).hexdigest(),
+        'majors': majors,
+        'inner_dependency_matrix': inner,
+    }
+
+
+def compact_result_payload(holland_code: Optional[str], anp_results, model: Optional[Dict]) -> Dict:
+    """
+    Payload ringkas untuk test_results.anp_results: ranking & skor jurusan ada di
+    result_rankings, profil jurusan & matriks konstan di model_versions.
+    """
+    core = _anp_core(anp_results)
+    anp = None
+    if core is not None:
+        anp = {k: v for k, v in core.items() if k not in ('ranked_majors', 'top_5_majors')}
+        if isinstance(anp.get('calculation_details'), dict):
+            anp['calculation_details'] = {
+                k: v for k, v in anp['calculation_details'].items() if k != 'inner_dependency_matrix'
+            }
+    return {
+        'format': COMPACT_RESULT_FORMAT,
+        'holland_code': holland_code,
+        'model_version': model['fingerprint'] if model else None,
+        'anp': anp,
+    }
+
+
+def register_model_versions(conn, models: Iterable[Optional[Dict]]) -> None:
+    """Simpan snapshot model yang belum ada (dalam transaksi pemanggil)"""
+    unique = {m['fingerprint']: m for m in models if m}
+    conn.executemany(
+        INSERT_MODEL_VERSION_SQL,
+        [
+            (fp, json.dumps(m['majors']), json.dumps(m['inner_dependency_matrix']))
+            for fp, m in unique.items()
+        ]
+    )
+
+
+def normalized_result_columns(scores: dict, top_3_types: Sequence[str], holland_code: str) -> tuple:
+    """Nilai kolom ter-normalisasi test_results (urutan RESULT_SCORE_COLUMNS, RESULT_TOP_TYPE_COLUMNS, holland_code)"""
+    top_types = (list(top_3_types) + [None] * len(RESULT_TOP_TYPE_COLUMNS))[:len(RESULT_TOP_TYPE_COLUMNS)]
+    return (
+        tuple(float(scores.get(t, 0)) for t in RIASEC_TYPES)
+        + tuple(top_types)
+        + (holland_code,)
+    )
+
+
+def replace_rankings(conn, rankings_by_student: Dict[int, Iterable[Tuple[int, str, float]]]) -> None:
+    """Ganti peringkat jurusan banyak siswa sekaligus (dalam transaksi pemanggil)"""
+    if not rankings_by_student:
+        return
+    major_ids = dict(conn.execute("SELECT Major, id FROM majors").fetchall())
+    conn.executemany(
+        "DELETE FROM result_rankings WHERE student_id = ?",
+        [(sid,) for sid in rankings_by_student]
+    )
+    conn.executemany(
+        INSERT_RANKING_SQL,
+        [
+            (sid, rank, major_ids.get(name), name, score)
+            for sid, rankings in rankings_by_student.items()
+            for rank, name, score in rankings
+        ]
+    )
+
+
+# ==========================================
+# PEMBACAAN
+# ==========================================
+SUMMARY_SELECT_SQL = f"""
+    SELECT tr.student_id, u.full_name, u.class_name, tr.recommended_major,
+           tr.completed_at, tr.total_items, tr.holland_code,
+           {', '.join(RESULT_TOP_TYPE_COLUMNS)},
+           {', '.join(RESULT_SCORE_COLUMNS)}
+    FROM test_results tr
+    JOIN users u ON tr.student_id = u.id
+"""
+
+
+def _summary_from_row(row) -> Dict:
+    n_types = len(RESULT_TOP_TYPE_COLUMNS)
+    top_types = row[7:7 + n_types]
+    return {
+        'student_id': row[0],
+        'full_name': row[1],
+        'class_name': row[2],
+        'recommended_major': row[3],
+        'completed_at': row[4],
+        'total_items': row[5],
+        'holland_code': row[6],
+        'top_3_types': [t for t in top_types if t],
+        'holland_scores': dict(zip(RIASEC_TYPES, row[7 + n_types:])),
+    }
+
+
+def load_result_summaries(conn, student_ids: Optional[Sequence[int]] = None) -> List[Dict]:
+    """
+    Ringkasan hasil per siswa (nama, kelas, skor, tipe teratas, rekomendasi),
+    terbaru lebih dulu.
+    """
+    where, params = "", []
+    if student_ids is not None:
+        if not student_ids:
+            return []
+        where = f"WHERE tr.student_id IN ({', '.join(['?'] * len(student_ids))})"
+        params = list(student_ids)
+
+    rows = conn.execute(f"{SUMMARY_SELECT_SQL} {where} ORDER BY tr.completed_at DESC", params).fetchall()
+    return [_summary_from_row(row) for row in rows]
+
+
+def _summary_filters(name: Optional[str] = None, class_name: Optional[str] = None,
+                     recommended_major: Optional[str] = None,
+                     date_from: Optional[str] = None, date_to: Optional[str] = None) -> Tuple[str, List]:
+    conditions, params = [], []
+    if name:
+        escaped = name.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        conditions.append("u.full_name LIKE ? ESCAPE '\\'")
+        params.append(f"%{escaped}%")
+    if class_name == '':
+        conditions.append("(u.class_name IS NULL OR u.class_name = '')")
+    elif class_name is not None:
+        conditions.append("u.class_name = ?")
+        params.append(class_name)
+    if recommended_major is not None:
+        conditions.append("tr.recommended_major = ?")
+        params.append(recommended_major)
+    # completed_at tersimpan sebagai 'YYYY-MM-DD HH:MM:SS': rentang string memakai indeks
+    if date_from:
+        conditions.append("tr.completed_at >= ?")
+        params.append(str(date_from))
+    if date_to:
+        conditions.append("tr.completed_at < date(?, '+1 day')")
+        params.append(str(date_to))
+    return (f"WHERE {' AND '.join(conditions)}" if conditions else ""), params
+
+
+def count_result_summaries(conn, **filters) -> int:
+    """Jumlah hasil yang cocok dengan filter `search_result_summaries`"""
+    where, params = _summary_filters(**filters)
+    return conn.execute(
+        f"SELECT COUNT(*) FROM test_results tr JOIN users u ON tr.student_id = u.id {where}", params
+    ).fetchone()[0]
+
+
+def search_result_summaries(conn, page: int = 1, page_size: int = 50, **filters) -> List[Dict]:
+    """
+    Satu halaman ringkasan hasil (terbaru lebih dulu) dengan filter dijalankan di SQL.
+
+    Filter (semua opsional):
+        name: potongan nama siswa (tidak peka huruf besar/kecil)
+        class_name: kelas persis ('' untuk siswa tanpa kelas)
+        recommended_major: jurusan rekomendasi persis
+        date_from, date_to: batas tanggal tes 'YYYY-MM-DD' (inklusif)
+
+    Args:
+        page: nomor halaman mulai dari 1
+        page_size: jumlah baris per halaman
+    """
+    where, params = _summary_filters(**filters)
+    offset = (max(int(page), 1) - 1) * page_size
+    rows = conn.execute(
+        f"{SUMMARY_SELECT_SQL} {where} ORDER BY tr.completed_at DESC, tr.student_id DESC LIMIT ? OFFSET ?",
+        params + [page_size, offset]
+    ).fetchall()
+    return [_summary_from_row(row) for row in rows]
+
+
+def load_answer_details(conn, student_id: int) -> List[Tuple]:
+    """Jawaban per butir soal seorang siswa: (id soal, teks, tipe, jawaban)"""
+    return conn.execute("""
+        SELECT q.id, q.question_text, q.holland_type, sa.answer
+        FROM student_answers sa
+        JOIN questions q ON sa.question_id = q.id
+        WHERE sa.student_id = ?
+        ORDER BY q.id
+    """, (student_id,)).fetchall()
+
+
+def load_top_rankings(conn, limit: int = 5,
+                      student_ids: Optional[Sequence[int]] = None) -> Dict[int, List[Dict]]:
+    """Peringkat teratas per siswa: {student_id: [{'rank', 'major_name', 'anp_score'}, ...]}"""
+    where, params = "WHERE rank <= ?", [limit]
+    if student_ids is not None:
+        if not student_ids:
+            return {}
+        where += f" AND student_id IN ({', '.join(['?'] * len(student_ids))})"
+        params += list(student_ids)
+
+    rankings: Dict[int, List[Dict]] = {}
+    for sid, rank, name, score in conn.execute(f"""
+        SELECT student_id, rank, major_name, anp_score
+        FROM result_rankings
+        {where}
+        ORDER BY student_id, rank
+    """, params):
+        rankings.setdefault(sid, []).append({'rank': rank, 'major_name': name, 'anp_score': score})
+    return rankings
+
+
+def _load_model_version(conn, fingerprint: Optional[str]) -> Optional[Dict]:
+    if not fingerprint:
+        return None
+    with _model_lock:
+        cached = _model_cache.get(fingerprint)
+    if cached is not None:
+        return cached
+
+    row = conn.execute(
+        "SELECT majors, inner_dependency_matrix FROM model_versions WHERE fingerprint = ?",
+        (fingerprint,)
+    ).fetchone()
+    if row is None:
+        return None
+    model = {
+        'fingerprint': fingerprint,
+        'majors': json.loads(row[0]),
+        'inner_dependency_matrix': json.loads(row[1]) if row[1] else None,
+    }
+    with _model_lock:
+        _model_cache[fingerprint] = model
+    return model
+
+
+def expand_result_payload(conn, student_id: int, payload) -> Dict:
+    """
+    Bangun ulang bentuk lama anp_results ({'holland_code', 'holland_filter',
+    'anp_results': {'ranked_majors', 'top_5_majors', ...}}) dari payload ringkas.
+    Payload format lama dikembalikan apa adanya.
+    """
+    if not isinstance(payload, dict) or payload.get('format') != COMPACT_RESULT_FORMAT:
+        return payload
+
+    model = _load_model_version(conn, payload.get('model_version'))
+    if model:
+        majors = model['majors']
+    else:
+        # ANP gagal (tanpa snapshot model): filter meloloskan semua jurusan, urutan tabel majors
+        majors = {
+            row[0]: dict(zip(RIASEC_TYPES, row[1:]))
+            for row in conn.execute(f"SELECT Major, {', '.join(RIASEC_TYPES)} FROM majors ORDER BY id")
+        }
+    holland_filter = {
+        'filtered_majors': list(majors),
+        'similarity_scores': {name: 1.0 for name in majors},
+    }
+
+    anp_results = None
+    anp = payload.get('anp')
+    if anp is not None:
+        ranked = [
+            (name, {'anp_score': score, 'riasec_profile': majors.get(name), 'similarity': 1.0})
+            for name, score in conn.execute(
+                "SELECT major_name, anp_score FROM result_rankings WHERE student_id = ? ORDER BY rank",
+                (student_id,)
+            )
+        ]
+        anp_results = {
+            **anp,
+            'ranked_majors': ranked,
+            'top_5_majors': [{'major_name': name, **data} for name, data in ranked[:5]],
+        }
+        if isinstance(anp.get('calculation_details'), dict):
+            anp_results['calculation_details'] = {
+                **anp['calculation_details'],
+                'inner_dependency_matrix': model['inner_dependency_matrix'] if model else None,
+            }
+
+    return {
+        'holland_code': payload.get('holland_code'),
+        'holland_filter': holland_filter,
+        'anp_results': anp_results,
+    }
+
+
+def load_result_detail(conn, student_id: int) -> Optional[Dict]:
+    """Hasil lengkap satu siswa dengan anp_results dalam bentuk lama (untuk halaman detail)"""
+    row = conn.execute("""
+        SELECT holland_scores, anp_results, top_3_types, recommended_major, completed_at
+        FROM test_results
+        WHERE student_id = ?
+    """, (student_id,)).fetchone()
+    if row is None:
+        return None
+    return {
+        'holland_scores': json.loads(row[0]),
+        'anp_results': expand_result_payload(conn, student_id, json.loads(row[1]) if row[1] else {}),
+        'top_3_types': json.loads(row[2]),
+        'recommended_major': row[3],
+        'completed_at': row[4],
+    }
+
+
+# ==========================================
+# MIGRASI PAYLOAD RINGKAS
+# ==========================================
+def compact_stored_results(conn, after_student_id: int = 0, batch_size: int = 500) -> Dict:
+    """
+    Ringkas satu potongan baris test_results (urut student_id > after_student_id)
+    ke COMPACT_RESULT_FORMAT. Ranking ditulis ulang dari JSON lama agar konsisten.
+
+    Returns:
+        dict berisi last_id (None bila habis), compacted, skipped, bytes_before, bytes_after
+    """
+    rows = conn.execute("""
+        SELECT student_id, anp_results
+        FROM test_results
+        WHERE student_id > ?
+        ORDER BY student_id
+        LIMIT ?
+    """, (after_student_id, batch_size)).fetchall()
+
+    stats = {'last_id': rows[-1][0] if rows else None, 'compacted': 0, 'skipped': 0,
+             'bytes_before': 0, 'bytes_after': 0}
+    updates, rankings, models = [], {}, {}
+    for student_id, raw in rows:
+        try:
+            payload = json.loads(raw) if raw else None
+        except ValueError:
+            payload = None
+        if not isinstance(payload, dict) or payload.get('format') == COMPACT_RESULT_FORMAT:
+            stats['skipped'] += 1
+            continue
+
+        core = _anp_core(payload)
+        model = model_snapshot(payload)
+        if core is not None and core.get('ranked_majors') and model is None:
+            # Format lama tanpa profil jurusan: tidak bisa dibangun ulang, biarkan apa adanya
+            stats['skipped'] += 1
+            continue
+        if model:
+            models.setdefault(model['fingerprint'], model)
+
+        holland_code = payload.get('holland_code') if 'anp_results' in payload else None
+        compact = json.dumps(compact_result_payload(holland_code, core, model))
+        rankings[student_id] = extract_rankings(core)
+        updates.append((compact, student_id))
+        stats['compacted'] += 1
+        stats['bytes_before'] += len(raw)
+        stats['bytes_after'] += len(compact)
+
+    register_model_versions(conn, models.values())
+    replace_rankings(conn, rankings)
+    conn.executemany("UPDATE test_results SET anp_results = ? WHERE student_id = ?", updates)
+    return stats
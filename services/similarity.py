@@ -0,0 +1,110 @@
+"""
+Ranking jurusan berdasarkan cosine similarity profil RIASEC siswa dan jurusan.
+
+Similarity seluruh siswa x jurusan dihitung sebagai satu perkalian matriks
+(siswa x 6) @ (6 x jurusan) dengan norma yang dihitung sekali; top-k diambil
+dengan argpartition sehingga tidak perlu mengurutkan semua jurusan.
+"""
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from database.exame_system import RESULT_SCORE_COLUMNS, RIASEC_TYPES
+
+
+class MajorProfiles:
+    """Matriks profil jurusan (jurusan x kriteria) beserta normanya"""
+
+    def __init__(self, major_map: Mapping[str, Mapping[str, float]],
+                 criteria: Sequence[str] = RIASEC_TYPES):
+        self.names = list(major_map.keys())
+        self.criteria = list(criteria)
+        self.matrix = np.array(
+            [[float(major_map[m][c]) for c in self.criteria] for m in self.names],
+            dtype=float
+        ).reshape(len(self.names), len(self.criteria))
+        self.norms = np.linalg.norm(self.matrix, axis=1)
+
+    @classmethod
+    def from_db(cls, conn, criteria: Sequence[str] = RIASEC_TYPES) -> 'MajorProfiles':
+        """Muat profil semua jurusan dari tabel majors (urutan tabel)"""
+        rows = conn.execute(f"SELECT Major, {', '.join(criteria)} FROM majors").fetchall()
+        return cls({row[0]: dict(zip(criteria, row[1:])) for row in rows}, criteria)
+
+
+def cosine_similarity_matrix(student_scores, majors: MajorProfiles) -> np.ndarray:
+    """
+    Cosine similarity (siswa x jurusan).
+    Siswa atau jurusan dengan vektor nol mendapat similarity 0.
+    """
+    scores = np.asarray(student_scores, dtype=float).reshape(-1, len(majors.criteria))
+    student_norms = np.linalg.norm(scores, axis=1)
+    denom = np.outer(student_norms, majors.norms)
+    dots = scores @ majors.matrix.T
+    return np.divide(dots, denom, out=np.zeros_like(dots), where=denom > 0)
+
+
+def top_k_indices(similarity: np.ndarray, k: int = 5) -> np.ndarray:
+    """
+    Indeks k jurusan teratas per baris, urut skor menurun.
+    Skor sama diurutkan sesuai urutan jurusan (seperti sorted(..., reverse=True)).
+    """
+    n_rows, n_majors = similarity.shape
+    k = min(k, n_majors)
+    if k == 0:
+        return np.empty((n_rows, 0), dtype=int)
+
+    neg = -similarity
+    if k < n_majors:
+        top = np.argpartition(neg, k - 1, axis=1)[:, :k]
+    else:
+        top = np.tile(np.arange(n_majors), (n_rows, 1))
+    top_neg = np.take_along_axis(neg, top, axis=1)
+    top = np.take_along_axis(top, np.lexsort((top, top_neg), axis=1), axis=1)
+
+    # Nilai sama di batas top-k: argpartition bisa memilih jurusan yang lebih akhir
+    if k < n_majors:
+        kth = np.take_along_axis(neg, top[:, -1:], axis=1)
+        tied = np.count_nonzero(neg <= kth, axis=1) > k
+        for row in np.flatnonzero(tied):
+            top[row] = np.argsort(neg[row], kind='stable')[:k]
+    return top
+
+
+def rank_by_similarity(student_scores, majors: MajorProfiles,
+                       k: int = 5) -> List[List[Tuple[str, float]]]:
+    """Top-k (nama jurusan, similarity) untuk setiap baris skor siswa"""
+    similarity = cosine_similarity_matrix(student_scores, majors)
+    top = top_k_indices(similarity, k)
+    top_scores = np.take_along_axis(similarity, top, axis=1)
+    return [
+        [(majors.names[i], float(s)) for i, s in zip(idx_row, score_row)]
+        for idx_row, score_row in zip(top, top_scores)
+    ]
+
+
+def similarity_rankings(conn, student_ids: Optional[Sequence[int]] = None, k: int = 5,
+                        majors: Optional[MajorProfiles] = None) -> Dict[int, List[Tuple[str, float]]]:
+    """
+    Ranking similarity top-k per siswa dari kolom skor test_results,
+    untuk dibandingkan dengan ranking ANP di result_rankings.
+
+    Returns:
+        {student_id: [(nama jurusan, similarity), ...]}
+    """
+    majors = majors or MajorProfiles.from_db(conn)
+    where, params = "", []
+    if student_ids is not None:
+        if not student_ids:
+            return {}
+        where = f"WHERE student_id IN ({', '.join(['?'] * len(student_ids))})"
+        params = list(student_ids)
+
+    rows = conn.execute(
+        f"SELECT student_id, {', '.join(RESULT_SCORE_COLUMNS)} FROM test_results {where}",
+        params
+    ).fetchall()
+    if not rows:
+        return {}
+    ranked = rank_by_similarity([row[1:] for row in rows], majors, k)
+    return {row[0]: ranking for row, ranking in zip(rows, ranked)}
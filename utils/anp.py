@@ -1,7 +1,11 @@
 import numpy as np
 import pandas as pd
-from scipy.linalg import eig
 from database.db_manager import DatabaseManager
+from .anp_cache import (
+    majors_fingerprint,
+    load_alternative_priorities,
+    store_alternative_priorities,
+)
 
 
 class ANPProcessor:
@@ -34,9 +38,8 @@ class ANPProcessor:
     def load_majors_from_db(self):
         """Ambil data jurusan (alternatif) dari tabel majors"""
         try:
-            conn = self.db.get_connection()
-            df = pd.read_sql_query("SELECT * FROM majors", conn)
-            conn.close()
+            with self.db.connection() as conn:
+                df = pd.read_sql_query("SELECT * FROM majors", conn)
 
             if df.empty:
                 raise ValueError("Tabel 'majors' kosong.")
@@ -56,95 +59,111 @@ class ANPProcessor:
             raise RuntimeError(f"Gagal memuat data jurusan: {e}")
 
     # ================= EIGENVECTOR =================
+    def calculate_priority_batch(self, matrices, tol=1e-12, max_iter=1000):
+        """
+        Hitung vektor Perron dan lambda_max untuk tumpukan matriks resiprokal positif.
+
+        Tebakan awal memakai rata-rata geometrik baris (tepat untuk matriks
+        konsisten), lalu diperhalus dengan power iteration hingga perubahan
+        (norma L1) di bawah `tol`. Semua matriks (k, n, n) diproses sekaligus.
+
+        Returns:
+            (weights (k, n), lambda_max (k,))
+        """
+        A = np.asarray(matrices, dtype=float)
+        v = np.exp(np.log(A).mean(axis=-1))
+        v /= v.sum(axis=-1, keepdims=True)
+
+        # Hanya matriks yang belum konvergen yang terus diiterasi, sehingga hasil
+        # setiap matriks sama persis dengan bila dihitung sendiri.
+        flat_A = A.reshape(-1, *A.shape[-2:])
+        flat_v = v.reshape(-1, A.shape[-1])
+        active = np.arange(flat_A.shape[0])
+        active_A = flat_A
+        for _ in range(max_iter):
+            nxt = (active_A @ flat_v[active][..., None])[..., 0]
+            nxt /= nxt.sum(axis=-1, keepdims=True)
+            residual = np.abs(nxt - flat_v[active]).sum(axis=-1)
+            flat_v[active] = nxt
+            still = residual >= tol
+            if not still.any():
+                break
+            if not still.all():
+                active = active[still]
+                active_A = active_A[still]
+        v = flat_v.reshape(v.shape)
+
+        lambda_max = (A @ v[..., None])[..., 0].sum(axis=-1)
+        return v, lambda_max
+
     def calculate_priority(self, matrix):
         """Hitung vektor prioritas (eigenvector) utama"""
-        eigenvalues, eigenvectors = eig(matrix)
-        max_idx = np.argmax(eigenvalues.real)
-        vec = eigenvectors[:, max_idx].real
-        return np.abs(vec / np.sum(vec)), float(eigenvalues[max_idx].real)
+        weights, lambda_max = self.calculate_priority_batch(np.asarray(matrix)[None, ...])
+        return weights[0], float(lambda_max[0])
+
+    # ================= PAIRWISE (VEKTORISASI) =================
+    def _pairwise_from_scores(self, scores):
+        """
+        Bangun matriks perbandingan berpasangan dari vektor skor dengan broadcasting.
+
+        `scores` boleh berbentuk (n,) atau bertumpuk (..., n); hasilnya (..., n, n).
+        Aturannya sama dengan versi loop: segitiga atas berisi rasio s_i / s_j
+        (s_j == 0 -> 9 jika s_i > 0, selain itu 1) yang di-clip ke [1/9, 9],
+        segitiga bawah berisi kebalikannya, dan diagonal bernilai 1.
+        """
+        scores = np.asarray(scores, dtype=float)
+        n = scores.shape[-1]
+        si = scores[..., :, None]
+        sj = scores[..., None, :]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = si / sj
+        ratio = np.where(sj == 0, np.where(si > 0, 9.0, 1.0), ratio)
+        ratio = np.clip(ratio, 1/9, 9)
+
+        upper = np.triu(np.ones((n, n), dtype=bool), k=1)
+        lower = np.swapaxes(upper, -1, -2)
+        matrix = np.ones(ratio.shape)
+        matrix = np.where(upper, ratio, matrix)
+        matrix = np.where(lower, np.swapaxes(1 / ratio, -1, -2), matrix)
+        return matrix
 
     # ================= PAIRWISE KRITERIA =================
     def build_criteria_pairwise(self, riasec_scores):
         """Bangun matriks perbandingan berpasangan kriteria berdasarkan skor siswa"""
-        size = len(self.riasec_types)
-        matrix = np.ones((size, size))
         scores = [max(float(riasec_scores.get(c, 0)), 1e-4) for c in self.riasec_types]
-
-        for i in range(size):
-            for j in range(i+1, size):
-                ratio = scores[i] / scores[j]
-                ratio = np.clip(ratio, 1/9, 9)
-                matrix[i,j] = ratio
-                matrix[j,i] = 1/ratio
-        return matrix
+        return self._pairwise_from_scores(scores)
 
     # ================= PAIRWISE ALTERNATIF =================
     def build_alt_pairwise_by_criterion(self, major_map, criterion):
         """Bangun matriks perbandingan berpasangan alternatif untuk kriteria tertentu"""
         majors = list(major_map.keys())
-        n = len(majors)
-        matrix = np.ones((n, n))
         scores = [major_map[m][criterion] for m in majors]
+        return self._pairwise_from_scores(scores), majors
 
-        for i in range(n):
-            for j in range(i+1, n):
-                if scores[j] == 0:
-                    ratio = 9 if scores[i] > 0 else 1
-                else:
-                    ratio = scores[i] / scores[j]
-                ratio = np.clip(ratio, 1/9, 9)
-                matrix[i,j] = ratio
-                matrix[j,i] = 1/ratio
-        return matrix, majors
-
-    # ================= SUPERMATRIX =================
-    def build_supermatrix(self, criteria_weights, alt_weights):
-        """Bangun Supermatrix (Pure ANP)"""
-        n_c = len(self.riasec_types)
-        n_a = len(next(iter(alt_weights.values())))
-        size = n_c + n_a
-        S = np.zeros((size, size))
-
-        # W11: Inner Dependency (Feedback/Influence antar kriteria)
-        # Menggunakan matriks korelasi Holland Hexagon dikalikan bobot kriteria
-        for j in range(n_c):
-            for i in range(n_c):
-                S[i, j] = self.holland_correlation[i, j] * criteria_weights[i]
-
-        # W21: Alternatif terhadap Kriteria
-        for j, crit in enumerate(self.riasec_types):
-            weights = alt_weights[crit]
-            for i in range(n_a):
-                S[n_c+i, j] = weights[i]
-
-        # W12: Feedback (Kriteria terhadap Alternatif)
-        for j in range(n_a):
-            for i in range(n_c):
-                S[i, n_c+j] = criteria_weights[i]
-
-        # Normalisasi kolom agar stochastic
-        for j in range(size):
-            col_sum = S[:,j].sum()
-            if col_sum > 0:
-                S[:,j] /= col_sum
-        return S
-
-    # ================= LIMIT SUPERMATRIX =================
-    def limit_supermatrix(self, M, it=100):
-        """Hitung Limit Supermatrix"""
-        L = M.copy()
-        for _ in range(it):
-            L = np.dot(L, M)
-        return L
+    def build_alt_pairwise_tensor(self, major_map):
+        """Bangun matriks perbandingan alternatif untuk keenam kriteria sekaligus: (6, n, n)"""
+        majors = list(major_map.keys())
+        scores = np.array([[major_map[m][c] for m in majors] for c in self.riasec_types], dtype=float)
+        return self._pairwise_from_scores(scores), majors
 
     def compute_alternative_priorities(self, major_map):
-        """Hitung prioritas alternatif untuk semua kriteria"""
-        alt_priorities = {}
-        major_names = list(major_map.keys())
-        for crit in self.riasec_types:
-            pw, _ = self.build_alt_pairwise_by_criterion(major_map, crit)
-            weights, _ = self.calculate_priority(pw)
-            alt_priorities[crit] = weights
+        """
+        Hitung prioritas alternatif untuk semua kriteria.
+
+        Hasilnya hanya bergantung pada isi tabel majors (bukan pada siswa),
+        jadi disimpan di cache memori + file .npz dengan kunci hash isi majors.
+        """
+        fingerprint = majors_fingerprint(major_map, self.riasec_types)
+        cached = load_alternative_priorities(self.db.db_path, fingerprint, self.riasec_types)
+        if cached is not None:
+            return cached
+
+        tensor, major_names = self.build_alt_pairwise_tensor(major_map)
+        weights, _ = self.calculate_priority_batch(tensor)
+        alt_priorities = {crit: weights[k] for k, crit in enumerate(self.riasec_types)}
+
+        store_alternative_priorities(self.db.db_path, fingerprint, alt_priorities, major_names)
         return alt_priorities, major_names
 
     def compute_consistency_ratio(self, lambda_max, size):
@@ -155,63 +174,168 @@ class ANPProcessor:
         cr = ci / ri if ri != 0 else 0.0
         return float(ci), float(cr), cr < 0.1
 
-    def calculate_anp_scores(self, riasec_scores, filtered_majors=None):
-        """
-        Hitung skor ANP menggunakan Pure Methodology.
-        """
+    def _select_majors(self, filtered_majors=None):
+        """Ambil peta jurusan (opsional difilter berdasarkan nama)"""
         all_majors = self.load_majors_from_db()
         major_map = {k: v for k, v in all_majors.items() if k in filtered_majors} if filtered_majors else all_majors
 
         if not major_map:
             raise ValueError("Tidak ada jurusan untuk dianalisis")
+        return major_map
 
-        # 1. Kriteria
-        crit_pw = self.build_criteria_pairwise(riasec_scores)
-        crit_weights, lambda_max = self.calculate_priority(crit_pw)
-        ci, cr, is_consistent = self.compute_consistency_ratio(lambda_max, len(self.riasec_types))
+    def stationary_vector_batch(self, K, tol=1e-12, max_iter=1000):
+        """
+        Power iteration bertumpuk untuk matriks kolom-stokastik (k, n, n).
+
+        Returns:
+            (vectors (k, n), iterations (k,), residual (k,))
+        """
+        v = K[..., :, 0].copy()
+        v /= v.sum(axis=-1, keepdims=True)
+        residual = np.full(K.shape[0], np.inf)
+        iterations = np.zeros(K.shape[0], dtype=int)
 
-        # 2. Alternatif
+        # Baris yang sudah konvergen dibekukan agar hasil tiap siswa tidak
+        # bergantung pada siswa lain dalam batch yang sama.
+        active = np.arange(K.shape[0])
+        active_K = K
+        for _ in range(max_iter):
+            nxt = (active_K @ v[active][..., None])[..., 0]
+            nxt /= nxt.sum(axis=-1, keepdims=True)
+            residual[active] = np.abs(nxt - v[active]).sum(axis=-1)
+            v[active] = nxt
+            iterations[active] += 1
+            still = residual[active] >= tol
+            if not still.any():
+                break
+            if not still.all():
+                active = active[still]
+                active_K = active_K[still]
+        return v, iterations, residual
+
+    def limit_alternative_priorities(self, criteria_weights, alt_matrix, tol=1e-12):
+        """
+        Limit supermatrix untuk banyak siswa sekaligus memakai struktur blok.
+
+        Supermatrix penuh (implementasi referensi di scripts/verify_anp.py)
+        berbentuk [[A, B], [C, 0]] dengan semua kolom B sama (bobot kriteria b).
+        Vektor stasionernya memenuhi x_a = C x_c dan x_c = (A + b * 1^T C) x_c,
+        sehingga cukup mencari vektor stasioner matriks 6x6 per siswa, lalu x_a = C x_c.
+
+        Args:
+            criteria_weights: (k, 6) bobot kriteria per siswa
+            alt_matrix: (n_a, 6) prioritas alternatif per kriteria (kolom)
+
+        Returns:
+            (final_priorities (k, n_a), iterations (k,), residual (k,))
+        """
+        w = np.asarray(criteria_weights, dtype=float)
+        alt_col_sums = alt_matrix.sum(axis=0)
+
+        # Normalisasi kolom kriteria: sum_i corr[i, j] * w_i + sum_a alt[a, j]
+        col_sums = np.einsum('ij,ki->kj', self.holland_correlation, w) + alt_col_sums
+        col_sums = np.where(col_sums > 0, col_sums, 1.0)
+
+        A = self.holland_correlation[None, :, :] * w[:, :, None] / col_sums[:, None, :]
+        w_total = w.sum(axis=1, keepdims=True)
+        b = w / np.where(w_total > 0, w_total, 1.0)
+        K = A + b[:, :, None] * (alt_col_sums / col_sums)[:, None, :]
+
+        x_c, iterations, residual = self.stationary_vector_batch(K, tol=tol)
+
+        # Dijumlahkan per kriteria (bukan matmul BLAS) agar urutan penjumlahan
+        # tetap sama berapa pun jumlah siswa dalam batch.
+        y = x_c / col_sums
+        final = np.zeros((w.shape[0], alt_matrix.shape[0]))
+        for j in range(alt_matrix.shape[1]):
+            final += y[:, j:j+1] * alt_matrix[None, :, j]
+        totals = final.sum(axis=1, keepdims=True)
+        uniform = np.full_like(final, 1 / final.shape[1])
+        final = np.where(totals > 0, final / np.where(totals > 0, totals, 1.0), uniform)
+        return final, iterations, residual
+
+    def calculate_anp_scores_batch(self, scores_matrix, filtered_majors=None, profiles=None):
+        """
+        Hitung skor ANP untuk banyak siswa dalam satu panggilan.
+
+        Pekerjaan yang tidak bergantung pada siswa (data jurusan dan prioritas
+        alternatif) dilakukan sekali; bagian per siswa (pairwise kriteria,
+        eigenvector, limit supermatrix) dihitung sebagai operasi NumPy bertumpuk.
+
+        Args:
+            scores_matrix: array (n_students, 6) dengan urutan kolom `riasec_types`
+            filtered_majors: daftar nama jurusan (opsional)
+            profiles: daftar dict skor asli per siswa untuk `student_riasec_profile`
+
+        Returns:
+            list hasil per siswa dengan format yang sama seperti `calculate_anp_scores`
+        """
+        scores = np.asarray(scores_matrix, dtype=float).reshape(-1, len(self.riasec_types))
+        if scores.shape[0] == 0:
+            return []
+
+        major_map = self._select_majors(filtered_majors)
+
+        # 1. Kriteria (bertumpuk: k x 6 x 6)
+        crit_pw = self._pairwise_from_scores(np.maximum(scores, 1e-4))
+        crit_weights, lambda_max = self.calculate_priority_batch(crit_pw)
+
+        # 2. Alternatif (sekali untuk semua siswa, dari cache)
         alt_priorities, alternative_names = self.compute_alternative_priorities(major_map)
+        alt_matrix = np.column_stack([alt_priorities[c] for c in self.riasec_types])
 
-        # 3. Supermatrix
-        S = self.build_supermatrix(crit_weights, alt_priorities)
-        L = self.limit_supermatrix(S)
+        # 3. Limit supermatrix (struktur blok)
+        tol = 1e-12
+        final, iterations, residual = self.limit_alternative_priorities(crit_weights, alt_matrix, tol=tol)
 
-        # 4. Extract Results
+        # 4. Ranking (stabil, sama seperti sorted(..., reverse=True))
+        order = np.argsort(-final, axis=1, kind='stable')
         n_c = len(self.riasec_types)
-        final_priorities = L[n_c:, 0]
-        total = np.sum(final_priorities)
-        if total > 0:
-            final_priorities /= total
-        else:
-            final_priorities = np.full_like(final_priorities, 1 / len(alternative_names))
-
-        major_results = {}
-        for i, major in enumerate(alternative_names):
-            major_results[major] = {
-                'anp_score': float(final_priorities[i]),
-                'riasec_profile': major_map[major]
-            }
+        inner_dependency = self.holland_correlation.tolist()
 
-        ranked = sorted(major_results.items(), key=lambda x: x[1]['anp_score'], reverse=True)
-        top_5 = [{'major_name': m, **d} for m, d in ranked[:5]]
-
-        return {
-            'ranked_majors': ranked,
-            'top_5_majors': top_5,
-            'total_analyzed': len(ranked),
-            'student_riasec_profile': riasec_scores,
-            'methodology': 'Pure ANP (No Cosine Similarity)',
-            'calculation_details': {
-                'criteria_priorities': {self.riasec_types[i]: float(crit_weights[i]) for i in range(n_c)},
-                'consistency_ratio': cr,
-                'is_consistent': is_consistent,
-                'converged': True,
-                'iterations': 100,
-                'supermatrix_size': n_c + len(alternative_names),
-                'inner_dependency_matrix': self.holland_correlation.tolist()
+        results = []
+        for k in range(scores.shape[0]):
+            _, cr, is_consistent = self.compute_consistency_ratio(float(lambda_max[k]), n_c)
+            ranked = [
+                (alternative_names[i], {
+                    'anp_score': float(final[k, i]),
+                    'riasec_profile': major_map[alternative_names[i]]
+                })
+                for i in order[k]
+            ]
+            top_5 = [{'major_name': m, **d} for m, d in ranked[:5]]
+            profile = profiles[k] if profiles is not None else {
+                c: float(scores[k, j]) for j, c in enumerate(self.riasec_types)
             }
-        }
+
+            results.append({
+                'ranked_majors': ranked,
+                'top_5_majors': top_5,
+                'total_analyzed': len(ranked),
+                'student_riasec_profile': profile,
+                'methodology': 'Pure ANP (No Cosine Similarity)',
+                'calculation_details': {
+                    'criteria_priorities': {self.riasec_types[i]: float(crit_weights[k, i]) for i in range(n_c)},
+                    'consistency_ratio': cr,
+                    'is_consistent': is_consistent,
+                    'converged': bool(residual[k] < tol),
+                    'iterations': int(iterations[k]),
+                    'residual': float(residual[k]),
+                    'supermatrix_size': n_c + len(alternative_names),
+                    'inner_dependency_matrix': inner_dependency
+                }
+            })
+        return results
+
+    def calculate_anp_scores(self, riasec_scores, filtered_majors=None):
+        """
+        Hitung skor ANP menggunakan Pure Methodology.
+
+        Memakai jalur yang sama dengan `calculate_anp_scores_batch` (satu siswa),
+        sehingga hasil tunggal dan batch selalu identik.
+        """
+        row = [float(riasec_scores.get(c, 0)) for c in self.riasec_types]
+        return self.calculate_anp_scores_batch([row], filtered_majors, profiles=[riasec_scores])[0]
 
 # Wrapper utilitas
 def calculate_prefiltered_anp(riasec_scores, top_n=None, min_similarity=None):
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+
+# Naikkan jika cara menghitung prioritas alternatif berubah,
+# agar file cache lama tidak dipakai lagi.
+CACHE_VERSION = 2
+CACHE_DIR_NAME = "anp_cache"
+MAX_MEMORY_ENTRIES = 4
+
+_memory_cache = {}
+_lock = threading.Lock()
+
+
+def majors_fingerprint(major_map, criteria):
+    """Hash isi tabel majors (urutan, nama, dan profil RIASEC) beserta versi cache"""
+    payload = [
+        [name, [float(profile[c]) for c in criteria]]
+        for name, profile in major_map.items()
+    ]
+    raw = json.dumps([CACHE_VERSION, list(criteria), payload], separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def cache_dir(db_path):
+    """Folder cache di samping file database"""
+    return os.path.join(os.path.dirname(os.path.abspath(db_path)), CACHE_DIR_NAME)
+
+
+def _cache_file(db_path, fingerprint):
+    return os.path.join(cache_dir(db_path), f"alt_{fingerprint}.npz")
+
+
+def load_alternative_priorities(db_path, fingerprint, criteria):
+    """Ambil prioritas alternatif dari cache memori, lalu dari file .npz"""
+    key = (os.path.abspath(db_path), fingerprint)
+    with _lock:
+        cached = _memory_cache.get(key)
+    if cached is not None:
+        return cached
+
+    path = _cache_file(db_path, fingerprint)
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            names = [str(n) for n in data["names"]]
+            priorities = {c: data[c].copy() for c in criteria}
+    except Exception as e:
+        print(f"Warning: Cache prioritas alternatif rusak, dihitung ulang - {e}")
+        return None
+
+    entry = (priorities, names)
+    _remember(key, entry)
+    return entry
+
+
+def store_alternative_priorities(db_path, fingerprint, priorities, names):
+    """Simpan prioritas alternatif ke memori dan ke file .npz (atomik)"""
+    key = (os.path.abspath(db_path), fingerprint)
+    entry = (priorities, list(names))
+    _remember(key, entry)
+
+    directory = cache_dir(db_path)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".npz")
+        with os.fdopen(fd, "wb") as fh:
+            np.savez(fh, names=np.array(entry[1], dtype=str), **priorities)
+        os.replace(tmp_path, _cache_file(db_path, fingerprint))
+    except OSError as e:
+        print(f"Warning: Gagal menyimpan cache prioritas alternatif - {e}")
+
+
+def invalidate_alternative_priorities(db_path="exam_system.db"):
+    """Hapus seluruh cache prioritas alternatif (dipanggil setelah tabel majors berubah)"""
+    with _lock:
+        _memory_cache.clear()
+
+    directory = cache_dir(db_path)
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.startswith("alt_") and name.endswith(".npz"):
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+def _remember(key, entry):
+    with _lock:
+        _memory_cache.pop(key, None)
+        _memory_cache[key] = entry
+        while len(_memory_cache) > MAX_MEMORY_ENTRIES:
+            _memory_cache.pop(next(iter(_memory_cache)))
@@ -1,20 +1,26 @@
+import math
+import multiprocessing
+import os
 import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
 import bcrypt
 from database.db_manager import DatabaseManager
 
+# Cost bcrypt untuk password biasa dan untuk akun hasil import CSV massal
+BCRYPT_ROUNDS = int(os.environ.get("HOLLAND_BCRYPT_ROUNDS", "12"))
+IMPORT_BCRYPT_ROUNDS = int(os.environ.get("HOLLAND_IMPORT_BCRYPT_ROUNDS", str(BCRYPT_ROUNDS)))
+
 def authenticate_user(username, password):
     """Autentikasi user berdasarkan username dan password"""
     db_manager = DatabaseManager()
-    conn = db_manager.get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT id, username, password, role, full_name, class_name
-        FROM users WHERE username = ?
-    ''', (username,))
-    
-    user = cursor.fetchone()
-    conn.close()
+    with db_manager.connection() as conn:
+        user = conn.execute('''
+            SELECT id, username, password, role, full_name, class_name
+            FROM users WHERE username = ?
+        ''', (username,)).fetchone()
     
     if user:
         stored_password = user[2]
@@ -24,11 +30,55 @@ def authenticate_user(username, password):
             return user
     return None
 
-def hash_password(password):
+def hash_password(password, rounds=None):
     """Hash password menggunakan bcrypt"""
-    hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds or BCRYPT_ROUNDS))
     return hashed.decode('utf-8')
 
+def _hash_password_chunk(args):
+    passwords, rounds = args
+    hashes = []
+    for p in passwords:
+        try:
+            hashes.append(hash_password(p, rounds))
+        except ValueError:
+            # Ditolak bcrypt (mis. lebih dari 72 byte)
+            hashes.append(None)
+    return hashes
+
+def hash_passwords(passwords, rounds=None, workers=None):
+    """
+    Hash banyak password sekaligus, dibagi ke beberapa proses.
+
+    Returns:
+        (hashes, hashes_per_second) — urutan hash sama dengan input;
+        None untuk password yang ditolak bcrypt
+    """
+    passwords = list(passwords)
+    if not passwords:
+        return [], 0.0
+
+    rounds = rounds or IMPORT_BCRYPT_ROUNDS
+    workers = max(1, workers or os.cpu_count() or 1)
+    started = time.perf_counter()
+
+    hashes = None
+    if workers > 1 and len(passwords) >= 2 * workers:
+        size = math.ceil(len(passwords) / (workers * 4))
+        chunks = [(passwords[i:i + size], rounds) for i in range(0, len(passwords), size)]
+        try:
+            # spawn, bukan fork: fork dari server Streamlit yang multithread bisa deadlock
+            with ProcessPoolExecutor(max_workers=workers,
+                                     mp_context=multiprocessing.get_context("spawn")) as pool:
+                hashes = [h for part in pool.map(_hash_password_chunk, chunks) for h in part]
+        except (OSError, BrokenProcessPool) as e:
+            print(f"Warning: Hash paralel gagal, lanjut serial - {e}")
+    if hashes is None:
+        hashes = _hash_password_chunk((passwords, rounds))
+
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    return hashes, len(passwords) / elapsed
+
 def check_login():
     """Cek apakah user sudah login"""
     import streamlit as st
@@ -1,11 +1,35 @@
 import json
 import numpy as np
 from database.db_manager import DatabaseManager
+from database.exame_system import RESULT_SCORE_COLUMNS, RESULT_TOP_TYPE_COLUMNS, RIASEC_TYPES
+from services.result_store import (
+    compact_result_payload,
+    extract_rankings,
+    model_snapshot,
+    normalized_result_columns,
+    register_model_versions,
+    replace_rankings,
+)
 from .anp import ANPProcessor
 from datetime import datetime, timedelta, timezone
 
 WITA = timezone(timedelta(hours=8))
-now_wita = datetime.now(WITA)
+
+# Kolom jumlah jawaban per tipe di student_riasec_totals (dijaga oleh trigger)
+RIASEC_SUM_COLUMNS = ', '.join(f"{t.lower()}_sum" for t in RIASEC_TYPES)
+
+# Kolom test_results: JSON (tampilan detail) + kolom ter-normalisasi untuk query SQL
+RESULT_COLUMNS = (
+    'student_id', 'top_3_types', 'recommended_major',
+    'holland_scores', 'anp_results', 'total_items', 'completed_at',
+) + RESULT_SCORE_COLUMNS + RESULT_TOP_TYPE_COLUMNS + ('holland_code',)
+
+UPSERT_TEST_RESULT_SQL = f'''
+    INSERT INTO test_results ({', '.join(RESULT_COLUMNS)})
+    VALUES ({', '.join(['?'] * len(RESULT_COLUMNS))})
+    ON CONFLICT(student_id) DO UPDATE SET
+        {', '.join(f"{col} = excluded.{col}" for col in RESULT_COLUMNS[1:])}
+'''
 
 
 class HollandCalculator:
@@ -30,23 +54,14 @@ class HollandCalculator:
     def calculate_holland_scores(self, student_id):
         """Hitung skor RIASEC siswa berdasarkan jawaban dari database"""
         db_manager = DatabaseManager()
-        conn = db_manager.get_connection()
-        cursor = conn.cursor()
-
-        cursor.execute('''
-            SELECT q.holland_type, sa.answer
-            FROM student_answers sa
-            JOIN questions q ON sa.question_id = q.id
-            WHERE sa.student_id = ?
-        ''', (student_id,))
+        with db_manager.connection() as conn:
+            row = conn.execute(
+                f"SELECT {RIASEC_SUM_COLUMNS} FROM student_riasec_totals WHERE student_id = ?",
+                (student_id,)
+            ).fetchone()
 
-        answers = cursor.fetchall()
-        conn.close()
-
-        # Inisialisasi skor
-        scores = {h: 0 for h in self.holland_types}
-        for holland_type, answer in answers:
-            scores[holland_type] += answer
+        # Jumlah per tipe dari tabel agregat (satu baris per siswa)
+        scores = dict(zip(RIASEC_TYPES, row or [0] * len(RIASEC_TYPES)))
 
         # Normalisasi ke rentang 0–1
         max_score = max(scores.values()) if max(scores.values()) > 0 else 1
@@ -54,6 +69,31 @@ class HollandCalculator:
 
         return normalized_scores
 
+    def calculate_holland_scores_batch(self, student_ids, chunk_size=500):
+        """Hitung skor RIASEC banyak siswa sekaligus (satu query per potongan ID)"""
+        student_ids = list(student_ids)
+        sums = {sid: {h: 0 for h in self.holland_types} for sid in student_ids}
+
+        db_manager = DatabaseManager()
+        with db_manager.connection() as conn:
+            cursor = conn.cursor()
+            for start in range(0, len(student_ids), chunk_size):
+                chunk = student_ids[start:start + chunk_size]
+                placeholders = ', '.join(['?'] * len(chunk))
+                cursor.execute(f'''
+                    SELECT student_id, {RIASEC_SUM_COLUMNS}
+                    FROM student_riasec_totals
+                    WHERE student_id IN ({placeholders})
+                ''', chunk)
+                for student_id, *totals in cursor.fetchall():
+                    sums[student_id] = dict(zip(RIASEC_TYPES, totals))
+
+        normalized = {}
+        for sid, scores in sums.items():
+            max_score = max(scores.values()) if max(scores.values()) > 0 else 1
+            normalized[sid] = {k: round(v / max_score, 3) for k, v in scores.items()}
+        return normalized
+
     # ---------------------------------
     # 2️⃣ Identifikasi Holland Code
     # ---------------------------------
@@ -103,8 +143,17 @@ class HollandCalculator:
         anp = ANPProcessor()
         # Menggunakan calculate_anp_scores (Pure ANP)
         anp_results = anp.calculate_anp_scores(scores)
+        return self._decorate_anp_results(anp_results)
+
+    def run_anp_logic_batch(self, scores_list):
+        """Menjalankan Pure ANP untuk banyak siswa dalam satu panggilan batch."""
+        anp = ANPProcessor()
+        rows = [[float(s.get(h, 0)) for h in anp.riasec_types] for s in scores_list]
+        batch_results = anp.calculate_anp_scores_batch(rows, profiles=scores_list)
+        return [self._decorate_anp_results(r) for r in batch_results]
 
-        # Tambahkan similarity dummy agar UI tidak error
+    def _decorate_anp_results(self, anp_results):
+        """Tambahkan similarity dummy agar UI tidak error"""
         for major, data in anp_results['ranked_majors']:
             data['similarity'] = 1.0
 
@@ -117,41 +166,55 @@ class HollandCalculator:
     # ---------------------------------
     # 5️⃣ Simpan hasil ke database
     # ---------------------------------
-    def save_test_result(self, student_id, scores, holland_code, top_3_types, 
-                        recommended_major, anp_results=None, holland_filter=None,
-                        total_items=None):
-        """Simpan hasil tes siswa ke tabel test_results"""
-        db_manager = DatabaseManager()
-        conn = db_manager.get_connection()
-        cursor = conn.cursor()
+    def build_result_record(self, student_id, scores, holland_code, top_3_types,
+                            recommended_major, anp_results=None, holland_filter=None,
+                            total_items=None, model=None):
+        """
+        Susun satu baris test_results beserta peringkat jurusannya
+        (tanpa menyimpan ke database).
 
-        # Hapus data lama
-        cursor.execute('DELETE FROM test_results WHERE student_id = ?', (student_id,))
+        anp_results disimpan dalam format ringkas: ranking ke result_rankings,
+        profil jurusan & matriks konstan ke model_versions (`model`, dihitung
+        dari anp_results bila tidak diberikan). holland_filter tidak disimpan
+        karena dapat dibangun ulang dari model.
 
-        # Gabungkan hasil Holland dan ANP
-        combined_results = {
-            'holland_code': holland_code,
-            'holland_filter': holland_filter,
-            'anp_results': anp_results
-        }
+        Returns:
+            (row, rankings, model) — row sesuai RESULT_COLUMNS, rankings berisi
+            (rank, jurusan, skor ANP), model berisi snapshot model_versions
+        """
+        if model is None:
+            model = model_snapshot(anp_results)
 
-        cursor.execute('''
-            INSERT INTO test_results (
-                student_id, top_3_types, recommended_major,
-                holland_scores, anp_results, total_items, completed_at
-            ) VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (
+        row = (
             student_id,
             json.dumps(top_3_types),
             recommended_major if recommended_major else "Tidak ada rekomendasi",
             json.dumps(scores),
-            json.dumps(combined_results),
+            json.dumps(compact_result_payload(holland_code, anp_results, model)),
             total_items,
-            now_wita.strftime('%Y-%m-%d %H:%M:%S')
-        ))
+            datetime.now(WITA).strftime('%Y-%m-%d %H:%M:%S')
+        ) + normalized_result_columns(scores, top_3_types, holland_code)
+        return row, extract_rankings(anp_results), model
 
-        conn.commit()
-        conn.close()
+    def save_test_results_bulk(self, records):
+        """Upsert banyak baris test_results, peringkat dan snapshot model dalam satu transaksi (executemany)"""
+        if not records:
+            return
+        db_manager = DatabaseManager()
+        with db_manager.connection() as conn:
+            register_model_versions(conn, [model for _, _, model in records])
+            conn.executemany(UPSERT_TEST_RESULT_SQL, [row for row, _, _ in records])
+            replace_rankings(conn, {row[0]: rankings for row, rankings, _ in records})
+
+    def save_test_result(self, student_id, scores, holland_code, top_3_types, 
+                        recommended_major, anp_results=None, holland_filter=None,
+                        total_items=None):
+        """Simpan hasil tes siswa ke tabel test_results"""
+        record = self.build_result_record(
+            student_id, scores, holland_code, top_3_types,
+            recommended_major, anp_results, holland_filter, total_items
+        )
+        self.save_test_results_bulk([record])
 
     # ---------------------------------
     # 6️⃣ PROSES UTAMA (FINAL & BERSIH)
@@ -201,4 +264,76 @@ class HollandCalculator:
             'recommended_major': recommended_major,
             'holland_filter': holland_filter,
             'anp_results': anp_results
-        }
\ No newline at end of file
+        }
+
+    def compute_test_completion_batch(self, student_ids, total_items=None):
+        """
+        Hitung hasil banyak siswa tanpa menyimpan.
+
+        Skor Holland diambil dengan query per potongan ID dan ANP dihitung
+        sekali untuk seluruh siswa; hasil tiap siswa identik dengan jalur tunggal.
+
+        Args:
+            student_ids: daftar ID siswa
+            total_items: None, angka, atau dict {student_id: total_items}
+
+        Returns:
+            (results, records) — hasil per siswa dan baris siap-upsert untuk test_results
+        """
+        student_ids = list(student_ids)
+        if not student_ids:
+            return [], []
+
+        scores_by_student = self.calculate_holland_scores_batch(student_ids)
+        scores_list = [scores_by_student[sid] for sid in student_ids]
+        metadata = self.get_all_majors_metadata()
+
+        try:
+            anp_list = self.run_anp_logic_batch(scores_list)
+        except Exception as e:
+            print(f"Error ANP: {e}")
+            anp_list = [None] * len(student_ids)
+
+        # Semua siswa dalam satu batch memakai data jurusan yang sama
+        model = model_snapshot(next((a for a in anp_list if a), None))
+
+        results = []
+        records = []
+        for sid, scores, anp_results in zip(student_ids, scores_list, anp_list):
+            holland_code, top_3_types = self.get_holland_code(scores)
+
+            recommended_major = "Tidak ada rekomendasi"
+            if anp_results and anp_results['ranked_majors']:
+                recommended_major = anp_results['ranked_majors'][0][0]
+            elif metadata['filtered_majors']:
+                recommended_major = metadata['filtered_majors'][0]
+
+            items = total_items.get(sid) if isinstance(total_items, dict) else total_items
+            records.append(self.build_result_record(
+                sid,
+                scores,
+                holland_code,
+                top_3_types,
+                recommended_major,
+                anp_results,
+                metadata,
+                items,
+                model if anp_results else None
+            ))
+
+            results.append({
+                'student_id': sid,
+                'scores': scores,
+                'holland_code': holland_code,
+                'top_3_types': top_3_types,
+                'recommended_major': recommended_major,
+                'holland_filter': metadata,
+                'anp_results': anp_results
+            })
+        return results, records
+
+    def process_test_completion_batch(self, student_ids, total_items=None):
+        """Versi batch dari `process_test_completion`: hitung lalu upsert sekaligus."""
+        results, records = self.compute_test_completion_batch(student_ids, total_items)
+        self.save_test_results_bulk(records)
+        return results